@@ -22,38 +22,34 @@ class interface(dict):
     def __hash__(self):
         return hash(self.__getitem__("dev"))
 
-class InterfaceInode(Inode):
-    def __init__(self,rt_dict,parent):
-        Inode.__init__(self,rt_dict["dev"],parent,qtype=py9p.DMDIR)
-        self.interface = rt_dict
-        self.child_map = {
-            "addresses":    AdressesInode,
-            "flags":        FlagsInode,
-            "mtu":          MtuInode,
-            "hwaddr":       HwAddressInode,
-        }
-
 class MtuInode(Inode):
-    def sync(self):
+    __slots__ = ()
+
+    def refresh(self):
         self.data.seek(0,os.SEEK_SET)
         self.data.truncate()
         self.data.write(str(self.parent.interface['mtu']))
 
 class FlagsInode(Inode):
-    def sync(self):
+    __slots__ = ()
+
+    def refresh(self):
         self.data.seek(0,os.SEEK_SET)
         self.data.truncate()
         self.data.write(",".join(self.parent.interface['flags']))
 
 class HwAddressInode(Inode):
-    def sync(self):
+    __slots__ = ()
+
+    def refresh(self):
         self.data.seek(0,os.SEEK_SET)
         self.data.truncate()
         self.data.write(self.parent.interface['hwaddr'])
 
 class AdressesInode(Inode):
+    __slots__ = ("addresses",)
 
-    def sync(self):
+    def refresh(self):
         s = ""
         self.addresses = [ "%s/%s" % (x['address'],x['mask']) for x in self.parent.interface['addresses'].values() ]
         for x in self.addresses:
@@ -75,3 +71,15 @@ class AdressesInode(Inode):
         except Exception,e:
             print e
 
+class InterfaceInode(Inode):
+    __slots__ = ("interface",)
+    child_map = {
+        "addresses":    AdressesInode,
+        "flags":        FlagsInode,
+        "mtu":          MtuInode,
+        "hwaddr":       HwAddressInode,
+    }
+
+    def __init__(self,rt_dict,parent):
+        Inode.__init__(self,rt_dict["dev"],parent,qtype=py9p.DMDIR)
+        self.interface = rt_dict
@@ -3,6 +3,13 @@
 from __future__ import print_function
 from cxnet.netlink.iproute2 import iproute2
 from ip_interface import interface
+from nlroute import nl_route_table
+from nlneigh import nl_neigh_table
+
+# longest prefix match index of the routes, see utils/nlroute.py
+routes = nl_route_table()
+# neighbours by (ifindex, address) and by lladdr, see utils/nlneigh.py
+neighs = nl_neigh_table()
 
 @vars
 class sync_map:
@@ -39,22 +46,34 @@ class sync_map:
 
     @vars
     class neigh:
-        def add(*argv):
-            pass
-        def remove(*argv):
-            pass
+        def add(event,ifaces):
+            neighs.add(event)
+        def remove(event,ifaces):
+            neighs.remove(event)
 
     @vars
     class route:
-        def add(*argv):
-            pass
-        def remove(*argv):
-            pass
+        def add(event,ifaces):
+            routes.add(event)
+        def remove(event,ifaces):
+            routes.remove(event)
+
+def touch(storage,event,ifaces):
+    """
+    Bump the generations of the inodes, that show the event data
+    """
+    if event['type'] == 'link':
+        storage.touch("/interfaces")
+        storage.touch("/interfaces/%s" % (event['dev']),True)
+    elif event['type'] == 'address' and ifaces.has_key(event['index']):
+        storage.touch("/interfaces/%s/addresses" % (ifaces[event['index']]['dev']))
 
-def sync(ifaces,blocking=False):
+def sync(ifaces,blocking=False,storage=None):
     while True:
         events = iproute2.get(0,blocking)
         if len(events) == 0:
             break
         for event in events:
             sync_map[event['type']][event['action']](event,ifaces)
+            if storage is not None:
+                touch(storage,event,ifaces)
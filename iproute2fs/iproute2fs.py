@@ -8,6 +8,7 @@ import os
 from threading import Thread
 
 from vfs import Inode, Storage, v9fs
+from v9inode import v9server
 from ip_interface import interface, InterfaceInode
 from ip_playback import sync
 
@@ -15,27 +16,32 @@ from cStringIO import StringIO
 
 from cxnet.netlink.iproute2 import iproute2
 
-class RootDir(Inode):
-    def __init__(self,storage):
-        Inode.__init__(self,"/",self,qtype=py9p.DMDIR,storage=storage)
-        self.storage = storage
-        self.child_map = {
-            "interfaces":   InterfacesDir,
-        }
-
-
 class InterfacesDir(Inode):
+    __slots__ = ("ifaces","subst_map")
+    child_map = {
+        "*":   InterfaceInode,
+    }
+
     def __init__(self,name,parent):
         Inode.__init__(self,name,parent,qtype=py9p.DMDIR)
         self.ifaces = {}
-        self.child_map = {
-            "*":   InterfaceInode,
-        }
+        self.subst_map = {}
 
 
     def sync_children(self):
         return [ x['dev'] for x in self.ifaces.values() if x.has_key('dev') ]
 
+
+class RootDir(Inode):
+    __slots__ = ()
+    child_map = {
+        "interfaces":   InterfacesDir,
+    }
+
+    def __init__(self,storage):
+        Inode.__init__(self,"/",self,qtype=py9p.DMDIR,storage=storage)
+        self.storage = storage
+
 if __name__ == "__main__" :
 
     try:
@@ -59,7 +65,7 @@ if __name__ == "__main__" :
 
     print("%s:%s, debug=%s" % (address,port,dbg))
     storage = Storage(RootDir)
-    srv = py9p.Server(listen=(address, port), chatty=dbg, dotu=True)
+    srv = v9server(listen=(address, port), chatty=dbg, dotu=True)
     srv.mount(v9fs(storage))
 
     ifaces = {}
@@ -69,8 +75,9 @@ if __name__ == "__main__" :
     storage.root.sync()
     storage.root.children["interfaces"].ifaces = ifaces
     storage.root.children["interfaces"].subst_map = ifaces['by-name']
+    storage.touch("/interfaces")
 
-    s = Thread(target=sync,name="sync thread",args=(ifaces,True))
+    s = Thread(target=sync,name="sync thread",args=(ifaces,True,storage))
     s.daemon = True
     s.start()
 
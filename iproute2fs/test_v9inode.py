@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+v9inode listing tests; py9p must be importable:
+
+    $ python test_v9inode.py
+"""
+
+import unittest
+import itertools
+
+import py9p
+import marshal9p
+from v9inode import Inode, read_dir
+
+paths = itertools.count(1)
+
+
+class TestInode(Inode):
+    __slots__ = ()
+    length = 0
+
+    def alloc(self):
+        return (paths.next(),0)
+
+    def sync(self):
+        pass
+
+    def add(self,name,qtype=0):
+        self.children[name] = TestInode(name,self,qtype)
+        # as Storage.invalidate() does
+        self.packed_dir = None
+        self.changed()
+        return self.children[name]
+
+
+class Request(object):
+    pass
+
+
+class ListingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.marshal = marshal9p.Marshal9P(dotu=1)
+        self.root = TestInode("/",None,py9p.DMDIR)
+        # names of different lengths, so are the entries
+        for i in range(50):
+            self.root.add("file" + "x" * (i % 7) + str(i))
+        self.root.add("dir",py9p.DMDIR)
+        self.fid = Request()
+
+    def read(self,offset,count):
+        req = Request()
+        req.fid = self.fid
+        req.sock = Request()
+        req.sock.marshal = self.marshal
+        req.ifcall = Request()
+        req.ifcall.offset = offset
+        req.ifcall.count = count
+        req.ofcall = Request()
+        read_dir(self.root,req)
+        return req.ofcall.data
+
+    def listing(self,count):
+        ret = []
+        offset = 0
+        while True:
+            data = self.read(offset,count)
+            if not data:
+                return ret
+            self.assertTrue(len(data) <= count)
+            ret.append(data)
+            offset += len(data)
+
+    def names(self,data):
+        self.marshal.setBuf(data)
+        f = Request()
+        self.marshal.decstat(f,0)
+        return sorted([ x.name for x in f.stat ])
+
+    def test_offsets(self):
+        (entries,offsets) = self.root.pack_children(self.marshal)
+        self.assertEqual(len(offsets),52)
+        self.assertEqual((offsets[0],offsets[-1]),(0,len(entries)))
+        # the entries are the same, as py9p gives
+        self.assertEqual(entries,"".join([ "".join(y.todata(self.marshal))
+            for (x,y) in self.root.children.items() if x not in (".","..") ]))
+        self.assertEqual(self.names(entries),sorted([ x for x in self.root.children.keys()
+                                                        if x not in (".","..") ]))
+
+    def test_read(self):
+        (entries,offsets) = self.root.pack_children(self.marshal)
+        size = max([ y - x for (x,y) in zip(offsets,offsets[1:]) ])
+        for count in (size,size + 1,3 * size - 1,8192):
+            chunks = self.listing(count)
+            self.assertEqual("".join(chunks),entries)
+            # only whole entries
+            [ self.assertTrue(len(self.names(x)) > 0) for x in chunks ]
+        # an entry does not fit
+        self.assertEqual(self.read(0,size - 1),"")
+        # beyond the end
+        self.assertEqual(self.read(len(entries),8192),"")
+
+    def test_changed(self):
+        first = self.read(0,8192)
+        self.assertTrue(self.root.packed_dir is not None)
+        self.root.add("new")
+        self.assertEqual(self.root.packed_dir,None)
+        # a listing is kept by the fid until it is read from 0
+        self.assertEqual(self.read(len(first),8192),"")
+        self.assertTrue("new" in self.names(self.read(0,8192)))
+        # a child's change drops the cached entry
+        child = self.root.children["dir"]
+        child.pack(self.marshal)
+        child.mtime = 1
+        child.changed()
+        self.assertEqual(child.packed_stat,None)
+        self.assertEqual(self.root.packed_dir,None)
+
+
+if __name__ == "__main__":
+    unittest.main()
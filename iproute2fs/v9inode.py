@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Slotted 9P inodes, shared by iproute2fs (vfs.py) and statfs
+(storage/statfs.py, that imports the module from this directory)
+
+There can be millions of inodes, so they have no instance
+dictionaries: the mode, the owner and the timestamps are in an
+inode_meta, shared by all the inodes with the same values (see
+get_meta()), and the data buffer of a file is created on the first
+access.
+
+The serialized stat entry of an inode and, for directories, the
+serialized entries of the children are cached until changed() drops
+them; v9server and read_dir() serve directory reads from them.
+"""
+import time
+import os
+import pwd
+import grp
+import py9p
+from cStringIO import StringIO
+from bisect import bisect_left, bisect_right
+from weakref import WeakValueDictionary
+from abc import ABCMeta, abstractmethod
+
+DEFAULT_DIR_MODE = 0755
+DEFAULT_FILE_MODE = 0644
+
+# children of files and names, that are not listed; shared, never changed
+NO_CHILDREN = {}
+DIR_SPECIAL_NAMES = (".","..")
+FILE_SPECIAL_NAMES = ()
+
+class inode_qid(object):
+    """
+    py9p.Qid without the instance dictionary
+    """
+    __slots__ = ("type","vers","path")
+    __init__ = py9p.Qid.__init__.im_func
+    __str__ = __repr__ = py9p.Qid.__str__.im_func
+
+
+class inode_meta(object):
+    """
+    Mode, owner and timestamps of inodes. A record is shared by all
+    the inodes with the same values, see get_meta(), so it is never
+    changed in place.
+    """
+    fields = ("mode","atime","mtime","uidnum","gidnum","muidnum","uid","gid","muid")
+    __slots__ = fields + ("__weakref__",)
+
+    def __init__(self,*values):
+        [ setattr(self,x,y) for (x,y) in zip(self.fields,values) ]
+
+    def values(self):
+        return tuple([ getattr(self,x) for x in self.fields ])
+
+
+# the owner is resolved once, not for every inode
+uidnum = os.getuid()
+gidnum = os.getgid()
+default_meta = inode_meta(0,0,0,uidnum,gidnum,uidnum,
+                          pwd.getpwuid(uidnum).pw_name,
+                          grp.getgrgid(gidnum).gr_name,
+                          pwd.getpwuid(uidnum).pw_name)
+metas = WeakValueDictionary()   # values -> inode_meta
+
+def get_meta(meta=None,**fields):
+    """
+    Get the shared inode_meta with the values of meta (or the
+    defaults) and the fields replaced
+    """
+    values = (meta or default_meta).values()
+    if fields:
+        values = tuple([ fields.get(x,y) for (x,y) in zip(inode_meta.fields,values) ])
+    ret = metas.get(values)
+    if ret is None:
+        ret = metas[values] = inode_meta(*values)
+    return ret
+
+def meta_property(name):
+    """
+    An inode attribute, kept in the shared inode_meta
+    """
+    def get(self):
+        return getattr(self.meta,name)
+    def set(self,value):
+        self.meta = get_meta(self.meta,**{name: value})
+    return property(get,set)
+
+
+class Inode(object):
+    """
+    Base inode, a py9p.Dir with __slots__. Subclasses must define
+    __slots__ too, and alloc(), that gives the qid path and version.
+    """
+    __metaclass__ = ABCMeta
+
+    __slots__ = ("parent","name","qid","meta","buf","children",
+                 "special_names","writelock","packed_stat","packed_dir")
+
+    # py9p.Dir attributes, the same for all the inodes
+    dotu = True
+    type = 0
+    dev = 0
+    extension = ""
+    todata = py9p.Dir.todata.im_func
+    tolstr = py9p.Dir.tolstr.im_func
+
+    mode = meta_property("mode")
+    atime = meta_property("atime")
+    mtime = meta_property("mtime")
+    uidnum = meta_property("uidnum")
+    gidnum = meta_property("gidnum")
+    muidnum = meta_property("muidnum")
+    uid = meta_property("uid")
+    gid = meta_property("gid")
+    muid = meta_property("muid")
+
+    # the permissions of new inodes
+    dir_mode = DEFAULT_DIR_MODE
+    file_mode = DEFAULT_FILE_MODE
+
+    def __init__(self,name,parent,qtype=0):
+        self.parent = parent
+        self.name = name
+        #
+        # DMDIR = 0x80000000
+        # QTDIR = 0x80
+        #
+        (path,vers) = self.alloc()
+        self.qid = inode_qid((qtype >> 24) & py9p.QTDIR, vers, path)
+        now = int(time.time())
+        self.buf = None         # the data, see the data property
+        self.writelock = False
+        self.packed_stat = None # (dotu, stat entry)
+        self.packed_dir = None  # (dotu, entries, offsets of the entries)
+        if self.qid.type & py9p.QTDIR:
+            self.meta = get_meta(mode=py9p.DMDIR | self.dir_mode,atime=now,mtime=now)
+            self.children = { ".": self, "..": self.parent }
+            self.special_names = DIR_SPECIAL_NAMES
+        else:
+            self.meta = get_meta(mode=self.file_mode,atime=now,mtime=now)
+            self.children = NO_CHILDREN
+            self.special_names = FILE_SPECIAL_NAMES
+
+    @abstractmethod
+    def alloc(self):
+        """
+        Get (qid path, version) for the new inode
+        """
+
+    @property
+    def data(self):
+        if self.buf is None:
+            self.buf = StringIO()
+        return self.buf
+
+    @data.setter
+    def data(self,data):
+        self.buf = data
+
+    def changed(self):
+        """
+        Drop the cached stat entry, here and in the parent's listing
+        """
+        self.packed_stat = None
+        if self.parent is not None:
+            self.parent.packed_dir = None
+
+    def pack(self,marsh):
+        """
+        Get the serialized stat entry
+        """
+        if self.packed_stat is None or self.packed_stat[0] != marsh.dotu:
+            self.packed_stat = (marsh.dotu,"".join(self.todata(marsh)))
+        return self.packed_stat[1]
+
+    def pack_children(self,marsh):
+        """
+        Get (entries, offsets) of a directory: the serialized stat
+        entries of the children and the offsets of the entries, with
+        the length of the data at the end
+        """
+        if self.packed_dir is None or self.packed_dir[0] != marsh.dotu:
+            entries = [ y.pack(marsh) for (x,y) in self.children.items()
+                            if x not in self.special_names ]
+            offsets = [0]
+            [ offsets.append(offsets[-1] + len(x)) for x in entries ]
+            self.packed_dir = (marsh.dotu,"".join(entries),offsets)
+        return self.packed_dir[1:]
+
+
+def read_dir(f,req):
+    """
+    Set the reply data of a directory read from the listing of f
+    """
+    # a listing is taken on the first read and kept with the
+    # fid, so the next reads get the same entries and offsets
+    if req.ifcall.offset == 0 or not hasattr(req.fid,"listing"):
+        f.sync()
+        req.fid.listing = f.pack_children(req.sock.marshal)
+    (entries,offsets) = req.fid.listing
+    # whole entries, that fit into count
+    start = bisect_left(offsets,req.ifcall.offset)
+    end = bisect_right(offsets,req.ifcall.offset + req.ifcall.count) - 1
+    if end > start:
+        req.ofcall.data = entries[offsets[start]:offsets[end]]
+    else:
+        req.ofcall.data = ""
+
+
+class v9server(py9p.Server):
+    """
+    py9p server, that serves directory reads from the listings,
+    prepared by read_dir(), instead of stat lists
+    """
+    def rread(self, req, error):
+        if error:
+            return
+        if req.fid.qid.type & py9p.QTDIR:
+            req.fid.diroffset = req.ifcall.offset + len(req.ofcall.data)
@@ -14,53 +14,68 @@ import getpass
 
 from cxnet.netlink.iproute2 import iproute2
 
+import v9inode
+
 DEFAULT_DIR_MODE = 0755
 DEFAULT_FILE_MODE = 0644
 
-class Inode(py9p.Dir):
+class Inode(v9inode.Inode):
     """
-    VFS inode, based on py9p.Dir
+    VFS inode, see v9inode.Inode
+
+    sync() refreshes the inode only, if its generation has changed
+    since the last refresh; the generation is bumped with touch(),
+    when the source data changes (see ip_playback.sync()).
+    Subclasses override refresh(), not sync().
+
+    The serialized stat entry of the inode and, for directories, the
+    serialized entries of the children are cached until changed()
+    or Storage.invalidate() drop them.
     """
-    def __init__(self,name,parent,qtype=0,storage=None):
-        py9p.Dir.__init__(self,True)
+    __slots__ = ("storage","abspath","static_children","generation","synced")
+
+    dir_mode = DEFAULT_DIR_MODE
+    file_mode = DEFAULT_FILE_MODE
+
+    # classes of the children by name, "*" for any name, and the
+    # name substitutions for create(); set by subclasses
+    child_map = {}
+    subst_map = {}
 
-        self.parent = parent
+    def __init__(self,name,parent,qtype=0,storage=None):
         self.storage = storage or parent.storage
-        self.name = name
-        #
-        # DMDIR = 0x80000000
-        # QTDIR = 0x80
-        #
-        self.qid = py9p.Qid((qtype >> 24) & py9p.QTDIR, 0, py9p.hash8(self.absolute_name()))
-        self.type = 0
-        self.dev = 0
-        self.atime = self.mtime = int(time.time())
-        self.uidnum = self.muidnum = os.getuid()
-        self.gidnum = os.getgid()
-        self.uid = self.muid = pwd.getpwuid(self.uidnum).pw_name
-        self.gid = grp.getgrgid(self.gidnum).gr_name
-        self.children = {}
-        self.static_children = []
-        self.writelock = False
-        if self.qid.type & py9p.QTDIR:
-            self.mode = py9p.DMDIR | DEFAULT_DIR_MODE
-            self.children["."] = self
-            self.children[".."] = self.parent
-            self.special_names = [".",".."]
+        # the path is cached, the parent's path is already known
+        if (parent is None) or (parent is self):
+            self.abspath = name
+        elif parent.abspath == "/":
+            self.abspath = "/%s" % (name)
         else:
-            self.mode = DEFAULT_FILE_MODE
-            self.data = StringIO()
-            self.special_names = []
+            self.abspath = "%s/%s" % (parent.abspath,name)
+        v9inode.Inode.__init__(self,name,parent,qtype)
+        self.static_children = ()
+        self.generation = 0     # bumped, when the source data changes
+        self.synced = -1        # the generation of the last refresh
 
         self.storage.register(self)
-        self.child_map = {}
-        self.subst_map = {}
+
+    def alloc(self):
+        return self.storage.alloc()
 
     def absolute_name(self):
-        if (self.parent is not None) and (self.parent != self):
-            return "%s/%s" % (self.parent.absolute_name(),self.name)
+        return self.abspath
+
+    def repath(self):
+        """
+        Update cached paths of the subtree after a rename
+        """
+        if self.storage.paths.get(self.abspath) is self:
+            del self.storage.paths[self.abspath]
+        if self.parent.abspath == "/":
+            self.abspath = "/%s" % (self.name)
         else:
-            return self.name
+            self.abspath = "%s/%s" % (self.parent.abspath,self.name)
+        self.storage.paths[self.abspath] = self
+        [ y.repath() for (x,y) in self.children.items() if x not in self.special_names ]
 
     def commit(self):
         pass
@@ -70,8 +85,9 @@ class Inode(py9p.Dir):
 
     def remove(self,child):
         if child.name in self.static_children:
-            self.static_children.remove(child.name)
+            self.static_children = tuple([ x for x in self.static_children if x != child.name ])
             del self.children[child.name]
+            self.storage.invalidate(self)
 
     def create(self,name,qtype=0):
         # get additional parameters by name, if there is what to get
@@ -85,12 +101,14 @@ class Inode(py9p.Dir):
             return self.child_map["*"](name,self)
         # return default Inode class otherwise
         self.children[name] = Inode(name,self,qtype=qtype,storage=self.storage)
-        self.static_children.append(name)
+        self.static_children += (name,)
+        self.storage.invalidate(self)
         return self.children[name]
 
     def rename(self,old_name,new_name):
 
         self.sync()
+        self.storage.invalidate(self)
 
         if new_name in self.child_map.keys():
             # the target is special and exists already
@@ -99,10 +117,12 @@ class Inode(py9p.Dir):
         else:
             self.children[new_name] = self.children[old_name]
             if new_name not in self.static_children:
-                self.static_children.append(new_name)
+                self.static_children += (new_name,)
 
         del self.children[old_name]
-        self.static_children.remove(old_name)
+        if old_name not in self.static_children:
+            raise ValueError("%s is not a static child" % (old_name))
+        self.static_children = tuple([ x for x in self.static_children if x != old_name ])
 
     def wstat(self,stat):
         # change uid?
@@ -125,23 +145,48 @@ class Inode(py9p.Dir):
             # update parent
             self.parent.rename(self.name,stat.name)
             self.name = stat.name
+            if self.parent.children.get(self.name) is self:
+                self.repath()
+            else:
+                # the data went to the existing special inode
+                self.storage.unregister(self)
+        self.changed()
+
+    def touch(self,subtree=False):
+        """
+        Bump the generation, so the next sync() refreshes the inode
+        """
+        self.generation += 1
+        if subtree:
+            [ y.touch(True) for (x,y) in self.children.items() if x not in self.special_names ]
 
     def sync(self):
+        # the generation is read before the refresh: a touch() during
+        # the refresh makes the next sync() to refresh again
+        generation = self.generation
+        if self.synced != generation:
+            self.refresh()
+            self.synced = generation
+            self.changed()
+
+    def refresh(self):
         # create set of children names
         chs = set(self.children.keys())
         # create set of actual items
-        prs = set(self.sync_children() + self.static_children)
+        prs = set(self.sync_children()).union(self.static_children)
 
         # inodes to delete
         to_delete = chs - prs
         # preserve special names
         [ to_delete.remove(x) for x in self.special_names ]
+        # inodes to create
+        to_create = prs - chs
+        if to_delete or to_create:
+            self.storage.invalidate(self)
         # remove from storage
         [ self.storage.unregister(x) for x in [ self.children[y] for y in to_delete ] ]
         # remove from children
         [ self.children.__delitem__(x) for x in to_delete ]
-        # inodes to create
-        to_create = prs - chs
         # add to children
         [ self.children.__setitem__(x.name,x) for x in [ self.create(y) for y in to_create ] ]
         # add to storage
@@ -153,32 +198,122 @@ class Inode(py9p.Dir):
     def length(self):
         if self.qid.type & py9p.QTDIR:
             return len(self.children.keys()) + len(self.static_children)
+        elif self.buf is None:
+            return 0
         else:
-            self.data.seek(0,os.SEEK_END)
-            return self.data.tell()
+            self.buf.seek(0,os.SEEK_END)
+            return self.buf.tell()
 
 
 class Storage(object):
     """
     Low-level storage interface
+
+    Inodes are indexed by qid path and by absolute path. qid paths
+    are integers from a counter; the paths of removed inodes are
+    reused with the next qid version, so clients can tell a new
+    inode from the old one.
+
+    The v9fs methods look inodes up by the fid's qid, so the version
+    must match too, see checkout().
+
+    Names are looked up in the dentry cache: { parent qid path:
+    { name: inode or None } }, None is a negative entry. The entries
+    of a directory are dropped, when its children change, see
+    Inode.sync().
     """
     def __init__(self,root):
-        self.files = {}
+        self.files = {}         # qid path -> inode
+        self.paths = {}         # absolute path -> inode
+        self.qids = 0           # qid paths allocated
+        self.free = []          # (qid path, version) to reuse
+        self.dentries = {}      # parent qid path -> { name: inode or None }
         self.root = root(storage=self)
         self.cwd = self.root
         self.files[self.root.qid.path] = self.root
 
+    def alloc(self):
+        """
+        Get a new (qid path, version)
+        """
+        if self.free:
+            (path,vers) = self.free.pop()
+            return (path,(vers + 1) & 0xffffffff)
+        self.qids += 1
+        return (self.qids,0)
+
     def register(self,inode):
         self.files[inode.qid.path] = inode
+        self.paths[inode.abspath] = inode
 
     def unregister(self,inode):
+        """
+        Remove an inode with its subtree and free the qids
+        """
+        if self.files.get(inode.qid.path) is not inode:
+            return
+        [ self.unregister(y) for (x,y) in inode.children.items() if x not in inode.special_names ]
         del self.files[inode.qid.path]
+        if self.paths.get(inode.abspath) is inode:
+            del self.paths[inode.abspath]
+        # the qid path will be reused
+        self.dentries.pop(inode.qid.path,None)
+        self.dentries.pop(inode.parent.qid.path,None)
+        self.free.append((inode.qid.path,inode.qid.vers))
+
+    def lookup(self,path):
+        """
+        Get an inode by the absolute path or None
+        """
+        return self.paths.get(path)
+
+    def touch(self,path,subtree=False):
+        """
+        Bump the generation of an inode by the path, see Inode.touch()
+        """
+        inode = self.paths.get(path)
+        if inode is not None:
+            inode.touch(subtree)
+
+    def invalidate(self,inode):
+        """
+        Drop the dentries and the cached listing of a directory,
+        when the children change
+        """
+        self.dentries.pop(inode.qid.path,None)
+        inode.packed_dir = None
+        # the length of a directory is the number of children
+        inode.changed()
+
+    def walk(self,inode,names):
+        """
+        Walk the names from a directory. Returns the list of the
+        inodes found, it stops at the first missing name.
+        """
+        ret = []
+        dentries = self.dentries
+        for name in names:
+            # sync() drops the dentries, if the children change;
+            # it is a no-op, while the generation is the same
+            inode.sync()
+            d = dentries.get(inode.qid.path)
+            if d is None:
+                d = dentries[inode.qid.path] = {}
+            if d.has_key(name):
+                inode = d[name]
+            else:
+                inode = d[name] = inode.children.get(name)
+            if inode is None:
+                break
+            ret.append(inode)
+        return ret
 
     def create(self,name,mode=0,parent=None):
         if parent:
             self.cwd = parent
         new = self.cwd.create(name,mode)
-        self.files[new.qid.path] = new
+        self.register(new)
+        self.invalidate(self.cwd)
         return new.qid
 
     def chdir(self,target):
@@ -186,9 +321,20 @@ class Storage(object):
             self.cwd = self.files[target]
 
     def checkout(self,target):
-        if not self.files.has_key(target):
+        """
+        Get an inode by a qid or by a qid path. The qid paths are
+        reused, so a qid of a removed inode (of a stale fid) is not
+        found, if its version differs from the current one.
+        """
+        if hasattr(target,"path"):
+            f = self.files.get(target.path)
+            if f is not None and f.qid.vers != target.vers:
+                f = None
+        else:
+            f = self.files.get(target)
+        if f is None:
             raise py9p.ServerError("file not found")
-        return self.files[target]
+        return f
 
     def commit(self,target):
         f = self.checkout(target)
@@ -206,6 +352,7 @@ class Storage(object):
 
         f.data.seek(offset,os.SEEK_SET)
         f.data.write(data)
+        f.changed()
         return len(data)
 
     def read(self,target,size,offset=0):
@@ -217,8 +364,8 @@ class Storage(object):
 
     def remove(self,target):
         f = self.checkout(target)
-        f.remove(f)
-        del self.files[target]
+        f.parent.remove(f)
+        self.unregister(f)
 
     def wstat(self,target,stat):
 
@@ -238,14 +385,14 @@ class v9fs(py9p.Server):
 
     def create(self, srv, req):
         # get parent
-        f = self.storage.checkout(req.fid.qid.path)
+        f = self.storage.checkout(req.fid.qid)
         req.ofcall.qid = self.storage.create(req.ifcall.name, req.ifcall.perm,f)
         srv.respond(req, None)
 
     def open(self, srv, req):
         '''If we have a file tree then simply check whether the Qid matches
         anything inside. respond qid and iounit are set by protocol'''
-        f = self.storage.checkout(req.fid.qid.path)
+        f = self.storage.checkout(req.fid.qid)
         f.sync()
 
         if (req.ifcall.mode & f.mode) != py9p.OREAD :
@@ -256,56 +403,43 @@ class v9fs(py9p.Server):
     def walk(self, srv, req, fid = None):
 
         fd = fid or req.fid
-        f = self.storage.checkout(fd.qid.path)
-        f.sync()
+        f = self.storage.checkout(fd.qid)
 
-        for (i,k) in f.children.items():
-            if req.ifcall.wname[0] == i:
-                req.ofcall.wqid.append(k.qid)
-                if k.qid.type & py9p.QTDIR:
-                    self.storage.chdir(k.qid.path)
-                if len(req.ifcall.wname) > 1:
-                    req.ifcall.wname.pop(0)
-                    self.walk(srv,req,k)
-                else:
-                    srv.respond(req, None)
-                return
-
-        srv.respond(req, "file not found")
-        return
+        # all the names in one pass; a partial walk is not an error
+        req.ofcall.wqid = [ x.qid for x in self.storage.walk(f,req.ifcall.wname) ]
+        if req.ofcall.wqid:
+            srv.respond(req, None)
+        else:
+            srv.respond(req, "file not found")
 
     def wstat(self, srv, req):
 
-        f = self.storage.checkout(req.fid.qid.path)
+        f = self.storage.checkout(req.fid.qid)
         s = req.ifcall.stat[0]
-        self.storage.wstat(req.fid.qid.path,s)
+        self.storage.wstat(req.fid.qid,s)
         srv.respond(req,None)
 
     def stat(self, srv, req):
-        f = self.storage.checkout(req.fid.qid.path)
+        f = self.storage.checkout(req.fid.qid)
         f.sync()
         req.ofcall.stat.append(f)
         srv.respond(req, None)
 
     def write(self, srv, req):
-        f = self.storage.checkout(req.fid.qid.path)
-        req.ofcall.count = self.storage.write(req.fid.qid.path,req.ifcall.data,req.ifcall.offset)
+        f = self.storage.checkout(req.fid.qid)
+        req.ofcall.count = self.storage.write(req.fid.qid,req.ifcall.data,req.ifcall.offset)
         srv.respond(req, None)
 
     def clunk(self, srv, req):
-        self.storage.commit(req.fid.qid.path)
+        self.storage.commit(req.fid.qid)
         srv.respond(req, None)
 
     def read(self, srv, req):
 
-        f = self.storage.checkout(req.fid.qid.path)
+        f = self.storage.checkout(req.fid.qid)
 
         if f.qid.type & py9p.QTDIR:
-            f.sync()
-            req.ofcall.stat = []
-            for (i,k) in f.children.items():
-                if i not in (".",".."):
-                    req.ofcall.stat.append(k)
+            v9inode.read_dir(f,req)
         else:
             if req.ifcall.offset == 0:
                 f.sync()
@@ -18,6 +18,11 @@ from cxnet.netlink.core import nlattr, NLMSG_ALIGN
 from cxnet.netlink.generic import genl_socket
 from cxnet.netlink.taskstats import taskstatsmsg, TASKSTATS_CMD_GET, TASKSTATS_TYPE_PID
 
+# the inodes are shared with iproute2fs
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","iproute2fs"))
+import v9inode
+from v9inode import v9server
+
 DEFAULT_DIR_MODE = 0750
 DEFAULT_FILE_MODE = 0640
 
@@ -40,36 +45,18 @@ class Taskstats(object):
 taskstats = Taskstats()
 
 
-class Inode(py9p.Dir):
+class Inode(v9inode.Inode):
     """
-    VFS inode, based on py9p.Dir
+    statfs inode, see v9inode.Inode; the qid path is the hash of
+    the absolute name
     """
-    def __init__(self,name,parent,qtype=0):
-        py9p.Dir.__init__(self,True)
-
-        self.parent = parent
-        self.name = name
-        #
-        # DMDIR = 0x80000000
-        # QTDIR = 0x80
-        #
-        self.qid = py9p.Qid((qtype >> 24) & py9p.QTDIR, 0, py9p.hash8(self.absolute_name()))
-        self.type = 0
-        self.dev = 0
-        self.atime = self.mtime = int(time.time())
-        self.uidnum = self.muidnum = os.getuid()
-        self.gidnum = os.getgid()
-        self.uid = self.muid = pwd.getpwuid(self.uidnum).pw_name
-        self.gid = grp.getgrgid(self.gidnum).gr_name
-        self.children = {}
-        self.writelock = False
-        if self.qid.type & py9p.QTDIR:
-            self.mode = py9p.DMDIR | DEFAULT_DIR_MODE
-            self.children["."] = self
-            self.children[".."] = self.parent
-        else:
-            self.mode = DEFAULT_FILE_MODE
-            self.data = StringIO()
+    __slots__ = ()
+
+    dir_mode = DEFAULT_DIR_MODE
+    file_mode = DEFAULT_FILE_MODE
+
+    def alloc(self):
+        return (py9p.hash8(self.absolute_name()),0)
 
     def absolute_name(self):
         if (self.parent is not None) and (self.parent != self):
@@ -84,6 +71,8 @@ class Inode(py9p.Dir):
     def length(self):
         if self.qid.type & py9p.QTDIR:
             return len(self.children.keys())
+        elif self.buf is None:
+            return 0
         else:
             p = self.data.tell()
             self.data.seek(0,os.SEEK_END)
@@ -92,6 +81,8 @@ class Inode(py9p.Dir):
             return l
 
 class RootDir(Inode):
+    __slots__ = ("storage",)
+
     def __init__(self,storage):
         Inode.__init__(self,"/",self,qtype=py9p.DMDIR)
         self.storage = storage
@@ -107,21 +98,27 @@ class RootDir(Inode):
         to_delete = chs - prs
         to_delete.remove(".")
         to_delete.remove("..")
-        [ self.storage.files.__delitem__(x) for x in [ self.children[y].qid.path for y in to_delete ] ]
-        [ self.children.__delitem__(x) for x in to_delete ]
         # inodes to create
         to_create = prs - chs
+        if to_delete or to_create:
+            self.changed()
+        [ self.storage.files.__delitem__(x) for x in [ self.children[y].qid.path for y in to_delete ] ]
+        [ self.children.__delitem__(x) for x in to_delete ]
         [ self.children.__setitem__(x.name,x) for x in [ ProcessDir(y,self) for y in to_create ] ]
         [ self.storage.files.__setitem__(x,z) for x,z in [ (self.children[y].qid.path,self.children[y]) for y in to_create ] ]
         [ self.storage.files.__setitem__(x,z) for x,z in [ (self.children[y].taskstats.qid.path,self.children[y].taskstats) for y in to_create ] ]
 
 class ProcessDir(Inode):
+    __slots__ = ("taskstats",)
+
     def __init__(self,name,parent):
         Inode.__init__(self,name,parent,qtype=py9p.DMDIR)
         self.taskstats = TaskstatsInode(pid=name,parent=self)
         self.children["taskstats"] = self.taskstats
 
 class TaskstatsInode(Inode):
+    __slots__ = ("pid",)
+
     def __init__(self,pid,parent):
         Inode.__init__(self,"taskstats",parent)
         self.pid = pid
@@ -129,6 +126,7 @@ class TaskstatsInode(Inode):
     def sync(self):
         self.data = StringIO(str(taskstats.get(int(self.pid))))
         self.data.seek(0)
+        self.changed()
 
 class Storage(object):
     """
@@ -146,6 +144,7 @@ class Storage(object):
         new = Inode(name,mode,self.cwd)
         self.files[new.qid.path] = new
         self.cwd.children[new.name] = new
+        self.cwd.packed_dir = None
         return new.qid
 
     def chdir(self,target):
@@ -173,6 +172,7 @@ class Storage(object):
 
         f.data.seek(offset)
         f.data.write(data)
+        f.changed()
         return len(data)
 
     def read(self,target,size,offset=0):
@@ -185,6 +185,7 @@ class Storage(object):
         for i in f.children.values():
             self.remove(i.qid.path)
         del f.parent.children[f.name]
+        f.parent.packed_dir = None
         del self.files[target]
 
     def wstat(self,target,stat):
@@ -209,6 +210,7 @@ class Storage(object):
         # change name?
         if stat.name:
             f.name = stat.name
+        f.changed()
 
 
 class v9fs(py9p.Server):
@@ -263,11 +265,7 @@ class v9fs(py9p.Server):
         f = self.storage.checkout(req.fid.qid.path)
 
         if f.qid.type & py9p.QTDIR:
-            f.sync()
-            req.ofcall.stat = []
-            for (i,k) in f.children.items():
-                if i not in (".",".."):
-                    req.ofcall.stat.append(k)
+            v9inode.read_dir(f,req)
         else:
             if req.ifcall.offset == 0:
                 f.sync()
@@ -300,6 +298,6 @@ if __name__ == "__main__" :
 
     print("%s:%s, debug=%s" % (address,port,dbg))
     storage = Storage()
-    srv = py9p.Server(listen=(address, port), chatty=dbg, dotu=True)
+    srv = v9server(listen=(address, port), chatty=dbg, dotu=True)
     srv.mount(v9fs(storage))
     srv.serve()
@@ -60,15 +60,19 @@ def etconfig():
     return ifaces
 
 from nlconfig import nlconfig
+from nlethtool import ethconfig
 
 import timeit
 
 i = timeit.Timer("ifconfig()","from __main__ import ifconfig")
 n = timeit.Timer("nlconfig()","from __main__ import nlconfig")
 e = timeit.Timer("etconfig()","from __main__ import etconfig")
+t = timeit.Timer("ethconfig()","from __main__ import ethconfig")
 print i.timeit(100)
 print n.timeit(100)
 print e.timeit(100)
+print t.timeit(100)
 print ifconfig()
 print nlconfig()
 print etconfig()
+print ethconfig()
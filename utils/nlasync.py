@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+#
+#     Copyright (c) 2011 Red Hat, Inc; ALT Linux Team; Peter V. Saveliev
+#
+#     This file was written for VDSM project and uses code from Connexion
+#     library.
+#
+#     Connexion is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Connexion is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Connexion; if not, write to the Free Software
+#     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+Asynchronous nlconfig client for asyncio-style event loops. The
+netlink socket is switched to the nonblocking mode and registered
+with loop.add_reader(), so dumps never block the loop:
+
+    client = NLAsync(loop)
+    ifaces = yield From(client.nlconfig())
+    routes = yield From(client.request(RTM_GETROUTE))
+
+Notifications (links and IPv4 addresses by default) are queued and
+can be awaited one by one with get_event():
+
+    while True:
+        event = yield From(client.get_event())
+
+All the methods return futures and must be called from the loop
+thread. The receive buffers (nl_pool) and the decoder (nl_decode)
+are the same, as in the synchronous nlconfig().
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from collections import deque
+from fcntl import fcntl, F_GETFL, F_SETFL
+from os import O_NONBLOCK
+
+from nlconfig import nl_channel, nl_request, nl_send_raw, nl_get_datagram, nl_buffer
+from nlconfig import nlconfig_build, s_nlmsghdr
+from nlconfig import RTM_GETLINK, RTM_GETADDR, RTM_GETROUTE, RTM_GETNEIGH
+from nlconfig import NLM_F_DUMP, NLM_F_REQUEST, AF_INET, AF_INET6
+from nlconfig import RTNLGRP_LINK, RTNLGRP_IPV4_IFADDR, MSG_DONTWAIT
+
+__all__ = [ "NLAsync" ]
+
+# the fixed part of the dump requests by the message type
+NL_REQUEST_BODY = {
+        RTM_GETLINK:    "ifinfmsg",
+        RTM_GETADDR:    "ifaddrmsg",
+        RTM_GETROUTE:   "rtmsg",
+        RTM_GETNEIGH:   "ndmsg",
+    }
+
+
+class NLAsync(object):
+    """
+    Asynchronous RT netlink client
+    """
+    def __init__(self,loop=None,groups=RTNLGRP_LINK | RTNLGRP_IPV4_IFADDR):
+        self.loop = loop or asyncio.get_event_loop()
+        self.channel = nl_channel(groups)
+        self.fd = self.channel.fd
+        fcntl(self.fd,F_SETFL,fcntl(self.fd,F_GETFL) | O_NONBLOCK)
+
+        self.requests = {}      # seq -> (future, records, inet6)
+        self.queue = deque()    # requests to send
+        self.active = None      # the request in progress
+        self.events = deque()   # notifications
+        self.waiters = deque()  # futures, waiting for notifications
+        self.loop.add_reader(self.fd,self.ready)
+
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        self.channel.close()
+        for (future,records,inet6) in self.requests.values():
+            future.cancel()
+        for future in self.waiters:
+            future.cancel()
+        self.requests = {}
+        self.queue.clear()
+        self.waiters.clear()
+
+    def request(self,msg_type,family=0):
+        """
+        Send a dump request of links, addresses, routes or
+        neighbours; returns a future for the list of the parsed
+        records. IPv6 records are returned as by nl_route_dump()
+        and nl_neigh_dump(). The kernel refuses a dump request on
+        a socket, that is busy with another dump, so the requests
+        are queued and sent one by one.
+        """
+        body = NL_REQUEST_BODY.get(msg_type)
+        if body is None:
+            raise ValueError("no dump request of type %s" % (msg_type))
+        future = asyncio.Future(loop=self.loop)
+        seq = self.channel.sequence()
+        req = nl_request(msg_type,NLM_F_DUMP | NLM_F_REQUEST,seq)
+        getattr(req,body)(family=family)
+        inet6 = family == AF_INET6 or (msg_type == RTM_GETNEIGH and family != AF_INET)
+        self.requests[seq] = (future,[],inet6)
+        self.queue.append((seq,req.encode()))
+        self.send()
+        return future
+
+    def send(self):
+        """
+        Send the next queued request, if no dump is in progress
+        """
+        if self.active is None and self.queue:
+            (self.active,data) = self.queue.popleft()
+            nl_send_raw(self.fd,data)
+
+    def dump(self):
+        """
+        Dump links and then addresses; returns a future for the list
+        of records with the "dev" key, like nlconfig_iter() yields
+        """
+        future = asyncio.Future(loop=self.loop)
+        links = self.request(RTM_GETLINK)
+        addrs = self.request(RTM_GETADDR)
+
+        def collect(done):
+            if future.cancelled():
+                return
+            if links.cancelled() or addrs.cancelled():
+                future.cancel()
+                return
+            future.set_result([ x for x in links.result() + addrs.result()
+                                    if x.has_key('dev') ])
+
+        # the requests are sent in order, so addrs is done last
+        addrs.add_done_callback(collect)
+        return future
+
+    def nlconfig(self):
+        """
+        Returns a future for the nlconfig() dictionary
+        """
+        future = asyncio.Future(loop=self.loop)
+
+        def build(done):
+            if done.cancelled():
+                future.cancel()
+            elif done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(nlconfig_build(done.result()))
+
+        self.dump().add_done_callback(build)
+        return future
+
+    def get_event(self):
+        """
+        Returns a future for the next notification
+        """
+        future = asyncio.Future(loop=self.loop)
+        if self.events:
+            future.set_result(self.events.popleft())
+        else:
+            self.waiters.append(future)
+        return future
+
+    def ready(self):
+        """
+        The reader callback: drain the socket and dispatch datagrams
+        by the sequence number -- to the pending requests, or to the
+        notification queue
+        """
+        pool = self.channel.pool
+        while True:
+            batch = pool.recv(self.fd,MSG_DONTWAIT)
+            for (l,msg) in batch:
+                seq = s_nlmsghdr.unpack_from(nl_buffer(msg),0)[3]
+                if self.requests.has_key(seq):
+                    (future,records,inet6) = self.requests[seq]
+                    if nl_get_datagram(msg,l,records,inet6,seq):
+                        del self.requests[seq]
+                        if not future.cancelled():
+                            future.set_result(records)
+                        self.active = None
+                        self.send()
+                else:
+                    events = []
+                    nl_get_datagram(msg,l,events)
+                    [ self.event(x) for x in events ]
+            if len(batch) < pool.size:
+                break
+
+    def event(self,x):
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.cancelled():
+                future.set_result(x)
+                return
+        self.events.append(x)
+
+
+if __name__ == "__main__":
+    loop = asyncio.get_event_loop()
+    client = NLAsync(loop)
+    print loop.run_until_complete(client.nlconfig())
+    client.close()
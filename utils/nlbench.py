@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""
+Synthetic netlink replay benchmark. No root or real interfaces are
+needed: a forked "fake kernel" answers RTM_GETLINK/RTM_GETADDR dump
+requests over a SOCK_SEQPACKET socket pair with pregenerated
+RTM_NEWLINK/RTM_NEWADDR datagrams, and the parent parses them with
+one of the nlconfig.py paths:
+
+    nl_get      -- nl_get() with nl_decode() and a receive pool
+    nl_lazy     -- nl_get() with nl_lazy() records, only "dev" is read
+    nl_parse    -- the old path: nl_recv() + ctypes nl_parse()
+    nlconfig    -- nlconfig_build() over nl_dump()
+
+Usage: nlbench.py [-m mode] [-s scale[,scale...]] [-a addrs] [-r rounds]
+
+Each scale runs in a separate process, so the peak RSS is reported
+per scale. The dumps are generated in the fake kernel process, so the
+RSS is of the parser only. The rate is in netlink messages (RTM_NEWLINK and
+RTM_NEWADDR) per second in every mode, so the modes are comparable.
+"""
+
+from nlconfig import nl_request, nl_pool, nl_get, nl_dump, nlconfig_build, nl_lazy
+from nlconfig import nl_recv, nl_parse, rtnl_msg, s_nlmsghdr, s_u32, s_i32
+from nlconfig import RTM_NEWLINK, RTM_NEWADDR, RTM_GETLINK, RTM_GETADDR
+from nlconfig import NLM_F_MULTI, NLM_F_DUMP, NLM_F_REQUEST, NLMSG_DONE
+from nlconfig import IFLA_IFNAME, IFLA_ADDRESS, IFLA_MTU, IFLA_QDISC
+from nlconfig import IFA_ADDRESS, IFA_LOCAL, IFA_LABEL
+from ctypes import addressof
+from socket import socketpair, AF_UNIX, AF_INET, SOCK_SEQPACKET
+from resource import getrusage, RUSAGE_SELF
+from struct import pack
+import cPickle
+import getopt
+import time
+import sys
+import os
+
+# datagram size of the fake kernel, like NLMSG_GOODSIZE
+DATAGRAM_SIZE = 16384
+
+def datagrams(messages,size=DATAGRAM_SIZE):
+    """
+    Pack encoded messages into datagrams and terminate the dump
+    """
+    ret = []
+    chunk = []
+    length = 0
+    for x in messages:
+        if length + len(x) > size:
+            ret.append("".join(chunk))
+            chunk = []
+            length = 0
+        chunk.append(x)
+        length += len(x)
+    chunk.append(s_nlmsghdr.pack(s_nlmsghdr.size + 4,NLMSG_DONE,NLM_F_MULTI,0,0) +
+                 s_i32.pack(0))
+    ret.append("".join(chunk))
+    return ret
+
+def links(count):
+    """
+    Generate RTM_NEWLINK messages
+    """
+    for i in xrange(count):
+        index = i + 1
+        req = nl_request(RTM_NEWLINK,NLM_F_MULTI)
+        req.ifinfmsg(type=1,index=index,flags=0x1043)
+        req.attr(IFLA_IFNAME,"veth%i\0" % (i))
+        req.attr(IFLA_ADDRESS,pack(">HI",0x0200,index))
+        req.attr(IFLA_MTU,s_u32.pack(1500))
+        req.attr(IFLA_QDISC,"noqueue\0")
+        yield req.encode()
+
+def addrs(count,per_link):
+    """
+    Generate RTM_NEWADDR messages, per_link addresses per interface
+    """
+    n = 0
+    for i in xrange(count):
+        for k in xrange(per_link):
+            n += 1
+            ip = pack(">I",0x0a000000 + n)
+            req = nl_request(RTM_NEWADDR,NLM_F_MULTI)
+            req.ifaddrmsg(family=AF_INET,prefixlen=24,index=i + 1)
+            req.attr(IFA_ADDRESS,ip)
+            req.attr(IFA_LOCAL,ip)
+            req.attr(IFA_LABEL,"veth%i\0" % (i))
+            yield req.encode()
+
+def fake_kernel(s,scale,per_link):
+    """
+    Generate the dumps, tell the peer, that they are ready, and
+    answer dump requests until the peer closes the socket
+    """
+    dumps = {
+        "links": datagrams(links(scale)),
+        "addrs": datagrams(addrs(scale,per_link)),
+    }
+    s.send("ready")
+    while True:
+        req = s.recv(65536)
+        if not req:
+            break
+        t = s_nlmsghdr.unpack_from(req,0)[1]
+        for x in dumps[t == RTM_GETLINK and "links" or "addrs"]:
+            s.send(x)
+
+def legacy_get(fd):
+    """
+    The old ctypes path: a new rtnl_msg per datagram, nl_parse()
+    """
+    result = []
+    end = False
+    while not end:
+        bias = 0
+        (l,msg) = nl_recv(fd)
+        while bias < l:
+            x = rtnl_msg.from_address(addressof(msg) + bias)
+            bias += x.hdr.length
+            parsed = nl_parse(x)
+            if isinstance(parsed,dict):
+                result.append(parsed)
+            if not ((x.hdr.type > NLMSG_DONE) and (x.hdr.flags & NLM_F_MULTI)):
+                end = True
+                break
+    return result
+
+def dump_request(t):
+    return nl_request(t,NLM_F_DUMP | NLM_F_REQUEST).ifinfmsg().encode()
+
+def run(mode,scale,per_link,rounds):
+    """
+    Run one scale, return (messages per round, [ round time, ... ],
+    peak RSS)
+    """
+    messages = scale + scale * per_link
+    (a,b) = socketpair(AF_UNIX,SOCK_SEQPACKET)
+    pid = os.fork()
+    if pid == 0:
+        a.close()
+        fake_kernel(b,scale,per_link)
+        os._exit(0)
+    b.close()
+    a.recv(16)
+
+    fd = a.fileno()
+    pool = nl_pool()
+    times = []
+    for i in xrange(rounds):
+        t = time.time()
+        if mode == "nlconfig":
+            nlconfig_build(nl_dump(fd,pool))
+        else:
+            for x in (RTM_GETLINK,RTM_GETADDR):
+                a.send(dump_request(x))
+                if mode == "nl_get":
+                    nl_get(fd,pool)
+                elif mode == "nl_lazy":
+                    [ x.get("dev") for x in nl_get(fd,pool,decode=nl_lazy) ]
+                else:
+                    legacy_get(fd)
+        times.append(time.time() - t)
+
+    a.close()
+    os.waitpid(pid,0)
+    return (messages,times,getrusage(RUSAGE_SELF).ru_maxrss)
+
+def percentile(values,p):
+    values = sorted(values)
+    return values[min(len(values) - 1,int(len(values) * p / 100.0))]
+
+if __name__ == "__main__":
+
+    try:
+        opt,args = getopt.getopt(sys.argv[1:], "m:s:a:r:")
+    except Exception,e:
+        print(e)
+        print("usage: [-m nl_get|nl_lazy|nl_parse|nlconfig] [-s scale[,scale...]] [-a addrs] [-r rounds]")
+        sys.exit(0)
+
+    mode = "nl_get"
+    scales = [100,1000,10000,100000]
+    per_link = 2
+    rounds = 10
+
+    for i,k in opt:
+        if i == "-m":
+            mode = k
+        if i == "-s":
+            scales = [ int(x) for x in k.split(",") ]
+        if i == "-a":
+            per_link = int(k)
+        if i == "-r":
+            rounds = int(k)
+
+    print "mode: %s, addresses per interface: %s, rounds: %s\n" % (mode,per_link,rounds)
+    print "%-10s%-10s%-14s%-12s%-12s%-10s" % \
+            ("links","messages","messages/s","p50, ms","p99, ms","RSS, MB")
+    for scale in scales:
+        # one process per scale, so ru_maxrss is not inherited
+        (r,w) = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            os.write(w,cPickle.dumps(run(mode,scale,per_link,rounds)))
+            os._exit(0)
+        os.close(w)
+        data = ""
+        while True:
+            chunk = os.read(r,65536)
+            if not chunk:
+                break
+            data += chunk
+        os.close(r)
+        os.waitpid(pid,0)
+        (messages,times,rss) = cPickle.loads(data)
+        print "%-10s%-10s%-14.0f%-12.2f%-12.2f%-10.1f" % \
+                (scale,messages,messages * len(times) / sum(times),
+                 percentile(times,50) * 1000,percentile(times,99) * 1000,
+                 rss / 1024.0)
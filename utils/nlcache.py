@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+#
+#     Copyright (c) 2011 Red Hat, Inc; ALT Linux Team; Peter V. Saveliev
+#
+#     This file was written for VDSM project and uses code from Connexion
+#     library.
+#
+#     Connexion is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Connexion is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Connexion; if not, write to the Free Software
+#     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+Persistent nlconfig() cache. Instead of opening a socket and running
+two dumps on every call, NLConfigCache dumps links and addresses once
+and then applies RTM_NEWLINK/RTM_DELLINK/RTM_NEWADDR/RTM_DELADDR
+notifications to the same dictionary, that nlconfig() returns:
+
+    cache = NLConfigCache()
+    while True:
+        ifaces = cache.get()
+        ...
+
+get() drains pending notifications with one nonblocking recvmmsg()
+and returns the dictionary -- no requests are sent to the kernel.
+The returned dictionary is shared and updated in place, so it must
+not be modified by the caller.
+
+Alternatively, run() can be started in a separate thread; then get()
+should be called with update=False.
+
+If the notifications come faster, than they are read, the kernel drops
+them and reports ENOBUFS (or NLMSG_OVERRUN). Then the cache discards
+the queued notifications, dumps everything again and reconciles the
+dictionary in place. The counters:
+
+    cache.events    -- notifications applied
+    cache.overruns  -- overruns reported, each is one or more events lost
+    cache.resyncs   -- dumps, made to recover
+    cache.resynced  -- nlconfig() entries, fixed by the dumps
+
+The socket buffer size can be set with the rcvbuf argument.
+Notifications are received into a buffer, sized with MSG_PEEK|MSG_TRUNC,
+the receive pool is used only for the dumps.
+
+The socket, the notification loop and the overrun recovery are in the
+NLEventCache base class, also used by nlroute.NLRouteCache and
+nlneigh.NLNeighCache; a subclass defines the groups, load() and apply().
+"""
+
+from abc import ABCMeta, abstractmethod
+
+from nlconfig import nl_socket, nl_pool, nl_sized_buffer, nl_rcvbuf, nl_buffer
+from nlconfig import nl_dump, nl_get_datagram, libc, s_nlmsghdr
+from nlconfig import RTNLGRP_NONE, RTNLGRP_LINK, RTNLGRP_IPV4_IFADDR
+from nlconfig import MSG_DONTWAIT, MSG_WAITFORONE
+from nlconfig import NLMSG_OVERRUN, ENOBUFS
+
+__all__ = [ "NLConfigCache", "NLEventCache" ]
+
+
+class NLEventCache(object):
+    """
+    Data, loaded with a dump and updated by notifications. Subclasses
+    set the multicast groups and define load(), that resets the data
+    with a full dump, and apply(), that applies one notification
+    record; inet6 is passed to the decoder.
+    """
+    __metaclass__ = ABCMeta
+
+    groups = RTNLGRP_NONE
+    inet6 = False
+
+    def __init__(self,pool=None,rcvbuf=None):
+        self.pool = pool or nl_pool()
+        self.buffer = nl_sized_buffer()
+        self.events = 0
+        self.overruns = 0
+        self.resyncs = 0
+        # subscribe to events before the dump, so nothing is lost
+        self.fd = nl_socket(self.groups)
+        if rcvbuf is not None:
+            self.rcvbuf = nl_rcvbuf(self.fd,rcvbuf)
+        self.load()
+
+    @abstractmethod
+    def load(self):
+        """
+        Reset the data with a full dump
+        """
+
+    @abstractmethod
+    def apply(self,x):
+        """
+        Apply one notification record
+        """
+
+    def drain(self):
+        """
+        Drop queued notifications
+        """
+        while self.buffer.recv(self.fd,MSG_DONTWAIT):
+            pass
+
+    def resync(self):
+        """
+        Recover after an overrun: drop queued notifications and
+        dump again
+        """
+        self.drain()
+        self.load()
+        self.resyncs += 1
+
+    def fileno(self):
+        """
+        The notification socket, to be used with select/poll
+        """
+        return self.fd
+
+    def close(self):
+        libc.close(self.fd)
+        self.fd = -1
+
+    def update(self,block=False):
+        """
+        Apply pending notifications. Returns the number of records
+        applied.
+        """
+        count = 0
+        flags = block and MSG_WAITFORONE or MSG_DONTWAIT
+        while True:
+            batch = self.buffer.recv(self.fd,flags)
+            if not batch:
+                if self.buffer.error == ENOBUFS:
+                    self.buffer.error = 0
+                    self.overruns += 1
+                    self.resync()
+                return count
+            result = []
+            for (l,msg) in batch:
+                if s_nlmsghdr.unpack_from(nl_buffer(msg),0)[1] == NLMSG_OVERRUN:
+                    self.overruns += 1
+                    self.resync()
+                    return count
+                nl_get_datagram(msg,l,result,self.inet6)
+            [ self.apply(x) for x in result ]
+            count += len(result)
+            self.events += len(result)
+            flags = MSG_DONTWAIT
+
+    def run(self):
+        """
+        Apply notifications forever
+        """
+        while self.fd != -1:
+            self.update(block=True)
+
+
+class NLConfigCache(NLEventCache):
+    """
+    Event-driven nlconfig() data
+    """
+    groups = RTNLGRP_IPV4_IFADDR | RTNLGRP_LINK
+    resynced = 0
+
+    def load(self):
+        """
+        Reset the cache with a full dump. The dump runs on a separate
+        socket, so notifications can not be mixed up with the dump
+        """
+        self.names = {}         # ifindex -> name
+        self.hwaddr = {}        # name -> hwaddr
+        self.labels = {}        # label -> [ (addr,netmask), ... ]
+        self.ret = {}           # nlconfig() format
+        s = nl_socket(RTNLGRP_NONE)
+        try:
+            [ self.apply(x) for x in nl_dump(s,self.pool) ]
+        finally:
+            libc.close(s)
+
+    def resync(self):
+        """
+        Recover after an overrun: drop queued notifications, dump
+        again and update the dictionary in place, so references to
+        it, given out by get(), stay valid
+        """
+        self.drain()
+
+        old = self.ret
+        self.load()
+        changes = 0
+        for name in [ x for x in old.keys() if not self.ret.has_key(x) ]:
+            del old[name]
+            changes += 1
+        for (name,entry) in self.ret.items():
+            if old.get(name) != entry:
+                old.setdefault(name,{}).update(entry)
+                changes += 1
+            # refresh() must update the entries, given out before
+            self.ret[name] = old[name]
+        self.ret = old
+
+        self.resyncs += 1
+        self.resynced += changes
+
+    def get(self,update=True):
+        """
+        Get data in the nlconfig() format
+        """
+        if update:
+            self.update()
+        return self.ret
+
+    def apply(self,x):
+        """
+        Apply one parsed record
+        """
+        if not x.has_key('dev'):
+            return
+        if x['type'] == 'link':
+            if x['action'] == 'add':
+                self.add_link(x)
+            else:
+                self.del_link(x)
+        elif x['type'] == 'address' and x.has_key('local'):
+            addr = (x['local'],x['mask'])
+            addrs = self.labels.setdefault(x['dev'],[])
+            if x['action'] == 'add':
+                if addr not in addrs:
+                    addrs.append(addr)
+            elif addr in addrs:
+                addrs.remove(addr)
+            self.refresh(x['dev'])
+
+    def add_link(self,x):
+        name = x['dev']
+        old = self.names.get(x['index'])
+        if old is not None and old != name:
+            # the interface is renamed: move its addresses
+            self.del_link({ 'index': x['index'], 'dev': old },False)
+            for label in [ y for y in self.labels.keys()
+                            if y.split(":")[0] == old ]:
+                new = name + label[len(old):]
+                self.labels[new] = self.labels.pop(label)
+        self.names[x['index']] = name
+        # the original ifconfig returns an empty hwaddr for loopback
+        if name == 'lo':
+            self.hwaddr[name] = ''
+        else:
+            self.hwaddr[name] = x['hwaddr']
+        [ self.refresh(y) for y in self.labels.keys()
+            if y.split(":")[0] == name ]
+        self.refresh(name)
+
+    def del_link(self,x,drop_labels=True):
+        name = self.names.pop(x['index'],x['dev'])
+        self.hwaddr.pop(name,None)
+        for label in [ y for y in self.ret.keys() if y.split(":")[0] == name ]:
+            del self.ret[label]
+            if drop_labels:
+                self.labels.pop(label,None)
+        if drop_labels:
+            self.labels.pop(name,None)
+
+    def refresh(self,label):
+        """
+        Rebuild one nlconfig() entry
+        """
+        base = label.split(":")[0]
+        addrs = self.labels.get(label)
+        if not self.hwaddr.has_key(base) or (label != base and not addrs):
+            # "alias interfaces" exist only while they have addresses
+            self.ret.pop(label,None)
+            return
+        entry = self.ret.setdefault(label,{})
+        entry['hwaddr'] = self.hwaddr[base]
+        # only the first address, just as ifconfig does
+        if addrs:
+            (entry['addr'],entry['netmask']) = addrs[0]
+        else:
+            (entry['addr'],entry['netmask']) = ('','')
+
+
+if __name__ == "__main__":
+    cache = NLConfigCache()
+    print cache.get()
+    cache.close()
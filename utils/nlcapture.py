@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Netlink capture files
+
+The file starts with an 8 bytes header: "NLCAP", a zero byte and
+the format version (uint16). Then the frames follow, one frame per
+received datagram:
+
+    double   timestamp (time.time() of the receive)
+    uint32   length of the datagram
+    char[]   the datagram as is, i.e. one or more nlmsghdr messages
+
+All numbers are in the host byte order. To record, set a recorder as
+the receive pool tee:
+
+    pool.recorder = nl_recorder("storm.nlcap")
+
+The reader maps the file into memory and gives out memoryviews
+into the mapping, so nl_decode() reads the frames without copying:
+
+    for (ts,record) in nl_reader("storm.nlcap").records():
+        ...
+
+Usage: nlcapture.py record <file> | replay <file>
+"""
+
+from nlconfig import nl_pool, nl_socket, nl_decode, nl_buffer, libc
+from nlconfig import s_nlmsghdr, rtnl_msg, NLMSG_ALIGN
+from nlconfig import RTNLGRP_LINK, RTNLGRP_IPV4_IFADDR
+from ctypes import c_char, addressof
+from struct import Struct
+from mmap import mmap, ACCESS_COPY
+import time
+import sys
+import os
+
+s_header = Struct("=5sxH")
+s_frame = Struct("=dI")
+
+NLCAP_MAGIC = "NLCAP"
+NLCAP_VERSION = 1
+
+
+class nl_recorder(object):
+    """
+    Capture file writer
+    """
+    def __init__(self,name):
+        self.file = open(name,"wb")
+        self.file.write(s_header.pack(NLCAP_MAGIC,NLCAP_VERSION))
+        self.frames = 0
+
+    def write(self,buf,length,timestamp=None):
+        """
+        Write one datagram from a buffer (nl_buffer() view)
+        """
+        self.file.write(s_frame.pack(timestamp or time.time(),length))
+        self.file.write(buf[:length])
+        self.frames += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class nl_reader(object):
+    """
+    Capture file reader
+
+    A capture, cut off by a crash or a full disk, is read up to the
+    last complete frame, then self.truncated is set; an empty file
+    or a part of the header is read as a capture without frames.
+    """
+    def __init__(self,name):
+        self.file = open(name,"rb")
+        self.truncated = False
+        size = os.fstat(self.file.fileno()).st_size
+        if size < s_header.size:
+            self.map = self.data = None
+            self.buf = memoryview("")
+            if s_header.pack(NLCAP_MAGIC,NLCAP_VERSION)[:size] != self.file.read(size):
+                self.close()
+                raise Exception("%s: not a netlink capture file" % (name))
+            return
+        # a private mapping is writable for ctypes, but never
+        # written back; pages are still read from the page cache
+        self.map = mmap(self.file.fileno(),0,access=ACCESS_COPY)
+        self.data = (c_char * len(self.map)).from_buffer(self.map)
+        self.buf = memoryview(self.data)
+        (magic,version) = s_header.unpack_from(self.buf,0)
+        if magic != NLCAP_MAGIC or version != NLCAP_VERSION:
+            self.close()
+            raise Exception("%s: not a netlink capture file" % (name))
+
+    def frames(self):
+        """
+        Yield (timestamp, offset, length) for each datagram
+        """
+        offset = s_header.size
+        end = len(self.buf)
+        unpack = s_frame.unpack_from
+        while offset + s_frame.size <= end:
+            (ts,length) = unpack(self.buf,offset)
+            offset += s_frame.size
+            if offset + length > end:
+                break
+            yield (ts,offset,length)
+            offset += length
+        if offset < end:
+            # a part of the last frame
+            self.truncated = True
+
+    def messages(self):
+        """
+        Yield (timestamp, buf, offset) for each netlink message;
+        the message can be decoded with nl_decode(buf,offset)
+        """
+        buf = self.buf
+        unpack = s_nlmsghdr.unpack_from
+        for (ts,offset,length) in self.frames():
+            end = offset + length
+            while offset + s_nlmsghdr.size <= end:
+                l = unpack(buf,offset)[0]
+                if l < s_nlmsghdr.size or offset + l > end:
+                    break
+                yield (ts,buf,offset)
+                offset += NLMSG_ALIGN(l)
+
+    def rtnl_msgs(self):
+        """
+        Yield (timestamp, rtnl_msg) views for nl_parse()
+        """
+        base = addressof(self.data)
+        for (ts,buf,offset) in self.messages():
+            yield (ts,rtnl_msg.from_address(base + offset))
+
+    def records(self,inet6=False):
+        """
+        Yield (timestamp, record) with nl_decode() records
+        """
+        for (ts,buf,offset) in self.messages():
+            x = nl_decode(buf,offset,inet6)
+            if x is not None:
+                yield (ts,x)
+
+    def close(self):
+        # the views must be released before the mapping is closed
+        del self.buf
+        del self.data
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 3 or sys.argv[1] not in ("record","replay"):
+        print("usage: nlcapture.py record|replay <file>")
+        sys.exit(0)
+
+    if sys.argv[1] == "record":
+        recorder = nl_recorder(sys.argv[2])
+        pool = nl_pool()
+        pool.recorder = recorder
+        s = nl_socket(RTNLGRP_LINK | RTNLGRP_IPV4_IFADDR)
+        try:
+            while True:
+                pool.recv(s)
+                recorder.flush()
+        except KeyboardInterrupt:
+            pass
+        libc.close(s)
+        recorder.close()
+        print("%s frames recorded" % (recorder.frames))
+    else:
+        reader = nl_reader(sys.argv[2])
+        t = time.time()
+        count = 0
+        for x in reader.records():
+            count += 1
+        t = time.time() - t
+        print("%s records, %.3f s, %.0f records/s" % (count,t,count / (t or 1)))
+        reader.close()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+#
+#     Copyright (c) 2011 Red Hat, Inc; ALT Linux Team; Peter V. Saveliev
+#
+#     This file was written for VDSM project and uses code from Connexion
+#     library.
+#
+#     Connexion is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Connexion is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Connexion; if not, write to the Free Software
+#     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+Columnar export of link and address dumps into NumPy structured
+arrays:
+
+    (links,addrs,names) = nlconfig_arrays()
+    up = links[links['flags'] & 1 != 0]
+    print names.array()[up['name']]
+
+No records are built: the messages are decoded by callbacks, that
+pack the fields with a struct.Struct straight into a bytearray, and
+the bytearray becomes the array with numpy.frombuffer(). The Struct
+layouts are the same, as of t_link and t_addr dtypes.
+
+Names (interface names and address labels) are interned in an
+nl_names table and stored in the arrays as uint32 ids, so the arrays
+stay fixed-size; nl_names.array() gives an object array to map the
+ids back in one step.
+
+Addresses are stored as big-endian uint32, as they come from the
+kernel, so numpy reads them as integers and masks apply directly.
+Only IPv4 addresses are exported.
+"""
+
+import numpy
+from struct import Struct
+
+from nlconfig import nl_socket, nl_iter, nl_send_raw, nl_request, libc
+from nlconfig import s_nlmsghdr, s_nlattr, s_ifinfmsg, s_ifaddrmsg, s_u32
+from nlconfig import RTNLGRP_NONE, NLM_F_DUMP, NLM_F_REQUEST, NLA_TYPE_MASK
+from nlconfig import RTM_NEWLINK, RTM_GETLINK, RTM_NEWADDR, RTM_GETADDR
+from nlconfig import IFLA_ADDRESS, IFLA_IFNAME, IFLA_MTU
+from nlconfig import IFA_ADDRESS, IFA_LOCAL, IFA_LABEL
+from socket import AF_INET
+
+__all__ = [ "nlconfig_arrays", "nl_link_array", "nl_addr_array", "nl_names",
+            "t_link", "t_addr" ]
+
+t_link = numpy.dtype([
+            ("index",       "=i4"),
+            ("flags",       "=u4"),
+            ("mtu",         "=u4"),
+            ("type",        "=u2"),
+            ("mac",         "u1",(6,)),
+            ("name",        "=u4"),
+        ])
+s_link = Struct("=iIIH6sI")
+
+t_addr = numpy.dtype([
+            ("index",       "=i4"),
+            ("family",      "u1"),
+            ("prefixlen",   "u1"),
+            ("scope",       "u1"),
+            ("flags",       "u1"),
+            ("addr",        ">u4"),
+            ("label",       "=u4"),
+        ])
+s_addr = Struct("=iBBBB4sI")
+
+assert t_link.itemsize == s_link.size and t_addr.itemsize == s_addr.size
+
+
+class nl_names (object):
+    """
+    Interned names table: name <-> uint32 id. The id 0 is the
+    empty name.
+    """
+    def __init__(self):
+        self.names = [ "" ]
+        self.ids = { "": 0 }
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self,nid):
+        return self.names[nid]
+
+    def get(self,name):
+        nid = self.ids.get(name)
+        if nid is None:
+            nid = self.ids[intern(name)] = len(self.names)
+            self.names.append(name)
+        return nid
+
+    def array(self):
+        """
+        Get the names as an object array, indexed by id
+        """
+        return numpy.array(self.names,dtype=object)
+
+
+class nl_columns (object):
+    """
+    Decode callbacks for nl_iter(), that pack records into
+    self.data; see nl_get_datagram() for the decode interface
+    """
+    def __init__(self,names=None):
+        self.names = names or nl_names()
+        self.data = bytearray()
+
+    def link(self,buf,offset=0,inet6=False):
+        (length,t) = s_nlmsghdr.unpack_from(buf,offset)[:2]
+        if t != RTM_NEWLINK:
+            return None
+        ptr = offset + s_nlmsghdr.size
+        (family,ltype,index,flags,change) = s_ifinfmsg.unpack_from(buf,ptr)
+        (mtu,mac,name) = (0,"\0" * 6,0)
+        ptr += s_ifinfmsg.size
+        end = offset + length
+        unpack_attr = s_nlattr.unpack_from
+        while ptr + 4 <= end:
+            (l,a) = unpack_attr(buf,ptr)
+            if l < 4:
+                break
+            a &= NLA_TYPE_MASK
+            if a == IFLA_MTU:
+                mtu = s_u32.unpack_from(buf,ptr + 4)[0]
+            elif a == IFLA_ADDRESS and l >= 10:
+                mac = buf[ptr + 4:ptr + 10].tobytes()
+            elif a == IFLA_IFNAME:
+                name = self.names.get(buf[ptr + 4:ptr + l].tobytes().split("\0",1)[0])
+            ptr += (l + 3) & ~3
+        self.data += s_link.pack(index,flags,mtu,ltype,mac,name)
+        return None
+
+    def addr(self,buf,offset=0,inet6=False):
+        (length,t) = s_nlmsghdr.unpack_from(buf,offset)[:2]
+        if t != RTM_NEWADDR:
+            return None
+        ptr = offset + s_nlmsghdr.size
+        (family,prefixlen,flags,scope,index) = s_ifaddrmsg.unpack_from(buf,ptr)
+        if family != AF_INET:
+            return None
+        (local,address,label) = (None,None,0)
+        ptr += s_ifaddrmsg.size
+        end = offset + length
+        unpack_attr = s_nlattr.unpack_from
+        while ptr + 4 <= end:
+            (l,a) = unpack_attr(buf,ptr)
+            if l < 4:
+                break
+            a &= NLA_TYPE_MASK
+            if a == IFA_LOCAL:
+                local = buf[ptr + 4:ptr + 8].tobytes()
+            elif a == IFA_ADDRESS:
+                address = buf[ptr + 4:ptr + 8].tobytes()
+            elif a == IFA_LABEL:
+                label = self.names.get(buf[ptr + 4:ptr + l].tobytes().split("\0",1)[0])
+            ptr += (l + 3) & ~3
+        # the local address, if any, as nl_parse() does
+        self.data += s_addr.pack(index,family,prefixlen,scope,flags,
+                                 local or address or "\0" * 4,label)
+        return None
+
+    def array(self,dtype):
+        """
+        Get the packed records as an array and reset the buffer
+        """
+        ret = numpy.frombuffer(self.data,dtype)
+        self.data = bytearray()
+        return ret
+
+
+def nl_columns_dump(fd,request,decode,pool=None):
+    nl_send_raw(fd,request.encode())
+    for x in nl_iter(fd,pool,decode=decode):
+        pass
+
+def nl_link_array(fd=None,pool=None,names=None):
+    """
+    Dump links into a t_link array. Returns (array, names).
+    """
+    columns = nl_columns(names)
+    s = fd
+    if fd is None:
+        s = nl_socket(RTNLGRP_NONE)
+    try:
+        req = nl_request(RTM_GETLINK,NLM_F_DUMP | NLM_F_REQUEST).ifinfmsg()
+        nl_columns_dump(s,req,columns.link,pool)
+    finally:
+        if fd is None:
+            libc.close(s)
+    return (columns.array(t_link),columns.names)
+
+def nl_addr_array(fd=None,pool=None,names=None):
+    """
+    Dump IPv4 addresses into a t_addr array. Returns (array, names).
+    """
+    columns = nl_columns(names)
+    s = fd
+    if fd is None:
+        s = nl_socket(RTNLGRP_NONE)
+    try:
+        req = nl_request(RTM_GETADDR,NLM_F_DUMP | NLM_F_REQUEST).ifaddrmsg(family=AF_INET)
+        nl_columns_dump(s,req,columns.addr,pool)
+    finally:
+        if fd is None:
+            libc.close(s)
+    return (columns.array(t_addr),columns.names)
+
+def nlconfig_arrays(pool=None):
+    """
+    Dump links and addresses over one socket. Returns (links,
+    addresses, names); the names table is shared.
+    """
+    s = nl_socket(RTNLGRP_NONE)
+    try:
+        (links,names) = nl_link_array(s,pool)
+        (addrs,names) = nl_addr_array(s,pool,names)
+    finally:
+        libc.close(s)
+    return (links,addrs,names)
+
+
+if __name__ == "__main__":
+    (links,addrs,names) = nlconfig_arrays()
+    print links
+    print addrs
+    print names.array()
@@ -28,8 +28,8 @@ due to output data format restrictions.
 To get full version of the library, use master branch of the main git
 repository at git://projects.radlinux.org/cx/ (cxnet.netlink.iproute2)
 
-This module exports only one routine, nlconfig(), which takes no
-parameters. The routine opens a Netlink socket for NETLINK_ROUTE family,
+This module exports nlconfig(), nlconfig_iter() and nlconfig_dev().
+The nlconfig() routine opens a Netlink socket for NETLINK_ROUTE family,
 dumps links and interfaces data and builds a dictionary in the format:
 
 {
@@ -41,10 +41,34 @@ dumps links and interfaces data and builds a dictionary in the format:
     ...
 }
 
-Please note that there can be only one Netlink socket opened for each
-Netlink family by a process at one time. So, in multithreading
-environment nlconfig() calls must be protected by mutexes or any
-other synchronization primitives.
+The nlconfig_iter() routine is a generator, that yields raw link and
+address records while the dump is being received, so the caller can
+stop early and memory usage does not depend on the dump size.
+
+To query one interface, use nlconfig_dev(name): it returns one entry
+of the nlconfig() dictionary, using a targeted RTM_GETLINK request and
+a filtered RTM_GETADDR dump instead of dumping all the interfaces. The
+underlying nl_link() and nl_addrs() routines return raw records.
+
+Routes are not a part of the nlconfig() dictionary; nl_routes() dumps
+the routing tables as raw records, and nlroute.NLRouteCache keeps an
+index of them for the longest prefix match lookups. The same way,
+nl_neighs() dumps the neighbour (ARP/NDP) tables, and nlneigh.NLNeighCache
+keeps them hashed by (ifindex, address) and by link layer address.
+ethtool settings come over the generic netlink ETHTOOL family:
+nlethtool.ethconfig() merges them into the nlconfig() dictionary.
+
+Please note that by default all nlconfig() calls share one set of
+receive buffers. So, in multithreading environment nlconfig() calls
+must be either protected by mutexes or any other synchronization
+primitives, or use a socket pool:
+
+    sockets = nl_socket_pool(8)
+    ...
+    nlconfig(sockets=sockets)     # from any thread
+
+Each socket of the pool has its own port id, sequence numbers and
+receive buffers, so several dumps run in parallel.
 
 Limitations:
 
@@ -55,13 +79,19 @@ Limitations:
 """
 
 
-from ctypes import CDLL, Structure, Union
-from ctypes import string_at, sizeof, addressof, byref
-from ctypes import c_byte, c_ubyte, c_ushort, c_int, c_uint8, c_uint16, c_uint32
-from socket import AF_NETLINK, SOCK_RAW
+from ctypes import CDLL, Structure, Union, POINTER
+from ctypes import string_at, sizeof, addressof, byref, cast
+from ctypes import c_byte, c_ubyte, c_ushort, c_int, c_uint, c_uint8, c_uint16, c_uint32
+from ctypes import c_void_p, c_size_t, c_char, get_errno
+from os import strerror
+from socket import AF_NETLINK, SOCK_RAW, AF_INET, AF_INET6, inet_ntop
+from struct import Struct
 from copy import copy
+from Queue import Queue
+from threading import Lock
 
-__all__ = [ "nlconfig" ]
+__all__ = [ "nlconfig", "nlconfig_iter", "nlconfig_dev", "nl_link", "nl_links", "nl_addrs",
+            "nl_routes", "nl_neighs", "nl_socket_pool" ]
 
 ###
 #
@@ -73,15 +103,18 @@ __all__ = [ "nlconfig" ]
 # at all, but it is faster. Anyway, we're to get Linux' ip
 # configuration data, so, there are no portability issues.
 #
-libc = CDLL("libc.so.6")
+libc = CDLL("libc.so.6",use_errno=True)
 
-# The only netlink protocol we're to use
+# Netlink protocols: RT Netlink and, for nlethtool, generic netlink
 NETLINK_ROUTE = 0
+NETLINK_GENERIC = 16
 
 ##  RT Netlink multicast groups
 RTNLGRP_NONE = 0x0
 RTNLGRP_LINK = 0x1
+RTNLGRP_NEIGH = 0x4
 RTNLGRP_IPV4_IFADDR = 0x10
+RTNLGRP_IPV4_ROUTE = 0x40
 
 ## Types of RT Netlink messages
 RTM_NEWLINK = 16
@@ -90,6 +123,14 @@ RTM_GETLINK = 18
 RTM_NEWADDR = 20
 RTM_DELADDR = 21
 RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+RTM_NEWNEIGH = 28
+RTM_DELNEIGH = 29
+RTM_GETNEIGH = 30
+RTM_NEWSTATS = 92
+RTM_GETSTATS = 94
 
 ## Netlink message flags values
 NLM_F_REQUEST            = 1    # It is request message.
@@ -110,6 +151,33 @@ NLMSG_OVERRUN            = 0x4    # Data lost
 NLMSG_MIN_TYPE           = 0x10    # < 0x10: reserved control messages
 NLMSG_MAX_LEN = 0xffff
 
+## Netlink socket options
+SOL_NETLINK              = 270
+NETLINK_GET_STRICT_CHK   = 12   # strict checking of dump requests
+
+## Socket options
+SOL_SOCKET               = 1
+SO_RCVBUF                = 8
+SO_RCVBUFFORCE           = 33   # ignores rmem_max, needs CAP_NET_ADMIN
+
+EINTR                    = 4
+ENODEV                   = 19
+ENOBUFS                  = 105  # receive queue overrun
+
+## recvmmsg(2) flags
+MSG_PEEK                 = 0x2      # peek at the incoming datagram
+MSG_TRUNC                = 0x20     # return the real datagram length
+MSG_DONTWAIT             = 0x40     # nonblocking operation
+MSG_WAITFORONE           = 0x10000  # block only for the first datagram
+
+# Receive buffers in the default pool, i.e. how many datagrams
+# can be drained by one recvmmsg() call
+NL_POOL_SIZE = 8
+
+# Receive buffer space, taken by one RTM_NEWLINK reply with the skb
+# overhead; nl_links() sends as many requests at once, as fit
+NL_LINK_REPLY_SIZE = 8192
+
 # Standard alignment function
 NLMSG_ALIGNTO = 4
 def NLMSG_ALIGN(l):
@@ -172,6 +240,38 @@ class nlmsghdr (Structure):
         ("pid",                c_uint32),
     ]
 
+class iovec (Structure):
+    """
+    Scatter/gather array item, see readv(2)
+    """
+    _fields_ = [
+        ("base",     c_void_p),
+        ("len",      c_size_t),
+    ]
+
+class msghdr (Structure):
+    """
+    Message header, see recvmsg(2)
+    """
+    _fields_ = [
+        ("name",        c_void_p),
+        ("namelen",     c_uint32),
+        ("iov",         POINTER(iovec)),
+        ("iovlen",      c_size_t),
+        ("control",     c_void_p),
+        ("controllen",  c_size_t),
+        ("flags",       c_int),
+    ]
+
+class mmsghdr (Structure):
+    """
+    Multiple message header, see recvmmsg(2)
+    """
+    _fields_ = [
+        ("hdr",      msghdr),
+        ("len",      c_uint),
+    ]
+
 class rtnl_payload (Union):
     """
     Unified RT Netlink payload
@@ -299,6 +399,536 @@ def nl_parse(msg):
     return r
 
 
+###
+#
+# Table-driven decoder. The ctypes path above creates several
+# ctypes objects per attribute; the decoder below walks a memoryview
+# of the receive buffer with precompiled struct.Struct objects and
+# per-message-type attribute tables instead. For the attributes, that
+# nl_parse() knows, nl_decode() returns the same values; other
+# attributes from the tables are returned as additional keys.
+#
+s_nlmsghdr = Struct("=IHHII")
+s_nlattr = Struct("=HH")
+s_ifinfmsg = Struct("=BxHiIi")
+s_ifaddrmsg = Struct("=BBBBi")
+s_rtmsg = Struct("=BBBBBBBBI")
+s_rtnexthop = Struct("=HBBi")
+s_ndmsg = Struct("=BxxxiHBB")
+s_if_stats_msg = Struct("=BxxxiI")
+s_genlmsghdr = Struct("=BBxx")
+s_u8 = Struct("=B")
+s_u16 = Struct("=H")
+s_u32 = Struct("=I")
+s_i32 = Struct("=i")
+s_ip4ad = Struct("=4B")
+s_l2ad = Struct("=6B")
+s_cacheinfo = Struct("=IIII")
+
+NLA_TYPE_MASK = 0x3fff
+
+# dotted quad masks by prefix length
+t_masks = [ "%i.%i.%i.%i" % tuple(reversed([ (m >> (8*x)) & 0xff for x in range(4) ]))
+                for m in [ (0xffffffff << (32 - y)) & 0xffffffff for y in range(33) ] ]
+
+def d_ipad(buf,offset,length):
+    """
+    Decode IPv4 or IPv6 address
+    """
+    if length == 16:
+        return inet_ntop(AF_INET6,buf[offset:offset + 16].tobytes())
+    return "%u.%u.%u.%u" % s_ip4ad.unpack_from(buf,offset)
+def d_l2ad(buf,offset,length):
+    """
+    Decode link layer address
+    """
+    if length == 6:
+        return "%02x:%02x:%02x:%02x:%02x:%02x" % s_l2ad.unpack_from(buf,offset)
+    return ":".join([ "%02x" % ord(x) for x in buf[offset:offset + length].tobytes() ])
+def d_asciiz(buf,offset,length):
+    """
+    Decode a zero-terminated string
+    """
+    return buf[offset:offset + length].tobytes().split("\0",1)[0]
+def d_u8(buf,offset,length):
+    return s_u8.unpack_from(buf,offset)[0]
+def d_u32(buf,offset,length):
+    return s_u32.unpack_from(buf,offset)[0]
+# struct rtnl_link_stats64 fields, the kernel may send less or more
+t_stats64 = ("rx_packets","tx_packets","rx_bytes","tx_bytes",
+             "rx_errors","tx_errors","rx_dropped","tx_dropped",
+             "multicast","collisions",
+             "rx_length_errors","rx_over_errors","rx_crc_errors",
+             "rx_frame_errors","rx_fifo_errors","rx_missed_errors",
+             "tx_aborted_errors","tx_carrier_errors","tx_fifo_errors",
+             "tx_heartbeat_errors","tx_window_errors",
+             "rx_compressed","tx_compressed","rx_nohandler")
+s_stats64 = [ Struct("=%iQ" % x) for x in range(len(t_stats64) + 1) ]
+
+def d_stats64(buf,offset,length):
+    """
+    Decode struct rtnl_link_stats64 into a tuple, in the order
+    of t_stats64
+    """
+    return s_stats64[min(length // 8,len(t_stats64))].unpack_from(buf,offset)
+def d_cacheinfo(buf,offset,length):
+    """
+    Decode struct ifa_cacheinfo: (preferred, valid, cstamp, tstamp)
+    """
+    return s_cacheinfo.unpack_from(buf,offset)
+
+## more address attributes
+IFA_ADDRESS   = 1
+IFA_BROADCAST = 4
+IFA_ANYCAST   = 5
+IFA_CACHEINFO = 6
+IFA_FLAGS     = 8
+
+s_ifa_attr = {
+            IFA_ADDRESS:    ("address",     d_ipad),
+            IFA_LOCAL:      ("local",       d_ipad),
+            IFA_LABEL:      ("dev",         d_asciiz),
+            IFA_BROADCAST:  ("broadcast",   d_ipad),
+            IFA_ANYCAST:    ("anycast",     d_ipad),
+            IFA_CACHEINFO:  ("cacheinfo",   d_cacheinfo),
+            IFA_FLAGS:      ("ifa_flags",   d_u32),
+        }
+
+## more link attributes
+IFLA_BROADCAST      = 2
+IFLA_MTU            = 4
+IFLA_LINK           = 5
+IFLA_QDISC          = 6
+IFLA_MASTER         = 10
+IFLA_TXQLEN         = 13
+IFLA_OPERSTATE      = 16
+IFLA_LINKMODE       = 17
+IFLA_IFALIAS        = 20
+IFLA_STATS64        = 23
+IFLA_GROUP          = 27
+IFLA_PROMISCUITY    = 30
+IFLA_NUM_TX_QUEUES  = 31
+IFLA_NUM_RX_QUEUES  = 32
+IFLA_CARRIER        = 33
+IFLA_MIN_MTU        = 50
+IFLA_MAX_MTU        = 51
+
+s_ifla_attr = {
+            IFLA_ADDRESS:       ("hwaddr",      d_l2ad),
+            IFLA_BROADCAST:     ("broadcast",   d_l2ad),
+            IFLA_IFNAME:        ("dev",         d_asciiz),
+            IFLA_MTU:           ("mtu",         d_u32),
+            IFLA_LINK:          ("link",        d_u32),
+            IFLA_QDISC:         ("qdisc",       d_asciiz),
+            IFLA_MASTER:        ("master",      d_u32),
+            IFLA_TXQLEN:        ("txqlen",      d_u32),
+            IFLA_OPERSTATE:     ("operstate",   d_u8),
+            IFLA_LINKMODE:      ("linkmode",    d_u8),
+            IFLA_IFALIAS:       ("alias",       d_asciiz),
+            IFLA_STATS64:       ("stats64",     d_stats64),
+            IFLA_GROUP:         ("group",       d_u32),
+            IFLA_PROMISCUITY:   ("promiscuity", d_u32),
+            IFLA_NUM_TX_QUEUES: ("tx_queues",   d_u32),
+            IFLA_NUM_RX_QUEUES: ("rx_queues",   d_u32),
+            IFLA_CARRIER:       ("carrier",     d_u8),
+            IFLA_MIN_MTU:       ("min_mtu",     d_u32),
+            IFLA_MAX_MTU:       ("max_mtu",     d_u32),
+        }
+
+## route attributes
+RTA_DST             = 1
+RTA_SRC             = 2
+RTA_IIF             = 3
+RTA_OIF             = 4
+RTA_GATEWAY         = 5
+RTA_PRIORITY        = 6
+RTA_PREFSRC         = 7
+RTA_MULTIPATH       = 9
+RTA_TABLE           = 15
+
+## route message flags
+RTM_F_CLONED        = 0x200
+
+def d_multipath(buf,offset,length):
+    """
+    Decode RTA_MULTIPATH: ((gateway, ifindex, weight), ...)
+    """
+    ret = []
+    end = offset + length
+    while offset + s_rtnexthop.size <= end:
+        (l,flags,hops,index) = s_rtnexthop.unpack_from(buf,offset)
+        if l < s_rtnexthop.size:
+            break
+        gateway = None
+        ptr = offset + s_rtnexthop.size
+        while ptr + 4 <= offset + l:
+            (al,a) = s_nlattr.unpack_from(buf,ptr)
+            if al < 4:
+                break
+            if a & NLA_TYPE_MASK == RTA_GATEWAY:
+                gateway = d_ipad(buf,ptr + 4,al - 4)
+            ptr += (al + 3) & ~3
+        ret.append((gateway,index,hops + 1))
+        offset += (l + 3) & ~3
+    return tuple(ret)
+
+# the names are the same, as of cxnet.netlink.iproute2 route events
+s_rta_attr = {
+            RTA_DST:        ("dst_prefix",  d_ipad),
+            RTA_SRC:        ("src_prefix",  d_ipad),
+            RTA_IIF:        ("input_link",  d_u32),
+            RTA_OIF:        ("output_link", d_u32),
+            RTA_GATEWAY:    ("gateway",     d_ipad),
+            RTA_PRIORITY:   ("priority",    d_u32),
+            RTA_PREFSRC:    ("prefsrc",     d_ipad),
+            RTA_MULTIPATH:  ("multipath",   d_multipath),
+            RTA_TABLE:      ("table",       d_u32),
+        }
+
+## neighbour attributes
+NDA_DST             = 1
+NDA_LLADDR          = 2
+NDA_CACHEINFO       = 3
+NDA_PROBES          = 4
+NDA_VLAN            = 5
+NDA_MASTER          = 9
+
+def d_u16(buf,offset,length):
+    return s_u16.unpack_from(buf,offset)[0]
+
+# the names are the same, as of cxnet.netlink.iproute2 neigh events
+s_nda_attr = {
+            NDA_DST:        ("dest",        d_ipad),
+            NDA_LLADDR:     ("lladdr",      d_l2ad),
+            NDA_CACHEINFO:  ("cacheinfo",   d_cacheinfo),
+            NDA_PROBES:     ("probes",      d_u32),
+            NDA_VLAN:       ("vlan",        d_u16),
+            NDA_MASTER:     ("master",      d_u32),
+        }
+
+def nl_decode(buf,offset=0,inet6=False):
+    """
+    Decode a RT Netlink message from a memoryview at the offset.
+    The output is compatible with nl_parse(), with additional keys
+    for the action ("add" or "remove"), the header fields and the
+    attributes from s_ifla_attr, s_ifa_attr, s_rta_attr and s_nda_attr
+    tables.
+
+    IPv6 addresses, routes and neighbours are dropped, as nl_parse()
+    does, unless inet6 is set; then "mask" of an IPv6 address is its
+    prefix length.
+    Neighbours of other families (bridge FDB entries) are always
+    dropped.
+    """
+    (r,at,ptr,end) = nl_decode_header(buf,offset,inet6)
+    if at is None:
+        return r
+
+    unpack_attr = s_nlattr.unpack_from
+    get = at.get
+    while ptr + 4 <= end:
+        (l,a) = unpack_attr(buf,ptr)
+        if l < 4:
+            break
+        d = get(a & NLA_TYPE_MASK)
+        if d is not None:
+            r[d[0]] = d[1](buf,ptr + 4,l - 4)
+        ptr += (l + 3) & ~3
+
+    return r
+
+def nl_decode_header(buf,offset=0,inet6=False):
+    """
+    Decode the header and the fixed part of a message. Returns
+    (record, attribute table, offset of the first attribute, end
+    of the message); the table is None, if the message has no
+    attributes to decode -- then the record is final.
+    """
+    (length,t) = s_nlmsghdr.unpack_from(buf,offset)[:2]
+    end = offset + length
+    ptr = offset + s_nlmsghdr.size
+
+    ## message type
+    if \
+        t == NLMSG_ERROR:
+        # nl_parse() treats control messages as empty links
+        return ({ "type": "link", "hwaddr": "",
+                  "error": s_i32.unpack_from(buf,ptr)[0] },None,ptr,end)
+    elif \
+        t < NLMSG_MIN_TYPE:
+        return ({ "type": "link", "hwaddr": "" },None,ptr,end)
+    elif \
+        t <= RTM_DELLINK:
+        (family,ltype,index,flags,change) = s_ifinfmsg.unpack_from(buf,ptr)
+        r = {
+            "type": "link",
+            "action": t == RTM_DELLINK and "remove" or "add",
+            "hwaddr": "",
+            "index": index,
+            "flags": flags,
+            "link_type": ltype,
+        }
+        ptr += s_ifinfmsg.size
+        at = s_ifla_attr
+    elif \
+        t <= RTM_DELADDR:
+        (family,prefixlen,flags,scope,index) = s_ifaddrmsg.unpack_from(buf,ptr)
+        if inet6 and family == AF_INET6:
+            mask = prefixlen
+        elif prefixlen > 32:
+            # only IPv4 addresses, see nl_parse()
+            return (None,None,ptr,end)
+        else:
+            mask = t_masks[prefixlen]
+        r = {
+            "type": "address",
+            "action": t == RTM_DELADDR and "remove" or "add",
+            "mask": mask,
+            "family": family,
+            "prefixlen": prefixlen,
+            "scope": scope,
+            "index": index,
+        }
+        ptr += s_ifaddrmsg.size
+        at = s_ifa_attr
+    elif \
+        t >= RTM_NEWROUTE and t <= RTM_DELROUTE:
+        (family,dst_len,src_len,tos,table,proto,scope,rtype,flags) = \
+            s_rtmsg.unpack_from(buf,ptr)
+        if family == AF_INET6 and not inet6:
+            return (None,None,ptr,end)
+        r = {
+            "type": "route",
+            "action": t == RTM_DELROUTE and "remove" or "add",
+            "family": family,
+            "dst_len": dst_len,
+            "src_len": src_len,
+            "tos": tos,
+            "table": table,     # RTA_TABLE, if any, overrides it
+            "protocol": proto,
+            "scope": scope,
+            "rtype": rtype,
+            "flags": flags,
+        }
+        ptr += s_rtmsg.size
+        at = s_rta_attr
+    elif \
+        t >= RTM_NEWNEIGH and t <= RTM_DELNEIGH:
+        (family,index,state,flags,ntype) = s_ndmsg.unpack_from(buf,ptr)
+        # IP neighbours only: RTNLGRP_NEIGH carries bridge FDB
+        # entries (AF_BRIDGE) too, they have no NDA_DST
+        if family != AF_INET and (family != AF_INET6 or not inet6):
+            return (None,None,ptr,end)
+        r = {
+            "type": "neigh",
+            "action": t == RTM_DELNEIGH and "remove" or "add",
+            "family": family,
+            "index": index,
+            "state": state,
+            "flags": flags,
+            "ntype": ntype,
+        }
+        ptr += s_ndmsg.size
+        at = s_nda_attr
+    else:
+        return ({ "type": "n/a" },None,ptr,end)
+
+    return (r,at,ptr,end)
+
+# attribute name -> (type, decoder), for nl_record
+s_ifla_names = dict([ (y[0],(x,y[1])) for (x,y) in s_ifla_attr.items() ])
+s_ifa_names = dict([ (y[0],(x,y[1])) for (x,y) in s_ifa_attr.items() ])
+
+class nl_record (object):
+    """
+    Lazily decoded record. Only the raw message is kept: the header
+    is decoded on the first access to a header field, an attribute
+    -- on the first access to it, and the values are cached. The
+    interface is the same, as of the nl_decode() dictionary.
+    """
+    __slots__ = ("data","inet6","cache","header")
+
+    def __init__(self,data,inet6=False):
+        self.data = data
+        self.inet6 = inet6
+        self.cache = None       # decoded attributes
+        self.header = None      # decoded header fields
+
+    def load_header(self):
+        (self.header,at,ptr,end) = nl_decode_header(memoryview(self.data),0,self.inet6)
+        return self.header
+
+    def names(self):
+        """
+        Get the attribute names table and the offset of the first
+        attribute
+        """
+        if s_u16.unpack_from(self.data,4)[0] <= RTM_DELLINK:
+            return (s_ifla_names,s_nlmsghdr.size + s_ifinfmsg.size)
+        return (s_ifa_names,s_nlmsghdr.size + s_ifaddrmsg.size)
+
+    def attrs(self):
+        """
+        Iterate (name, offset, length) of the attributes, that have
+        decoders
+        """
+        (names,ptr) = self.names()
+        if names is s_ifla_names:
+            at = s_ifla_attr
+        else:
+            at = s_ifa_attr
+        data = self.data
+        end = len(data)
+        unpack_attr = s_nlattr.unpack_from
+        while ptr + 4 <= end:
+            (l,a) = unpack_attr(data,ptr)
+            if l < 4:
+                break
+            if at.has_key(a & NLA_TYPE_MASK):
+                yield (at[a & NLA_TYPE_MASK][0],ptr + 4,l - 4)
+            ptr += (l + 3) & ~3
+
+    def __getitem__(self,key):
+        cache = self.cache
+        if cache is not None and cache.has_key(key):
+            return cache[key]
+        data = self.data
+        if data is None:
+            raise KeyError(key)
+        (names,ptr) = self.names()
+        d = names.get(key)
+        if d is not None:
+            # find the attribute; the last one wins, as in nl_decode()
+            (nla_type,decoder) = d
+            found = None
+            end = len(data)
+            unpack_attr = s_nlattr.unpack_from
+            while ptr + 4 <= end:
+                (l,a) = unpack_attr(data,ptr)
+                if l < 4:
+                    break
+                if a & NLA_TYPE_MASK == nla_type:
+                    found = (ptr + 4,l - 4)
+                ptr += (l + 3) & ~3
+            if found is not None:
+                value = decoder(memoryview(data),found[0],found[1])
+                if cache is None:
+                    cache = self.cache = {}
+                cache[key] = value
+                return value
+        if key == "type":
+            return names is s_ifla_names and "link" or "address"
+        return (self.header or self.load_header())[key]
+
+    def __setitem__(self,key,value):
+        self.load()
+        self.cache[key] = value
+
+    def __delitem__(self,key):
+        self.load()
+        del self.cache[key]
+
+    def load(self):
+        """
+        Decode everything: to be used before changes, so the record
+        is switched to a plain cache
+        """
+        if self.data is None:
+            return
+        header = self.header or self.load_header()
+        cache = dict(header)
+        buf = memoryview(self.data)
+        names = self.names()[0]
+        for (name,offset,length) in self.attrs():
+            cache[name] = names[name][1](buf,offset,length)
+        cache.update(self.cache or {})
+        self.cache = cache
+        self.header = {}
+        self.data = None
+
+    def keys(self):
+        if self.data is None:
+            return self.cache.keys()
+        header = self.header or self.load_header()
+        return list(set(header.keys() + [ x[0] for x in self.attrs() ]))
+
+    def __contains__(self,key):
+        if self.cache is not None and self.cache.has_key(key):
+            return True
+        if self.data is None:
+            return False
+        header = self.header or self.load_header()
+        if header.has_key(key):
+            return True
+        if self.names()[0].has_key(key):
+            for x in self.attrs():
+                if x[0] == key:
+                    return True
+        return False
+
+    has_key = __contains__
+
+    def get(self,key,default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    iterkeys = __iter__
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [ (x,self[x]) for x in self.keys() ]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def values(self):
+        return [ self[x] for x in self.keys() ]
+
+    def copy(self):
+        return dict(self.items())
+
+    def __eq__(self,other):
+        return self.copy() == other
+
+    def __ne__(self,other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return repr(self.copy())
+
+def nl_lazy(buf,offset=0,inet6=False):
+    """
+    The same as nl_decode(), but returns an nl_record, that holds
+    a copy of the raw message and decodes it on access
+    """
+    (length,t) = s_nlmsghdr.unpack_from(buf,offset)[:2]
+    if t < NLMSG_MIN_TYPE or t > RTM_DELADDR:
+        return nl_decode(buf,offset,inet6)
+    if t > RTM_DELLINK:
+        (family,prefixlen) = s_ifaddrmsg.unpack_from(buf,offset + s_nlmsghdr.size)[:2]
+        if prefixlen > 32 and not (inet6 and family == AF_INET6):
+            return None
+    return nl_record(buf[offset:offset + length].tobytes(),inet6)
+
+def nl_buffer(msg):
+    """
+    Get a memoryview of a message buffer. The view is cached in
+    the message object, so pool buffers create it only once.
+    """
+    try:
+        return msg.view
+    except AttributeError:
+        msg.view = memoryview((c_char * sizeof(msg)).from_buffer(msg))
+        return msg.view
+
+
 def nl_send(fd,msg,size=0):
     """
     Send a Netlink message
@@ -315,6 +945,106 @@ def nl_send(fd,msg,size=0):
 
     return libc.sendto(fd, byref(msg), size, 0, byref(sa), sizeof(sa))
 
+NLA_F_NESTED = 0x8000
+
+class nl_request (object):
+    """
+    Compact request builder. Only the header, the fixed part and
+    the attributes are encoded, so a dump request takes a few dozen
+    bytes instead of sizeof(rtnl_msg):
+
+        req = nl_request(RTM_GETLINK)
+        req.ifinfmsg(index=1)
+        req.attr(IFLA_IFNAME,"eth0\\0")
+        nl_send_raw(fd,req.encode())
+
+    Nested attributes are enclosed by nest() and end() calls.
+    """
+    def __init__(self,msg_type,flags=NLM_F_REQUEST,seq=0):
+        self.type = msg_type
+        self.flags = flags
+        self.seq = seq
+        self.data = bytearray()
+        self.nested = []
+
+    def ifinfmsg(self,family=0,type=0,index=0,flags=0,change=0):
+        self.data += s_ifinfmsg.pack(family,type,index,flags,change)
+        return self
+
+    def ifaddrmsg(self,family=0,prefixlen=0,flags=0,scope=0,index=0):
+        self.data += s_ifaddrmsg.pack(family,prefixlen,flags,scope,index)
+        return self
+
+    def rtmsg(self,family=0,dst_len=0,src_len=0,tos=0,table=0,
+              protocol=0,scope=0,type=0,flags=0):
+        self.data += s_rtmsg.pack(family,dst_len,src_len,tos,table,
+                                  protocol,scope,type,flags)
+        return self
+
+    def ndmsg(self,family=0,index=0,state=0,flags=0,type=0):
+        self.data += s_ndmsg.pack(family,index,state,flags,type)
+        return self
+
+    def if_stats_msg(self,family=0,index=0,filter_mask=0):
+        self.data += s_if_stats_msg.pack(family,index,filter_mask)
+        return self
+
+    def genlmsghdr(self,cmd,version=1):
+        self.data += s_genlmsghdr.pack(cmd,version)
+        return self
+
+    def attr(self,nla_type,data):
+        """
+        Add an attribute; data is a packed string
+        """
+        self.data += s_nlattr.pack(sizeof(nlattr) + len(data),nla_type)
+        self.data += data
+        self.data += "\0" * (NLMSG_ALIGN(len(data)) - len(data))
+        return self
+
+    def nest(self,nla_type):
+        """
+        Open a nested attribute
+        """
+        self.nested.append(len(self.data))
+        self.data += s_nlattr.pack(0,nla_type | NLA_F_NESTED)
+        return self
+
+    def end(self):
+        """
+        Close the last opened nested attribute
+        """
+        offset = self.nested.pop()
+        s_nlattr.pack_into(self.data,offset,len(self.data) - offset,
+                           s_nlattr.unpack_from(self.data,offset)[1])
+        return self
+
+    def encode(self):
+        assert not self.nested
+        return s_nlmsghdr.pack(s_nlmsghdr.size + len(self.data),
+                               self.type,self.flags,self.seq,0) + \
+               str(self.data)
+
+def nl_send_raw(fd,data):
+    """
+    Send encoded requests. Several requests, concatenated into one
+    string, are sent as one datagram.
+
+    Please note that the kernel runs only one dump per socket at a
+    time, so only one dump request can be sent in a batch.
+    """
+    sa = sockaddr()
+    sa.family = AF_NETLINK
+    sa.pid = 0
+
+    return libc.sendto(fd, data, len(data), 0, byref(sa), sizeof(sa))
+
+def nl_send_batch(fd,requests):
+    """
+    Send several nl_request objects with one syscall
+    """
+    return nl_send_raw(fd,"".join([ x.encode() for x in requests ]))
+
 def nl_recv(fd):
     """
     Receive a Netlink message
@@ -328,96 +1058,650 @@ def nl_recv(fd):
             msg = None
     return (l,msg)
 
-def nl_get(fd):
+class nl_pool (object):
+    """
+    Preallocated receive buffers. The buffers and the recvmmsg(2)
+    vector that points to them are created once and reused by
+    every recv() call, so a dump costs no rtnl_msg allocations.
+
+    The data in the buffers is valid only until the next recv()
+    call, so parse it before receiving again. A pool must not be
+    shared by several threads.
+
+    If the recorder attribute is set, every received datagram is
+    passed to recorder.write(buf,length), see nlcapture.py
+    """
+    recorder = None
+    error = 0       # errno of the last failed recv()
+
+    def __init__(self,size=NL_POOL_SIZE):
+        self.size = size
+        self.buffers = [ rtnl_msg() for x in range(size) ]
+        self.iov = (iovec * size)()
+        self.vector = (mmsghdr * size)()
+        for (i,msg) in enumerate(self.buffers):
+            self.iov[i].base = addressof(msg)
+            self.iov[i].len = sizeof(msg)
+            self.vector[i].hdr.iov = cast(byref(self.iov,i * sizeof(iovec)),POINTER(iovec))
+            self.vector[i].hdr.iovlen = 1
+        try:
+            self.recvmmsg = libc.recvmmsg
+        except AttributeError:
+            # old libc: one datagram per syscall
+            self.recvmmsg = None
+
+    def recv(self,fd,flags=MSG_WAITFORONE):
+        """
+        Receive up to self.size datagrams with one syscall. Blocks
+        only for the first one, or not at all with MSG_DONTWAIT.
+        Returns a list of (length,msg) tuples, where msg is a pool
+        buffer.
+        """
+        if self.recvmmsg is None:
+            l = libc.recvfrom(fd, byref(self.buffers[0]), sizeof(rtnl_msg),
+                              flags & MSG_DONTWAIT, 0, 0)
+            if l == -1:
+                self.error = get_errno()
+                return []
+            batch = [ (l,self.buffers[0]) ]
+        else:
+            n = self.recvmmsg(fd, byref(self.vector), self.size, flags, None)
+            if n == -1:
+                self.error = get_errno()
+                return []
+            batch = [ (self.vector[i].len,self.buffers[i]) for i in range(n)
+                        if self.buffers[i].hdr.type != NLMSG_NOOP ]
+
+        if self.recorder is not None:
+            [ self.recorder.write(nl_buffer(msg),l) for (l,msg) in batch ]
+        return batch
+
+class nl_sized_buffer (object):
+    """
+    One receive buffer, that grows to the size of the datagram:
+    MSG_PEEK|MSG_TRUNC gives the length of the next datagram before
+    it is received. It costs two syscalls per datagram, but for
+    notifications a small buffer is enough instead of 64 KiB ones.
+
+    The recv() interface is the same as of nl_pool.
+    """
+    size = 1
+    recorder = None
+    error = 0
+
+    def __init__(self,length=4096):
+        self.buffer = (c_char * length)()
+
+    def recv(self,fd,flags=MSG_WAITFORONE):
+        flags &= MSG_DONTWAIT
+        l = libc.recvfrom(fd, None, 0, flags | MSG_PEEK | MSG_TRUNC, 0, 0)
+        if l == -1:
+            self.error = get_errno()
+            return []
+        if l > sizeof(self.buffer):
+            self.buffer = (c_char * NLMSG_ALIGN(l))()
+        l = libc.recvfrom(fd, byref(self.buffer), sizeof(self.buffer), flags, 0, 0)
+        if l == -1:
+            self.error = get_errno()
+            return []
+        buf = nl_buffer(self.buffer)
+        if s_nlmsghdr.unpack_from(buf,0)[1] == NLMSG_NOOP:
+            return []
+        if self.recorder is not None:
+            self.recorder.write(buf,l)
+        return [ (l,self.buffer) ]
+
+def nl_rcvbuf(fd,size=None):
+    """
+    Set the socket receive buffer size. SO_RCVBUFFORCE is tried
+    first, since it is not limited by net.core.rmem_max. Returns
+    the actual size, set by the kernel; without size, only gets it.
     """
-    Get parsed message
+    v = c_int(size or 0)
+    if size is not None and \
+            libc.setsockopt(fd, SOL_SOCKET, SO_RCVBUFFORCE, byref(v), sizeof(v)) != 0:
+        libc.setsockopt(fd, SOL_SOCKET, SO_RCVBUF, byref(v), sizeof(v))
+    l = c_uint32(sizeof(v))
+    libc.getsockopt(fd, SOL_SOCKET, SO_RCVBUF, byref(v), byref(l))
+    return v.value
+
+def nl_iter(fd,pool=None,inet6=False,seq=None,decode=nl_decode):
+    """
+    Iterate parsed messages of a dump. Only one datagram (or one
+    batch of datagrams, if a pool is given) is kept in memory at a
+    time, so memory does not grow with the dump size.
+
+    If seq is given, messages with other sequence numbers (replies
+    to the finished requests, notifications) are skipped. But if the
+    caller stops the iteration before the dump end, the dump goes on
+    in the kernel, and the next dump request on the socket fails with
+    EBUSY, so such a socket must be closed.
+
+    Messages are decoded with nl_decode(), or with nl_lazy(), if it
+    is passed as decode.
     """
-    result = []
     end = False
     while not end:
-        bias = 0
-        (l,msg) = nl_recv(fd)
-        while bias < l:
-            x = rtnl_msg.from_address(addressof(msg) + bias)
-            bias += x.hdr.length
-            parsed = nl_parse(x)
-            if isinstance(parsed,dict):
-                result.append(parsed)
-            if not ((x.hdr.type > NLMSG_DONE) and (x.hdr.flags & NLM_F_MULTI)):
-                end = True
-                break
-    return result
+        if pool is None:
+            batch = [ nl_recv(fd) ]
+        else:
+            batch = pool.recv(fd)
+        # parse the whole batch before yielding anything, so the
+        # pool buffers are free, even if the caller uses the pool
+        # for another dump in the meantime
+        result = []
+        for (l,msg) in batch:
+            if msg is None or end:
+                continue
+            end = nl_get_datagram(msg,l,result,inet6,seq,decode)
+        for x in result:
+            yield x
+
+def nl_get(fd,pool=None,inet6=False,decode=nl_decode):
+    """
+    Get parsed message. With a pool, datagrams are received in
+    bulk into the pool's buffers instead of a new rtnl_msg
+    per datagram.
+    """
+    return list(nl_iter(fd,pool,inet6,decode=decode))
 
-def nlconfig():
+def nl_get_datagram(msg,l,result,inet6=False,seq=None,decode=nl_decode):
     """
-    Extra light RT netlink client.
-    For speed, it uses ctypes data representation instead of pack/unpack
+    Parse all messages of one datagram into the result list.
+    Returns True, if the datagram terminates the dump.
+    """
+    buf = nl_buffer(msg)
+    unpack_hdr = s_nlmsghdr.unpack_from
+    bias = 0
+    while bias < l:
+        (length,t,flags,sequence_number) = unpack_hdr(buf,bias)[:4]
+        if length == 0:
+            return True
+        if seq is not None and sequence_number != seq:
+            # a notification or a reply to another request
+            bias += length
+            continue
+        parsed = decode(buf,bias,inet6)
+        if parsed is not None:
+            result.append(parsed)
+        if not ((t > NLMSG_DONE) and (flags & NLM_F_MULTI)):
+            return True
+        bias += length
+    return False
+
+def nl_dump_iter(fd,pool=None,inet6=False,seq=None):
+    """
+    nl_iter() for dumps: an NLMSG_ERROR reply raises OSError,
+    instead of ending the dump with an empty record
+    """
+    for x in nl_iter(fd,pool,inet6,seq):
+        if x.get('error'):
+            raise OSError(-x['error'],strerror(-x['error']))
+        yield x
 
-    links and interfaces data
+# The default receive pool, created on the first use
+default_pool = None
 
+def nl_default_pool():
+    """
+    Get the module-wide receive pool
     """
+    global default_pool
 
-    ret = {}
+    if default_pool is None:
+        default_pool = nl_pool()
+    return default_pool
 
-    # create netlink socket, suitable to work with ctypes structures
-    s = libc.socket(AF_NETLINK,SOCK_RAW,NETLINK_ROUTE)
+def nl_socket(groups=RTNLGRP_IPV4_IFADDR | RTNLGRP_LINK,protocol=NETLINK_ROUTE):
+    """
+    Create netlink socket, suitable to work with ctypes structures
+    """
+    s = libc.socket(AF_NETLINK,SOCK_RAW,protocol)
     sa = sockaddr()
     sa.family = AF_NETLINK
     sa.pid = 0
-    sa.groups = RTNLGRP_IPV4_IFADDR | RTNLGRP_LINK
+    sa.groups = groups
 
     # subscribe only for addr and link events
     l = libc.bind(s, byref(sa), sizeof(sa))
     if l != 0:
         libc.close(s)
         raise Exception("libc.bind(): errcode %i" % (l))
+    return s
 
-    # prepare a request
-    msg = rtnl_msg()
-    msg.hdr.flags = NLM_F_DUMP | NLM_F_REQUEST
-
-
-    # ask for all links
-    msg.hdr.type = RTM_GETLINK
-    nl_send(s,msg)
-
-    # get only devices list, map them to a dictionary
-    [ ret.__setitem__(x['dev'],x) for x in nl_get(s) if x.has_key('dev') ]
-    # clean up
-    [ (
-        # remove internal info
-        ret[x].__delitem__('dev'),
-        ret[x].__delitem__('type'),
-        # add empty netmask and addr, as it does ifconfig routine
-        ret[x].__setitem__('netmask',''),
-        ret[x].__setitem__('addr','')
-      ) for x in ret.keys() ]
+def nl_dump(fd,pool=None,seq=None):
+    """
+    Dump links and then addresses over an open socket, yielding
+    records with the "dev" key. If seq is given, the requests get
+    sequence numbers seq and seq + 1, and only the replies to them
+    are parsed.
+    """
+    for (t,body) in ((RTM_GETLINK,"ifinfmsg"),(RTM_GETADDR,"ifaddrmsg")):
+        req = nl_request(t,NLM_F_DUMP | NLM_F_REQUEST,seq or 0)
+        getattr(req,body)()
+        nl_send_raw(fd,req.encode())
+        for x in nl_dump_iter(fd,pool,seq=seq):
+            if x.has_key('dev'):
+                yield x
+        if seq is not None:
+            seq += 1
+
+def nl_route_dump(fd,pool=None,seq=None,family=AF_INET):
+    """
+    Dump routes of all the tables over an open socket, yielding
+    route records; see nl_dump() for seq
+    """
+    req = nl_request(RTM_GETROUTE,NLM_F_DUMP | NLM_F_REQUEST,seq or 0)
+    req.rtmsg(family=family)
+    nl_send_raw(fd,req.encode())
+    for x in nl_dump_iter(fd,pool,inet6=family == AF_INET6,seq=seq):
+        if x['type'] == 'route':
+            yield x
+
+def nl_neigh_dump(fd,pool=None,seq=None,family=0):
+    """
+    Dump neighbours of one family (or 0 for all) over an open socket,
+    yielding neighbour records; see nl_dump() for seq
+    """
+    req = nl_request(RTM_GETNEIGH,NLM_F_DUMP | NLM_F_REQUEST,seq or 0)
+    req.ndmsg(family=family)
+    nl_send_raw(fd,req.encode())
+    for x in nl_dump_iter(fd,pool,inet6=family != AF_INET,seq=seq):
+        if x['type'] == 'neigh':
+            yield x
+
+def nl_sequence(seq,count=1):
+    """
+    Get the first of count consecutive sequence numbers after seq.
+    The numbers wrap within 1..0xffffffff: 0 is skipped, and a range
+    never crosses the top, so the last number is first + count - 1.
+    """
+    if seq + count > 0xffffffff:
+        seq = 0
+    return seq + 1
+
+class nl_channel (object):
+    """
+    A netlink socket with its own port id, sequence numbers and
+    receive buffers. A channel must be used by one thread at a time.
+    """
+    def __init__(self,groups=RTNLGRP_NONE):
+        self.fd = nl_socket(groups)
+        self.pool = nl_pool()
+        self.seq = 0
+
+        # get the port id, assigned by the kernel on bind()
+        sa = sockaddr()
+        l = c_uint32(sizeof(sa))
+        libc.getsockname(self.fd, byref(sa), byref(l))
+        self.pid = sa.pid
+
+    def sequence(self,count=1):
+        """
+        Allocate count sequence numbers, return the first one
+        """
+        seq = nl_sequence(self.seq,count)
+        self.seq = seq + count - 1
+        return seq
+
+    def dump(self):
+        """
+        Dump links and addresses, see nl_dump()
+        """
+        return nl_dump(self.fd,self.pool,self.sequence(2))
+
+    def dump_routes(self,family=AF_INET):
+        """
+        Dump routes, see nl_route_dump()
+        """
+        return nl_route_dump(self.fd,self.pool,self.sequence(),family)
+
+    def dump_neighs(self,family=0):
+        """
+        Dump neighbours, see nl_neigh_dump()
+        """
+        return nl_neigh_dump(self.fd,self.pool,self.sequence(),family)
+
+    def close(self):
+        libc.close(self.fd)
+
+class nl_socket_pool (object):
+    """
+    A pool of netlink channels for concurrent dumps. Channels are
+    created on demand, up to size; acquire() blocks, while all of
+    them are busy.
+    """
+    def __init__(self,size=4):
+        self.size = size
+        self.created = 0
+        self.free = Queue()
+        self.lock = Lock()
+
+    def acquire(self):
+        if self.free.empty():
+            self.lock.acquire()
+            try:
+                if self.created < self.size:
+                    self.created += 1
+                    return nl_channel()
+            finally:
+                self.lock.release()
+        return self.free.get()
+
+    def release(self,channel):
+        self.free.put(channel)
+
+    def discard(self,channel):
+        """
+        Close a channel, that can not be reused (e.g. with a dump
+        in progress), and put a new one in its place
+        """
+        channel.close()
+        self.free.put(nl_channel())
+
+    def close(self):
+        while self.created:
+            self.free.get().close()
+            self.created -= 1
+
+def nlconfig_iter(pool=None,sockets=None):
+    """
+    Streaming RT netlink client: dump links and then addresses,
+    yielding records in the nl_parse() format as the datagrams
+    arrive. Only records with the "dev" key are returned.
+
+    The socket is closed (or returned to the socket pool) when the
+    generator is exhausted or closed, so the caller can stop the
+    iteration at any time. A pooled socket is returned only after
+    the complete dump, otherwise it is replaced, see nl_iter().
+    """
+    if sockets is not None:
+        channel = sockets.acquire()
+        done = False
+        try:
+            for x in channel.dump():
+                yield x
+            done = True
+        finally:
+            if done:
+                sockets.release(channel)
+            else:
+                sockets.discard(channel)
+        return
+
+    if pool is None:
+        pool = nl_default_pool()
+
+    s = nl_socket()
+    try:
+        for x in nl_dump(s,pool):
+            yield x
+    finally:
+        libc.close(s)
+
+def nl_strict(fd):
+    """
+    Ask the kernel to check dump requests strictly and to apply
+    the filters from the request header. Returns False, if the
+    kernel does not support it (before 4.20).
+    """
+    v = c_int(1)
+    return libc.setsockopt(fd, SOL_NETLINK, NETLINK_GET_STRICT_CHK,
+                           byref(v), sizeof(v)) == 0
+
+def nl_get_link_request(index=0,name=None,seq=0):
+    """
+    Build RTM_GETLINK request for one link
+    """
+    req = nl_request(RTM_GETLINK,seq=seq).ifinfmsg(index=index)
+    if name is not None:
+        req.attr(IFLA_IFNAME,name + "\0")
+    return req
+
+def nl_link(index=0,name=None,pool=None):
+    """
+    Get one link by index or by name with a targeted RTM_GETLINK
+    request. Returns the nl_decode() record or None, if there is
+    no such link. If the kernel can not look up links by name,
+    the links dump is filtered instead.
+    """
+    s = nl_socket(RTNLGRP_NONE)
+    try:
+        nl_send_raw(s,nl_get_link_request(index,name).encode())
+
+        error = 0
+        for x in nl_iter(s,pool):
+            if x.has_key('dev'):
+                return x
+            error = x.get('error',error)
+        if error == -ENODEV:
+            return None
+
+        # fall back to the client-side filter
+        req = nl_request(RTM_GETLINK,NLM_F_DUMP | NLM_F_REQUEST)
+        nl_send_raw(s,req.ifinfmsg().encode())
+        for x in nl_iter(s,pool):
+            if x.has_key('dev') and \
+                    ((name is None and x['index'] == index) or x['dev'] == name):
+                return x
+        return None
+    finally:
+        libc.close(s)
+
+def nl_links_dump(fd,indexes=(),names=(),pool=None,seq=None):
+    """
+    Get links by indexes and/or names from one links dump, see
+    nl_links()
+    """
+    req = nl_request(RTM_GETLINK,NLM_F_DUMP | NLM_F_REQUEST,seq or 0)
+    nl_send_raw(fd,req.ifinfmsg().encode())
+    by_index = {}
+    by_name = {}
+    for x in nl_dump_iter(fd,pool,seq=seq):
+        if x.has_key('dev'):
+            by_index[x['index']] = by_name[x['dev']] = x
+    return [ by_index.get(x) for x in indexes ] + \
+           [ by_name.get(x) for x in names ]
+
+def nl_links(indexes=(),names=(),pool=None):
+    """
+    Get several links by indexes and/or names with batches of
+    RTM_GETLINK requests, one syscall per batch. Returns the list
+    of records (or None for missing links) in the request order:
+    indexes first, names next.
+
+    A batch is not sent, until the replies to the previous one are
+    received, and it is limited, so the replies fit into the socket
+    receive buffer. If replies are lost anyway (ENOBUFS), the links
+    are taken from one links dump instead.
+    """
+    requests = [ nl_get_link_request(index=x,seq=i + 1)
+                    for (i,x) in enumerate(indexes) ] + \
+               [ nl_get_link_request(name=x,seq=i + 1 + len(indexes))
+                    for (i,x) in enumerate(names) ]
+    if not requests:
+        return []
+    if pool is None:
+        pool = nl_default_pool()
+
+    replies = {}
+    s = nl_socket(RTNLGRP_NONE)
+    try:
+        chunk = max(nl_rcvbuf(s) // NL_LINK_REPLY_SIZE,1)
+        for start in xrange(0,len(requests),chunk):
+            batch = requests[start:start + chunk]
+            nl_send_batch(s,batch)
+            pending = set([ x.seq for x in batch ])
+            while pending:
+                pool.error = 0
+                received = pool.recv(s)
+                if pool.error == EINTR:
+                    continue
+                elif pool.error == ENOBUFS:
+                    # replies are lost; the rest of them in the socket
+                    # are skipped by the sequence number of the dump
+                    return nl_links_dump(s,indexes,names,pool,len(requests) + 1)
+                elif pool.error:
+                    raise OSError(pool.error,strerror(pool.error))
+                for (l,msg) in received:
+                    seq = s_nlmsghdr.unpack_from(nl_buffer(msg),0)[3]
+                    result = []
+                    nl_get_datagram(msg,l,result)
+                    replies[seq] = result and result[0] or {}
+                    pending.discard(seq)
+    finally:
+        libc.close(s)
+
+    ret = []
+    for req in requests:
+        x = replies.get(req.seq,{})
+        if x.has_key('dev'):
+            ret.append(x)
+        elif x.get('error') == -ENODEV:
+            ret.append(None)
+        else:
+            # no lookup by name: use the fallback of nl_link()
+            if req.seq > len(indexes):
+                ret.append(nl_link(name=names[req.seq - len(indexes) - 1],pool=pool))
+            else:
+                ret.append(nl_link(index=indexes[req.seq - 1],pool=pool))
+    return ret
+
+def nl_addrs(index=0,name=None,family=AF_INET,pool=None):
+    """
+    Get addresses of one interface (by index or name) and/or one
+    family (AF_INET, AF_INET6 or 0 for all). The filter is applied
+    by the kernel, if it supports strict checking, and by the client
+    otherwise.
+    """
+    if name is not None:
+        link = nl_link(name=name,pool=pool)
+        if link is None:
+            return []
+        index = link['index']
+
+    s = nl_socket(RTNLGRP_NONE)
+    try:
+        nl_strict(s)
+        req = nl_request(RTM_GETADDR,NLM_F_DUMP | NLM_F_REQUEST)
+        nl_send_raw(s,req.ifaddrmsg(family=family,index=index).encode())
+        return [ x for x in nl_iter(s,pool,family != AF_INET)
+                    if x['type'] == 'address' and
+                        (not index or x['index'] == index) and
+                        (not family or x['family'] == family) ]
+    finally:
+        libc.close(s)
+
+def nl_routes(family=AF_INET,table=None,pool=None):
+    """
+    Get routes of one family, from all the tables or from one
+    """
+    s = nl_socket(RTNLGRP_NONE)
+    try:
+        return [ x for x in nl_route_dump(s,pool,family=family)
+                    if table is None or x['table'] == table ]
+    finally:
+        libc.close(s)
+
+def nl_neighs(family=0,index=0,pool=None):
+    """
+    Get neighbours of one family (AF_INET, AF_INET6 or 0 for all)
+    and, optionally, one interface
+    """
+    s = nl_socket(RTNLGRP_NONE)
+    try:
+        return [ x for x in nl_neigh_dump(s,pool,family=family)
+                    if not index or x['index'] == index ]
+    finally:
+        libc.close(s)
+
+def nlconfig_dev(name,pool=None):
+    """
+    Get one nlconfig() entry without dumping all the links: one
+    RTM_GETLINK request and one filtered RTM_GETADDR dump. Returns
+    None, if there is no such interface (or alias).
+    """
+    link = nl_link(name=name.split(":")[0],pool=pool)
+    if link is None:
+        return None
+
+    ret = {
+        'hwaddr': link['hwaddr'],
+        'netmask': '',
+        'addr': '',
+    }
     # fix hwaddr for loopback: the original ifconfig returns an empty string
-    if ret.has_key("lo"):
-        ret["lo"]["hwaddr"] = ""
-
-    # ask for all addrs
-    msg.hdr.type = RTM_GETADDR
-    nl_send(s,msg)
-
-    # get addrs
-    result = nl_get(s)
-    # emulate "alias interfaces" *)
-    [ ret.__setitem__(x,copy(ret[x[:x.find(":")]])) for x in
-        [ y["dev"] for y in result if y.has_key("dev")] if x.find(":") > -1 ]
-    # put addresses by interfaces (and aliases)
-    [ (
+    if link['dev'] == 'lo':
+        ret['hwaddr'] = ''
+
+    for x in nl_addrs(index=link['index'],pool=pool):
+        if x.get('dev') == name and x.has_key('local'):
+            ret['addr'] = x['local']
+            ret['netmask'] = x['mask']
+            return ret
+
+    # "alias interfaces" exist only with addresses
+    if name.find(":") > -1:
+        return None
+    return ret
+
+def nlconfig(pool=None,sockets=None):
+    """
+    Extra light RT netlink client.
+    For speed, it uses ctypes data representation instead of pack/unpack
+
+    links and interfaces data
+
+    The result is built in one pass over nlconfig_iter(), so no
+    intermediate list of the dump records is created.
+    """
+    return nlconfig_build(nlconfig_iter(pool,sockets))
+
+def nlconfig_build(records):
+    """
+    Build the nlconfig() dictionary from link records, followed
+    by address records
+    """
+
+    ret = {}
+
+    for x in records:
+
+        if x['type'] == 'link':
+            # add empty netmask and addr, as it does ifconfig routine;
+            # remove internal info
+            ret[x['dev']] = {
+                'hwaddr': x['hwaddr'],
+                'netmask': '',
+                'addr': '',
+            }
+            # fix hwaddr for loopback: the original ifconfig returns an
+            # empty string
+            if x['dev'] == 'lo':
+                ret['lo']['hwaddr'] = ''
+            continue
+
+        if x['type'] != 'address':
+            continue
+
+        # emulate "alias interfaces" *)
+        if x['dev'].find(":") > -1 and not ret.has_key(x['dev']):
+            ret[x['dev']] = copy(ret[x['dev'][:x['dev'].find(":")]])
+            ret[x['dev']]['addr'] = ''
+            ret[x['dev']]['netmask'] = ''
+
+        # put addresses by interfaces (and aliases)
+        #
         # use a label to identify an interface
         #
         # strictly speaking, it is not correct, we should use interface
         # indexes, but here we emulate ifconfig...
-        ret[x['dev']].__setitem__("addr",x['local']),
-        ret[x['dev']].__setitem__("netmask",x['mask'])
-      ) for x in
+        #
         # fetch only the first address for an interface (or alias), just as
         # ifconfig does. All secondary addresses in this case are ignored.
-        result if x['type'] == 'address' and ret[x['dev']]['addr'] == ""
-        ]
+        if ret[x['dev']]['addr'] == '':
+            ret[x['dev']]['addr'] = x['local']
+            ret[x['dev']]['netmask'] = x['mask']
 
     #
     # *) actually, "alias interfaces" model is deprecated
@@ -425,7 +1709,6 @@ def nlconfig():
     # usage for network configuration
     #
 
-    libc.close(s)
     return ret
 
 if __name__ == "__main__":
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+#
+#     Copyright (c) 2011 Red Hat, Inc; ALT Linux Team; Peter V. Saveliev
+#
+#     This file was written for VDSM project and uses code from Connexion
+#     library.
+#
+#     Connexion is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Connexion is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Connexion; if not, write to the Free Software
+#     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+ethtool settings of all the interfaces over the ETHTOOL generic
+netlink family (Linux 5.6+), instead of ethtool ioctls per device:
+
+    ifaces = ethconfig()
+
+ethconfig() returns the nlconfig() dictionary, where every interface
+has also the ethtool keys (for the interfaces, that support them):
+
+    link modes: "autoneg", "speed", "duplex", "lanes", "link_modes"
+    features:   "features" -- the names of the active features
+    rings:      "rx_ring", "tx_ring", "rx_ring_max", "tx_ring_max", ...
+    channels:   "rx_channels", "tx_channels", "combined_channels", ...
+
+The values are the same, as the kernel sends them: speed -1 is
+unknown, duplex 0 is half, 1 is full and 255 is unknown.
+
+Every group of settings is one dump for all the devices, so four
+dumps over one socket replace three ioctls per device. Bitsets are
+requested in the compact form and decoded with the feature and link
+mode names, that are loaded once; "features" and "link_modes" (the
+advertised modes) are tuples, shared by the devices with the same
+bits, so they must not be modified.
+
+nl_ethtool() returns the merged records by interface index, without
+nlconfig() data. On kernels without the ETHTOOL family it raises
+OSError (ENOENT), and ethconfig() returns plain nlconfig() data.
+"""
+
+from array import array
+from errno import ENOENT
+from os import strerror
+
+from nlconfig import nl_socket, nl_iter, nl_send_raw, nl_request, nl_default_pool
+from nlconfig import nlconfig, libc, d_u8, d_u16, d_u32, d_asciiz
+from nlconfig import s_nlmsghdr, s_genlmsghdr, s_nlattr, s_i32, s_u32
+from nlconfig import NETLINK_GENERIC, RTNLGRP_NONE, NLMSG_ERROR, NLA_TYPE_MASK
+from nlconfig import NLM_F_DUMP, NLM_F_REQUEST
+
+__all__ = [ "ethconfig", "nl_ethtool" ]
+
+## generic netlink controller
+GENL_ID_CTRL = 0x10
+CTRL_CMD_NEWFAMILY = 1
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+## ethtool requests and replies
+ETHTOOL_MSG_STRSET_GET = 1
+ETHTOOL_MSG_LINKMODES_GET = 4
+ETHTOOL_MSG_FEATURES_GET = 11
+ETHTOOL_MSG_RINGS_GET = 15
+ETHTOOL_MSG_CHANNELS_GET = 17
+ETHTOOL_MSG_STRSET_GET_REPLY = 1
+ETHTOOL_MSG_LINKMODES_GET_REPLY = 4
+ETHTOOL_MSG_FEATURES_GET_REPLY = 11
+ETHTOOL_MSG_RINGS_GET_REPLY = 16
+ETHTOOL_MSG_CHANNELS_GET_REPLY = 18
+
+## the request header, the first attribute of every message
+ETHTOOL_A_HEADER = 1
+ETHTOOL_A_HEADER_DEV_INDEX = 1
+ETHTOOL_A_HEADER_DEV_NAME = 2
+ETHTOOL_A_HEADER_FLAGS = 3
+ETHTOOL_FLAG_COMPACT_BITSETS = 1
+
+## compact bitsets
+ETHTOOL_A_BITSET_VALUE = 4
+
+## string sets
+ETHTOOL_A_STRSET_STRINGSETS = 2
+ETHTOOL_A_STRINGSETS_STRINGSET = 1
+ETHTOOL_A_STRINGSET_ID = 1
+ETHTOOL_A_STRINGSET_STRINGS = 3
+ETHTOOL_A_STRINGS_STRING = 1
+ETHTOOL_A_STRING_INDEX = 1
+ETHTOOL_A_STRING_VALUE = 2
+ETH_SS_FEATURES = 4
+ETH_SS_LINK_MODES = 9
+
+# offset of the attributes: nlmsghdr and genlmsghdr
+GENL_ATTR_OFFSET = s_nlmsghdr.size + s_genlmsghdr.size
+
+def nl_attrs(buf,ptr,end):
+    """
+    Iterate (type, offset, length) of the attributes
+    """
+    unpack_attr = s_nlattr.unpack_from
+    while ptr + 4 <= end:
+        (l,a) = unpack_attr(buf,ptr)
+        if l < 4:
+            break
+        yield (a & NLA_TYPE_MASK,ptr + 4,l - 4)
+        ptr += (l + 3) & ~3
+
+def d_i32(buf,offset,length):
+    return s_i32.unpack_from(buf,offset)[0]
+
+# string sets: { id: { bit: name } }, loaded with the family id
+strings = {}
+# decoded bitsets: (string set, value) -> names. Most devices have
+# the same features, so a bitset is usually decoded once.
+bitsets = {}
+
+def d_bitset(sset):
+    """
+    Get a decoder of compact bitsets, that returns a tuple of the
+    names of the set bits
+    """
+    def decode(buf,offset,length):
+        for (a,ptr,l) in nl_attrs(buf,offset,offset + length):
+            if a != ETHTOOL_A_BITSET_VALUE:
+                continue
+            key = (sset,buf[ptr:ptr + l].tobytes())
+            names = bitsets.get(key)
+            if names is None:
+                names = bitsets[key] = nl_bits(key[1],strings.get(sset,{}))
+            return names
+        return ()
+    return decode
+
+def nl_bits(value,names):
+    ret = []
+    for (n,word) in enumerate(array("I",value)):
+        bit = n * 32
+        while word:
+            if word & 1:
+                ret.append(names.get(bit,str(bit)))
+            (word,bit) = (word >> 1,bit + 1)
+    return tuple(ret)
+
+def d_strings(buf,offset,length):
+    """
+    Decode ETHTOOL_A_STRSET_STRINGSETS: { id: { index: name } }
+    """
+    ret = {}
+    for (a,ptr,l) in nl_attrs(buf,offset,offset + length):
+        if a != ETHTOOL_A_STRINGSETS_STRINGSET:
+            continue
+        (sset,names) = (None,{})
+        for (b,bptr,bl) in nl_attrs(buf,ptr,ptr + l):
+            if b == ETHTOOL_A_STRINGSET_ID:
+                sset = d_u32(buf,bptr,bl)
+            elif b == ETHTOOL_A_STRINGSET_STRINGS:
+                for (c,cptr,cl) in nl_attrs(buf,bptr,bptr + bl):
+                    if c != ETHTOOL_A_STRINGS_STRING:
+                        continue
+                    (index,name) = (None,None)
+                    for (d,dptr,dl) in nl_attrs(buf,cptr,cptr + cl):
+                        if d == ETHTOOL_A_STRING_INDEX:
+                            index = d_u32(buf,dptr,dl)
+                        elif d == ETHTOOL_A_STRING_VALUE:
+                            name = d_asciiz(buf,dptr,dl)
+                    names[index] = name
+        ret[sset] = names
+    return ret
+
+s_strset_attr = {
+            ETHTOOL_A_STRSET_STRINGSETS:    ("strings", d_strings),
+        }
+
+s_linkmodes_attr = {
+            2:  ("autoneg",             d_u8),
+            3:  ("link_modes",          d_bitset(ETH_SS_LINK_MODES)),
+            5:  ("speed",               d_i32),
+            6:  ("duplex",              d_u8),
+            9:  ("lanes",               d_u32),
+        }
+
+s_features_attr = {
+            4:  ("features",            d_bitset(ETH_SS_FEATURES)),
+        }
+
+s_rings_attr = {
+            2:  ("rx_ring_max",         d_u32),
+            3:  ("rx_mini_ring_max",    d_u32),
+            4:  ("rx_jumbo_ring_max",   d_u32),
+            5:  ("tx_ring_max",         d_u32),
+            6:  ("rx_ring",             d_u32),
+            7:  ("rx_mini_ring",        d_u32),
+            8:  ("rx_jumbo_ring",       d_u32),
+            9:  ("tx_ring",             d_u32),
+        }
+
+s_channels_attr = {
+            2:  ("rx_channels_max",         d_u32),
+            3:  ("tx_channels_max",         d_u32),
+            4:  ("other_channels_max",      d_u32),
+            5:  ("combined_channels_max",   d_u32),
+            6:  ("rx_channels",             d_u32),
+            7:  ("tx_channels",             d_u32),
+            8:  ("other_channels",          d_u32),
+            9:  ("combined_channels",       d_u32),
+        }
+
+# request -> (reply, attribute table)
+s_ethtool_msg = {
+            ETHTOOL_MSG_LINKMODES_GET:
+                (ETHTOOL_MSG_LINKMODES_GET_REPLY,   s_linkmodes_attr),
+            ETHTOOL_MSG_FEATURES_GET:
+                (ETHTOOL_MSG_FEATURES_GET_REPLY,    s_features_attr),
+            ETHTOOL_MSG_RINGS_GET:
+                (ETHTOOL_MSG_RINGS_GET_REPLY,       s_rings_attr),
+            ETHTOOL_MSG_CHANNELS_GET:
+                (ETHTOOL_MSG_CHANNELS_GET_REPLY,    s_channels_attr),
+        }
+s_ethtool_reply = dict([ x for x in s_ethtool_msg.values() ])
+s_ethtool_reply[ETHTOOL_MSG_STRSET_GET_REPLY] = s_strset_attr
+
+def nl_genl_decode(buf,offset=0,inet6=False):
+    """
+    Decode a generic netlink message: ethtool replies into records
+    with "index" and "dev" keys (string sets: "strings"),
+    controller replies into
+    { "family": id }, errors into { "error": code }
+    """
+    (length,t) = s_nlmsghdr.unpack_from(buf,offset)[:2]
+    if t == NLMSG_ERROR:
+        return { "error": s_i32.unpack_from(buf,offset + s_nlmsghdr.size)[0] }
+    cmd = s_genlmsghdr.unpack_from(buf,offset + s_nlmsghdr.size)[0]
+    attrs = nl_attrs(buf,offset + GENL_ATTR_OFFSET,offset + length)
+    if t == GENL_ID_CTRL:
+        if cmd != CTRL_CMD_NEWFAMILY:
+            return None
+        for (a,ptr,l) in attrs:
+            if a == CTRL_ATTR_FAMILY_ID:
+                return { "family": d_u16(buf,ptr,l) }
+        return None
+    at = s_ethtool_reply.get(cmd)
+    if at is None:
+        return None
+    r = {}
+    for (a,ptr,l) in attrs:
+        if a == ETHTOOL_A_HEADER:
+            for (h,hptr,hl) in nl_attrs(buf,ptr,ptr + l):
+                if h == ETHTOOL_A_HEADER_DEV_INDEX:
+                    r['index'] = d_u32(buf,hptr,hl)
+                elif h == ETHTOOL_A_HEADER_DEV_NAME:
+                    r['dev'] = d_asciiz(buf,hptr,hl)
+            continue
+        d = at.get(a)
+        if d is not None:
+            r[d[0]] = d[1](buf,ptr,l)
+    return r
+
+# ETHTOOL family id, resolved on the first use; generic netlink
+# family ids are the same in all the network namespaces
+family = None
+
+def nl_genl_get(fd,pool,req):
+    """
+    Send a request and get the reply record; an error reply
+    raises OSError
+    """
+    nl_send_raw(fd,req.encode())
+    ret = {}
+    for x in nl_iter(fd,pool,decode=nl_genl_decode):
+        if x.get('error',0) != 0:
+            raise OSError(-x['error'],"generic netlink request: %s" % (strerror(-x['error'])))
+        ret.update(x)
+    return ret
+
+def nl_ethtool_family(fd,pool=None):
+    """
+    Get the ETHTOOL generic netlink family id; the string sets
+    are loaded at the same time
+    """
+    global family
+
+    if family is None:
+        req = nl_request(GENL_ID_CTRL).genlmsghdr(CTRL_CMD_GETFAMILY)
+        req.attr(CTRL_ATTR_FAMILY_NAME,"ethtool\0")
+        fid = nl_genl_get(fd,pool,req)['family']
+        # feature and link mode names are the same for all the
+        # devices, so they are asked without a device
+        req = nl_request(fid).genlmsghdr(ETHTOOL_MSG_STRSET_GET)
+        req.nest(ETHTOOL_A_HEADER).end()
+        req.nest(ETHTOOL_A_STRSET_STRINGSETS)
+        for sset in (ETH_SS_FEATURES,ETH_SS_LINK_MODES):
+            req.nest(ETHTOOL_A_STRINGSETS_STRINGSET)
+            req.attr(ETHTOOL_A_STRINGSET_ID,s_u32.pack(sset))
+            req.end()
+        req.end()
+        strings.update(nl_genl_get(fd,pool,req).get('strings',{}))
+        family = fid
+    return family
+
+def nl_ethtool_dump(fd,pool=None,seq=1):
+    """
+    Dump the ethtool settings over an open generic netlink socket,
+    yielding one record per device and group of settings. Groups,
+    that the kernel does not support, are skipped.
+    """
+    fid = nl_ethtool_family(fd,pool)
+    for cmd in (ETHTOOL_MSG_LINKMODES_GET,ETHTOOL_MSG_FEATURES_GET,
+                ETHTOOL_MSG_RINGS_GET,ETHTOOL_MSG_CHANNELS_GET):
+        req = nl_request(fid,NLM_F_DUMP | NLM_F_REQUEST,seq).genlmsghdr(cmd)
+        # no device in the header: all the devices
+        req.nest(ETHTOOL_A_HEADER)
+        req.attr(ETHTOOL_A_HEADER_FLAGS,s_u32.pack(ETHTOOL_FLAG_COMPACT_BITSETS))
+        req.end()
+        nl_send_raw(fd,req.encode())
+        for x in nl_iter(fd,pool,seq=seq,decode=nl_genl_decode):
+            if x.has_key('index'):
+                yield x
+        seq += 1
+
+def nl_ethtool(pool=None):
+    """
+    Get ethtool settings of all the devices: { index: record }
+    """
+    if pool is None:
+        pool = nl_default_pool()
+    ret = {}
+    s = nl_socket(RTNLGRP_NONE,NETLINK_GENERIC)
+    try:
+        for x in nl_ethtool_dump(s,pool):
+            r = ret.get(x['index'])
+            if r is None:
+                ret[x['index']] = x
+            else:
+                r.update(x)
+    finally:
+        libc.close(s)
+    return ret
+
+def ethconfig(pool=None):
+    """
+    Get nlconfig() data with the ethtool settings merged into the
+    interface entries; alias interfaces get the settings of the
+    device. Without the ETHTOOL family, the entries are returned
+    as they are.
+    """
+    ret = nlconfig(pool)
+    try:
+        ethtool = nl_ethtool(pool)
+    except OSError, e:
+        if e.errno != ENOENT:
+            raise
+        # no ETHTOOL family in the kernel
+        return ret
+    devices = dict([ (x['dev'],x) for x in ethtool.values() if x.has_key('dev') ])
+    for (name,iface) in ret.items():
+        x = devices.get(name.split(":")[0])
+        if x is not None:
+            iface.update(x)
+            del iface['index']
+            del iface['dev']
+    return ret
+
+
+if __name__ == "__main__":
+    for (name,iface) in sorted(ethconfig().items()):
+        print name, iface
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+#
+#     Copyright (c) 2011 Red Hat, Inc; ALT Linux Team; Peter V. Saveliev
+#
+#     This file was written for VDSM project and uses code from Connexion
+#     library.
+#
+#     Connexion is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Connexion is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Connexion; if not, write to the Free Software
+#     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+Neighbour (ARP/NDP) cache:
+
+    cache = NLNeighCache()
+    lladdr = cache.lookup(2,"10.1.0.1")
+    for (index,address) in cache.find("00:02:b3:39:2e:4c"):
+        ...
+
+NLNeighCache dumps IPv4 and IPv6 neighbours once and then applies
+RTM_NEWNEIGH/RTM_DELNEIGH notifications from RTNLGRP_NEIGH, just as
+NLConfigCache does for links and addresses, including the overrun
+recovery. Lookups are dictionary lookups, no requests are sent to
+the kernel. Unlike the other caches, lookup() does not read pending
+notifications by itself: state changes of the neighbours are
+frequent, so update() should be called from a poll loop or run()
+from a thread.
+
+The data is kept in an nl_neigh_table: entries hashed by (ifindex,
+address), with the link layer address and the NUD state, and an
+index of the entries by the link layer address. An address, that
+belongs to one entry only -- the common case -- is indexed without
+a list.
+"""
+
+from nlconfig import nl_socket, nl_neigh_dump, libc
+from nlconfig import RTNLGRP_NONE, RTNLGRP_NEIGH
+from nlcache import NLEventCache
+
+__all__ = [ "NLNeighCache", "nl_neigh_table" ]
+
+
+class nl_neigh_table (object):
+    """
+    Neighbours, added and removed by neighbour records (from
+    nl_decode() or cxnet neigh events)
+    """
+    def __init__(self):
+        self.entries = {}       # (index,dest) -> (lladdr,state)
+        self.lladdrs = {}       # lladdr -> (index,dest) or [ (index,dest), ... ]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def apply(self,x):
+        if x['action'] == 'add':
+            self.add(x)
+        else:
+            self.remove(x)
+
+    def add(self,x):
+        key = (x['index'],x['dest'])
+        lladdr = x.get('lladdr')
+        old = self.entries.get(key)
+        self.entries[key] = (lladdr,x.get('state'))
+        if old is not None:
+            if old[0] == lladdr:
+                return
+            self.unlink(old[0],key)
+        if lladdr is None:
+            return
+        keys = self.lladdrs.get(lladdr)
+        if keys is None:
+            self.lladdrs[lladdr] = key
+        elif isinstance(keys,list):
+            keys.append(key)
+        else:
+            self.lladdrs[lladdr] = [ keys,key ]
+
+    def remove(self,x):
+        key = (x['index'],x['dest'])
+        old = self.entries.pop(key,None)
+        if old is not None:
+            self.unlink(old[0],key)
+
+    def unlink(self,lladdr,key):
+        keys = self.lladdrs.get(lladdr)
+        if keys is None:
+            return
+        if not isinstance(keys,list):
+            if keys == key:
+                del self.lladdrs[lladdr]
+            return
+        if key in keys:
+            keys.remove(key)
+        if len(keys) == 1:
+            self.lladdrs[lladdr] = keys[0]
+
+    def lookup(self,index,dest):
+        """
+        Get the link layer address of a neighbour or None
+        """
+        entry = self.entries.get((index,dest))
+        if entry is None:
+            return None
+        return entry[0]
+
+    def get(self,index,dest):
+        """
+        Get a neighbour record or None
+        """
+        entry = self.entries.get((index,dest))
+        if entry is None:
+            return None
+        return { "type": "neigh", "index": index, "dest": dest,
+                 "lladdr": entry[0], "state": entry[1] }
+
+    def find(self,lladdr):
+        """
+        Get [ (index,dest), ... ] of the neighbours with the link
+        layer address
+        """
+        keys = self.lladdrs.get(lladdr)
+        if keys is None:
+            return []
+        if isinstance(keys,list):
+            return list(keys)
+        return [ keys ]
+
+
+class NLNeighCache(NLEventCache):
+    """
+    Event-driven neighbour cache
+    """
+    groups = RTNLGRP_NEIGH
+    inet6 = True
+
+    def load(self):
+        """
+        Reset the cache with a full dump on a separate socket
+        """
+        neighs = nl_neigh_table()
+        s = nl_socket(RTNLGRP_NONE)
+        try:
+            [ neighs.add(x) for x in nl_neigh_dump(s,self.pool) ]
+        finally:
+            libc.close(s)
+        self.neighs = neighs
+
+    def apply(self,x):
+        if x['type'] == 'neigh':
+            self.neighs.apply(x)
+
+    def lookup(self,index,dest):
+        """
+        Get the link layer address of a neighbour, see
+        nl_neigh_table.lookup()
+        """
+        return self.neighs.lookup(index,dest)
+
+    def find(self,lladdr):
+        """
+        Get neighbours by the link layer address, see
+        nl_neigh_table.find()
+        """
+        return self.neighs.find(lladdr)
+
+
+if __name__ == "__main__":
+    cache = NLNeighCache()
+    for ((index,dest),(lladdr,state)) in cache.neighs.entries.items():
+        print index, dest, lladdr, state
+    cache.close()
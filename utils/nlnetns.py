@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+#
+#     Copyright (c) 2011 Red Hat, Inc; ALT Linux Team; Peter V. Saveliev
+#
+#     This file was written for VDSM project and uses code from Connexion
+#     library.
+#
+#     Connexion is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Connexion is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Connexion; if not, write to the Free Software
+#     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+nlconfig() for many network namespaces at once:
+
+    pool = nl_netns_pool(8)
+    for (ns,ifaces) in pool.dump().items():
+        ...
+    pool.close()
+
+nl_netns_list() finds the namespaces: the named ones in /var/run/netns,
+as "ip netns" creates them, and, with proc=True, the namespaces of all
+the processes, that have no name, keyed by the pid. The same namespace
+is listed once, the named path is preferred.
+
+The dumps run in worker processes. A worker does setns() into the
+target namespace, opens a netlink socket there and keeps it: a socket
+stays in the namespace, where it was created, so the next dump of the
+namespace reuses it, whatever namespace the worker is in by then.
+Namespaces are assigned to workers by the path, so a namespace always
+goes to the same worker and the same socket. A socket is reopened,
+if the namespace behind the path has changed (the name was deleted
+and created again). A socket keeps its namespace alive, so a worker
+closes the sockets of the namespaces, that are gone or are not in the
+dump, and returns to its own namespace after opening a socket.
+
+setns() requires CAP_SYS_ADMIN. Namespaces, that can not be entered
+or vanished during the dump, are left out of the result; the reasons
+are in nl_netns_pool.errors.
+"""
+
+import os
+from ctypes import get_errno
+from multiprocessing import Process, Queue
+
+from nlconfig import nl_socket, nl_dump, nl_pool, nl_sequence, nlconfig_build, libc
+from nlconfig import RTNLGRP_NONE
+
+__all__ = [ "nl_netns_pool", "nl_netns_list", "nlconfig_netns" ]
+
+NETNS_RUN_DIR = "/var/run/netns"
+CLONE_NEWNET = 0x40000000
+
+
+def nl_netns_id(path):
+    s = os.stat(path)
+    return (s.st_dev,s.st_ino)
+
+def nl_netns_list(proc=False):
+    """
+    Get network namespaces: { key: path }. The key is the name for
+    the named namespaces and the pid for the others.
+    """
+    ret = {}
+    seen = set()
+    if os.path.isdir(NETNS_RUN_DIR):
+        for name in sorted(os.listdir(NETNS_RUN_DIR)):
+            path = os.path.join(NETNS_RUN_DIR,name)
+            try:
+                nsid = nl_netns_id(path)
+            except OSError:
+                continue
+            if nsid not in seen:
+                seen.add(nsid)
+                ret[name] = path
+    if proc:
+        for pid in sorted([ int(x) for x in os.listdir("/proc") if x.isdigit() ]):
+            path = "/proc/%i/ns/net" % (pid)
+            try:
+                nsid = nl_netns_id(path)
+            except OSError:
+                # the process has exited or is not ours
+                continue
+            if nsid not in seen:
+                seen.add(nsid)
+                ret[pid] = path
+    return ret
+
+def nl_setns_fd(fd,path=None):
+    if libc.setns(fd,CLONE_NEWNET) != 0:
+        e = get_errno()
+        raise OSError(e,os.strerror(e),path)
+
+def nl_setns(path):
+    fd = os.open(path,os.O_RDONLY)
+    try:
+        nl_setns_fd(fd,path)
+    finally:
+        os.close(fd)
+
+def nl_netns_worker(tasks,results,build):
+    sockets = {}            # path -> (namespace id, socket)
+    pool = nl_pool()
+    seq = 0                 # the last sequence number used
+    home = os.open("/proc/self/ns/net",os.O_RDONLY)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        # the sockets of the namespaces, that are not dumped now
+        paths = set([ x[1] for x in task ])
+        for path in [ x for x in sockets.keys() if x not in paths ]:
+            libc.close(sockets.pop(path)[1])
+        for (key,path) in task:
+            try:
+                nsid = nl_netns_id(path)
+                (old,s) = sockets.get(path,(None,-1))
+                if old != nsid:
+                    if s != -1:
+                        libc.close(s)
+                        del sockets[path]
+                    nl_setns(path)
+                    try:
+                        s = nl_socket(RTNLGRP_NONE)
+                    finally:
+                        nl_setns_fd(home)
+                    sockets[path] = (nsid,s)
+                # a dump, stopped by an error, may leave replies in the
+                # socket; the seq filter skips them
+                first = nl_sequence(seq,2)
+                seq = first + 1
+                results.put((key,build(nl_dump(s,pool,first)),None))
+            except Exception, e:
+                # the namespace is gone or broken: the socket is
+                # reopened, if the path comes back
+                if sockets.has_key(path):
+                    libc.close(sockets.pop(path)[1])
+                results.put((key,None,str(e)))
+    [ libc.close(x[1]) for x in sockets.values() ]
+    os.close(home)
+
+
+class nl_netns_pool (object):
+    """
+    Worker processes, that dump network namespaces. build gets the
+    records of nl_dump() and returns the result for a namespace;
+    the default is nlconfig_build(), so the results are nlconfig()
+    dictionaries.
+    """
+    def __init__(self,workers=4,build=nlconfig_build):
+        self.tasks = []
+        self.results = Queue()
+        self.workers = []
+        self.errors = {}        # key -> error of the last dump
+        for x in range(workers):
+            tasks = Queue()
+            p = Process(target=nl_netns_worker,args=(tasks,self.results,build))
+            p.daemon = True
+            p.start()
+            self.tasks.append(tasks)
+            self.workers.append(p)
+
+    def dump(self,namespaces=None,proc=False):
+        """
+        Dump namespaces ({ key: path }, all of nl_netns_list(proc) by
+        default). Returns { key: result }. The workers close the
+        sockets of the namespaces, that are not in the dump.
+        """
+        if namespaces is None:
+            namespaces = nl_netns_list(proc)
+        tasks = [ [] for x in self.tasks ]
+        for (key,path) in namespaces.items():
+            tasks[hash(path) % len(tasks)].append((key,path))
+        # every worker gets its list, even an empty one
+        [ x.put(y) for (x,y) in zip(self.tasks,tasks) ]
+        ret = {}
+        self.errors = {}
+        for x in xrange(len(namespaces)):
+            (key,result,error) = self.results.get()
+            if error is None:
+                ret[key] = result
+            else:
+                self.errors[key] = error
+        return ret
+
+    def close(self):
+        [ x.put(None) for x in self.tasks ]
+        [ x.join() for x in self.workers ]
+        self.workers = []
+
+
+def nlconfig_netns(namespaces=None,proc=False,workers=4):
+    """
+    Get nlconfig() data of network namespaces: { key: nlconfig() },
+    see nl_netns_list() for the keys
+    """
+    pool = nl_netns_pool(workers)
+    try:
+        return pool.dump(namespaces,proc)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    proc = "-p" in sys.argv[1:]
+    namespaces = nl_netns_list(proc)
+    t = time.time()
+    result = nlconfig_netns(namespaces,workers=8)
+    print "%i namespaces, %.3f s" % (len(result),time.time() - t)
+    for (key,ifaces) in sorted(result.items()):
+        print key, " ".join(sorted(ifaces.keys()))
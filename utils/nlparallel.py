@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+#
+#     Copyright (c) 2011 Red Hat, Inc; ALT Linux Team; Peter V. Saveliev
+#
+#     This file was written for VDSM project and uses code from Connexion
+#     library.
+#
+#     Connexion is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Connexion is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Connexion; if not, write to the Free Software
+#     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+Parallel parsing of large dumps. The receiving process only copies
+raw datagrams into shared memory segments; worker processes decode
+the messages with nl_decode() and send back the results:
+
+    parser = nl_parser_pool(8,nl_fields("dst_prefix","dst_len","gateway"))
+    req = nl_request(RTM_GETROUTE,NLM_F_DUMP | NLM_F_REQUEST).rtmsg()
+    for (dst,dst_len,gateway) in parser.dump(req):
+        ...
+    parser.close()
+
+The results are yielded in the order of the messages in the dump.
+
+A segment is a sequence of (u32 length, datagram) frames. The
+segments are anonymous shared mappings, created before the workers
+are forked, so only (chunk, segment, length) tuples go to the
+workers. The results go back pickled, so the compact argument, that
+reduces a record to a tuple, matters: pickling full dictionaries
+costs about as much as decoding them. Control messages are not
+returned; records, for which compact returns None, are dropped.
+
+A dump, that ends with an error (NLMSG_ERROR), raises OSError. If a
+worker dies, the dump raises RuntimeError instead of waiting for its
+results forever; the pool should be closed then.
+"""
+
+from ctypes import c_char, c_void_p, addressof, sizeof, get_errno
+from mmap import mmap
+from os import strerror
+from multiprocessing import Process, Queue
+from Queue import Empty
+
+from nlconfig import nl_socket, nl_send_raw, nl_decode, libc, rtnl_msg
+from nlconfig import s_nlmsghdr, s_u32, s_i32, RTNLGRP_NONE, NLM_F_MULTI
+from nlconfig import NLMSG_ERROR, NLMSG_DONE, NLMSG_MIN_TYPE, EINTR
+
+__all__ = [ "nl_parser_pool", "nl_fields" ]
+
+# Shared memory segment size; a segment is sent to a worker, when
+# there is no room for one more datagram
+NL_SEGMENT_SIZE = 1 << 20
+
+# seconds between the checks of the workers, while waiting for results
+NL_PARSER_POLL = 1.0
+
+def nl_fields(*names):
+    """
+    Get a compact function, that reduces a record to a tuple
+    of the fields
+    """
+    def compact(x):
+        return tuple([ x.get(y) for y in names ])
+    return compact
+
+def nl_parse_segment(buf,length,compact=None,inet6=False):
+    """
+    Decode all the messages of a segment
+    """
+    result = []
+    unpack_hdr = s_nlmsghdr.unpack_from
+    offset = 0
+    while offset < length:
+        end = offset + 4 + s_u32.unpack_from(buf,offset)[0]
+        bias = offset + 4
+        while bias < end:
+            (l,t) = unpack_hdr(buf,bias)[:2]
+            if l == 0:
+                break
+            if t >= NLMSG_MIN_TYPE:
+                x = nl_decode(buf,bias,inet6)
+                if x is not None and compact is not None:
+                    x = compact(x)
+                if x is not None:
+                    result.append(x)
+            bias += l
+        offset = (end + 3) & ~3
+    return result
+
+def nl_parser_worker(segments,tasks,results,compact,inet6):
+    views = [ memoryview((c_char * len(x)).from_buffer(x)) for x in segments ]
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        (chunk,n,length) = task
+        results.put((chunk,n,nl_parse_segment(views[n],length,compact,inet6)))
+
+
+class nl_parser_pool (object):
+    """
+    Worker processes with shared memory segments. A pool runs one
+    dump at a time.
+    """
+    def __init__(self,workers=4,compact=None,inet6=False,segments=0,
+                 size=NL_SEGMENT_SIZE):
+        self.size = size
+        self.segments = [ mmap(-1,size) for x in range(segments or workers * 2) ]
+        self.data = [ (c_char * size).from_buffer(x) for x in self.segments ]
+        self.views = [ memoryview(x) for x in self.data ]
+        self.tasks = Queue()
+        self.results = Queue()
+        self.workers = []
+        for x in range(workers):
+            p = Process(target=nl_parser_worker,args=(self.segments,self.tasks,
+                                                      self.results,compact,inet6))
+            p.daemon = True
+            p.start()
+            self.workers.append(p)
+
+    def fill(self,fd,n):
+        """
+        Receive datagrams into the segment n. Returns (length, done);
+        receive errors, except EINTR, and an error reply raise OSError
+        """
+        address = addressof(self.data[n])
+        buf = self.views[n]
+        room = sizeof(rtnl_msg)
+        offset = 0
+        while offset + 4 + room <= self.size:
+            l = libc.recvfrom(fd,c_void_p(address + offset + 4),room,0,0,0)
+            if l == -1:
+                e = get_errno()
+                if e == EINTR:
+                    continue
+                raise OSError(e,strerror(e))
+            if l == 0:
+                return (offset,True)
+            s_u32.pack_into(self.data[n],offset,l)
+            # the same end condition, as in nl_get_datagram()
+            bias = offset + 4
+            offset = (bias + l + 3) & ~3
+            while bias < offset:
+                (length,t,flags) = s_nlmsghdr.unpack_from(buf,bias)[:3]
+                if t == NLMSG_ERROR:
+                    e = -s_i32.unpack_from(buf,bias + s_nlmsghdr.size)[0]
+                    if e:
+                        raise OSError(e,strerror(e))
+                if length == 0 or not ((t > NLMSG_DONE) and (flags & NLM_F_MULTI)):
+                    return (offset,True)
+                bias += length
+        return (offset,False)
+
+    def dump(self,request):
+        """
+        Send a dump request (nl_request) on a new socket and yield
+        the parsed records in order
+        """
+        s = nl_socket(RTNLGRP_NONE)
+        free = range(len(self.segments))
+        pending = {}
+        (chunk,ready,busy,done) = (0,0,0,False)
+        try:
+            nl_send_raw(s,request.encode())
+            while busy or not done:
+                # receive while there are free segments, the workers
+                # parse in the meantime
+                if free and not done:
+                    n = free.pop()
+                    (length,done) = self.fill(s,n)
+                    self.tasks.put((chunk,n,length))
+                    chunk += 1
+                    busy += 1
+                    continue
+                (c,n,result) = self.get()
+                free.append(n)
+                busy -= 1
+                pending[c] = result
+                while pending.has_key(ready):
+                    for x in pending.pop(ready):
+                        yield x
+                    ready += 1
+        finally:
+            libc.close(s)
+            # the caller may stop early: collect the results, that
+            # are still in flight, so the next dump does not get them
+            try:
+                while busy:
+                    self.get()
+                    busy -= 1
+            except RuntimeError:
+                # the results of a dead worker never come
+                pass
+
+    def get(self):
+        """
+        Get the next result of the workers. Raises RuntimeError,
+        if a worker has died
+        """
+        while True:
+            try:
+                return self.results.get(timeout=NL_PARSER_POLL)
+            except Empty:
+                dead = [ x for x in self.workers if not x.is_alive() ]
+                if dead:
+                    raise RuntimeError("parser worker %i exited with %s" % \
+                                       (dead[0].pid,dead[0].exitcode))
+
+    def close(self):
+        [ self.tasks.put(None) for x in self.workers ]
+        [ x.join() for x in self.workers ]
+        self.workers = []
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from nlconfig import nl_request, RTM_GETROUTE, NLM_F_DUMP, NLM_F_REQUEST
+    from nlconfig import nl_routes
+    compact = nl_fields("table","dst_prefix","dst_len","gateway","output_link")
+    t = time.time()
+    serial = [ compact(x) for x in nl_routes() ]
+    print "serial: %i routes, %.3f s" % (len(serial),time.time() - t)
+    for workers in [ int(x) for x in sys.argv[1:] ] or [ 1,2,4,8 ]:
+        parser = nl_parser_pool(workers,compact)
+        req = nl_request(RTM_GETROUTE,NLM_F_DUMP | NLM_F_REQUEST).rtmsg()
+        t = time.time()
+        result = list(parser.dump(req))
+        print "workers: %i, %i routes, %.3f s, same order: %s" % \
+            (workers,len(result),time.time() - t,result == serial)
+        parser.close()
@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+#
+#     Copyright (c) 2011 Red Hat, Inc; ALT Linux Team; Peter V. Saveliev
+#
+#     This file was written for VDSM project and uses code from Connexion
+#     library.
+#
+#     Connexion is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Connexion is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Connexion; if not, write to the Free Software
+#     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+IPv4 route index with the longest prefix match lookups:
+
+    cache = NLRouteCache()
+    route = cache.lookup("10.1.2.3")
+    if route is not None:
+        print route['gateway'], route['output_link']
+
+NLRouteCache dumps the routing tables once and then applies
+RTM_NEWROUTE/RTM_DELROUTE notifications from RTNLGRP_IPV4_ROUTE,
+just as NLConfigCache does for links and addresses, including the
+overrun recovery.
+
+The index is an nl_route_table: a path-compressed binary (Patricia)
+trie per routing table. The trie nodes are kept in parallel arrays,
+17 bytes per node and at most two nodes per prefix, instead of one
+Python object per route. The route attributes, except the prefix,
+are interned: a full BGP table uses a few hundred distinct next
+hops, so a route costs the trie nodes and one array slot.
+
+A lookup walks at most 33 nodes, and add/remove change only the
+nodes on the path.
+"""
+
+from array import array
+from socket import inet_aton, AF_INET
+from struct import Struct
+
+from nlconfig import nl_socket, nl_route_dump, libc
+from nlconfig import RTNLGRP_NONE, RTNLGRP_IPV4_ROUTE, RTM_F_CLONED
+from nlcache import NLEventCache
+
+__all__ = [ "NLRouteCache", "nl_route_table", "nl_trie" ]
+
+RT_TABLE_MAIN = 254
+
+s_addr = Struct("!I")
+
+# integer masks by prefix length
+t_imasks = [ (0xffffffff << (32 - x)) & 0xffffffff for x in range(33) ]
+# the bit, that selects a child of a node by its prefix length
+t_ibits = [ 1 << (31 - x) for x in range(32) ] + [ 0 ]
+
+def ip4_int(address):
+    """
+    Convert a dotted quad to an integer; None for IPv6
+    """
+    if isinstance(address,(int,long)):
+        return address
+    if address.find(":") > -1:
+        return None
+    return s_addr.unpack(inet_aton(address))[0]
+
+def ip4_str(address):
+    return "%u.%u.%u.%u" % ((address >> 24) & 0xff,(address >> 16) & 0xff,
+                            (address >> 8) & 0xff,address & 0xff)
+
+
+class nl_trie (object):
+    """
+    IPv4 Patricia trie. Node n is (key[n], plen[n], left[n], right[n],
+    value[n]); value -1 marks a glue node, that only joins two
+    subtrees. Children are selected by the bit of the key, next to
+    the node prefix. Released nodes are reused.
+
+    The keys are stored as signed integers: array("I") items are
+    long objects in Python 2, and long arithmetic makes the walk
+    several times slower. The lower 32 bits are the same, so the
+    masked comparisons do not change; prefix() returns the key as
+    an unsigned integer.
+    """
+    def __init__(self):
+        self.key = array("i")
+        self.plen = array("B")
+        self.left = array("i")
+        self.right = array("i")
+        self.value = array("i")
+        self.free = []
+        self.root = -1
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def node(self,key,plen,value):
+        if key & 0x80000000:
+            key -= 0x100000000
+        if self.free:
+            n = self.free.pop()
+            self.key[n] = key
+            self.plen[n] = plen
+            self.value[n] = value
+            return n
+        self.key.append(key)
+        self.plen.append(plen)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.value.append(value)
+        return len(self.key) - 1
+
+    def release(self,n):
+        self.left[n] = self.right[n] = self.value[n] = -1
+        self.free.append(n)
+
+    def prefix(self,n):
+        """
+        Get (key, plen) of a node
+        """
+        return (self.key[n] & 0xffffffff,self.plen[n])
+
+    def link(self,parent,bit,n):
+        if parent == -1:
+            self.root = n
+        elif bit:
+            self.right[parent] = n
+        else:
+            self.left[parent] = n
+
+    def insert(self,key,plen,value):
+        """
+        Add or replace a prefix; returns the old value or -1
+        """
+        key &= t_imasks[plen]
+        keys = self.key
+        plens = self.plen
+        left = self.left
+        right = self.right
+        parent = -1
+        bit = 0
+        n = self.root
+        while n != -1:
+            np = plens[n]
+            if np < plen:
+                m = np
+            else:
+                m = plen
+            diff = (key ^ keys[n]) & t_imasks[m]
+            if diff:
+                c = 32 - diff.bit_length()  # common prefix length
+            else:
+                c = m
+            if c == np:
+                if np == plen:
+                    old = self.value[n]
+                    self.value[n] = value
+                    if old == -1:
+                        self.count += 1
+                    return old
+                # descend
+                parent = n
+                bit = (key >> (31 - np)) & 1
+                if bit:
+                    n = right[n]
+                else:
+                    n = left[n]
+                continue
+            # the new prefix splits the edge to n
+            if c == plen:
+                new = self.node(key,plen,value)
+                self.link(new,(keys[n] >> (31 - plen)) & 1,n)
+            else:
+                new = self.node(key & t_imasks[c],c,-1)
+                leaf = self.node(key,plen,value)
+                if (key >> (31 - c)) & 1:
+                    (left[new],right[new]) = (n,leaf)
+                else:
+                    (left[new],right[new]) = (leaf,n)
+            self.link(parent,bit,new)
+            self.count += 1
+            return -1
+        self.link(parent,bit,self.node(key,plen,value))
+        self.count += 1
+        return -1
+
+    def remove(self,key,plen):
+        """
+        Remove a prefix; returns its value or -1
+        """
+        key &= t_imasks[plen]
+        keys = self.key
+        plens = self.plen
+        (gparent,gbit,parent,bit) = (-1,0,-1,0)
+        n = self.root
+        while n != -1:
+            np = plens[n]
+            if np > plen or (key ^ keys[n]) & t_imasks[np]:
+                return -1
+            if np == plen:
+                break
+            (gparent,gbit,parent) = (parent,bit,n)
+            bit = (key >> (31 - np)) & 1
+            if bit:
+                n = self.right[n]
+            else:
+                n = self.left[n]
+        if n == -1 or self.value[n] == -1:
+            return -1
+
+        old = self.value[n]
+        self.count -= 1
+        (left,right) = (self.left[n],self.right[n])
+        if left != -1 and right != -1:
+            # keep it as a glue node
+            self.value[n] = -1
+            return old
+        if left != -1:
+            child = left
+        else:
+            child = right
+        self.link(parent,bit,child)
+        self.release(n)
+        if child == -1 and parent != -1 and self.value[parent] == -1:
+            # a glue node with one child left is not needed
+            if bit:
+                child = self.left[parent]
+            else:
+                child = self.right[parent]
+            self.link(gparent,gbit,child)
+            self.release(parent)
+        return old
+
+    def get(self,key,plen):
+        """
+        Exact match; returns the value or -1
+        """
+        key &= t_imasks[plen]
+        n = self.root
+        while n != -1:
+            np = self.plen[n]
+            if np > plen or (key ^ self.key[n]) & t_imasks[np]:
+                return -1
+            if np == plen:
+                return self.value[n]
+            if (key >> (31 - np)) & 1:
+                n = self.right[n]
+            else:
+                n = self.left[n]
+        return -1
+
+    def lookup(self,address):
+        """
+        Longest prefix match; returns the node or -1
+        """
+        keys = self.key
+        plens = self.plen
+        values = self.value
+        left = self.left
+        right = self.right
+        masks = t_imasks
+        bits = t_ibits
+        best = -1
+        n = self.root
+        while n != -1:
+            np = plens[n]
+            if (address ^ keys[n]) & masks[np]:
+                break
+            if values[n] != -1:
+                best = n
+            if address & bits[np]:
+                n = right[n]
+            else:
+                n = left[n]
+        return best
+
+    def __iter__(self):
+        """
+        Iterate (key, plen, value) in the prefix order
+        """
+        stack = [ self.root ]
+        while stack:
+            n = stack.pop()
+            if n == -1:
+                continue
+            if self.value[n] != -1:
+                yield self.prefix(n) + (self.value[n],)
+            stack.append(self.right[n])
+            stack.append(self.left[n])
+
+
+class nl_route_table (object):
+    """
+    Routes of all the tables, added and removed by route records
+    (from nl_decode() or cxnet route events). Routes to the same
+    prefix with different tos or priority are kept aside, the trie
+    points to the preferred one.
+    """
+    # interned route attributes
+    fields = ("gateway","output_link","prefsrc","priority","tos",
+              "protocol","scope","rtype","multipath")
+
+    def __init__(self):
+        self.tables = {}        # table -> nl_trie
+        self.nexthops = []      # value -> attributes
+        self.nh_index = {}      # attributes -> value
+        self.alternatives = {}  # (table,key,plen) -> { (tos,priority): value }
+
+    def __len__(self):
+        return sum([ len(x) for x in self.tables.values() ])
+
+    def intern(self,x):
+        nh = tuple([ x.get(y) for y in self.fields ])
+        value = self.nh_index.get(nh)
+        if value is None:
+            value = self.nh_index[nh] = len(self.nexthops)
+            self.nexthops.append(nh)
+        return value
+
+    def rank(self,value):
+        nh = self.nexthops[value]
+        return (nh[4] or 0,nh[3] or 0)
+
+    def prefix(self,x):
+        """
+        Get (table, key, plen) of a route record; None for IPv6
+        routes and for cached clones
+        """
+        if x.get('flags',0) & RTM_F_CLONED:
+            return None
+        key = ip4_int(x.get('dst_prefix',0))
+        if key is None:
+            return None
+        return (x.get('table',RT_TABLE_MAIN),key,x.get('dst_len',0))
+
+    def apply(self,x):
+        if x['action'] == 'add':
+            self.add(x)
+        else:
+            self.remove(x)
+
+    def add(self,x):
+        p = self.prefix(x)
+        if p is None:
+            return
+        trie = self.tables.get(p[0])
+        if trie is None:
+            trie = self.tables[p[0]] = nl_trie()
+        value = self.intern(x)
+        rank = self.rank(value)
+        alt = self.alternatives.get(p)
+        if alt is None:
+            old = trie.insert(p[1],p[2],value)
+            if old == -1 or self.rank(old) == rank:
+                return
+            alt = self.alternatives[p] = { self.rank(old): old }
+        alt[rank] = value
+        trie.insert(p[1],p[2],alt[min(alt)])
+
+    def remove(self,x):
+        p = self.prefix(x)
+        if p is None or not self.tables.has_key(p[0]):
+            return
+        trie = self.tables[p[0]]
+        alt = self.alternatives.get(p)
+        if alt is None:
+            trie.remove(p[1],p[2])
+            if not len(trie):
+                del self.tables[p[0]]
+            return
+        alt.pop((x.get('tos') or 0,x.get('priority') or 0),None)
+        if len(alt) < 2:
+            del self.alternatives[p]
+        if alt:
+            trie.insert(p[1],p[2],alt[min(alt)])
+        else:
+            trie.remove(p[1],p[2])
+
+    def record(self,table,key,plen,value):
+        r = { "type": "route",
+              "table": table,
+              "dst_prefix": ip4_str(key),
+              "dst_len": plen }
+        for (name,v) in zip(self.fields,self.nexthops[value]):
+            if v is not None:
+                r[name] = v
+        return r
+
+    def lookup(self,address,table=RT_TABLE_MAIN):
+        """
+        Get the route for an address (dotted quad or integer);
+        returns a route record or None
+        """
+        trie = self.tables.get(table)
+        if trie is None:
+            return None
+        n = trie.lookup(ip4_int(address))
+        if n == -1:
+            return None
+        return self.record(table,*(trie.prefix(n) + (trie.value[n],)))
+
+    def routes(self,table=RT_TABLE_MAIN):
+        """
+        Iterate route records of a table
+        """
+        for (key,plen,value) in self.tables.get(table,()):
+            yield self.record(table,key,plen,value)
+
+
+class NLRouteCache(NLEventCache):
+    """
+    Event-driven IPv4 route index
+    """
+    groups = RTNLGRP_IPV4_ROUTE
+
+    def load(self):
+        """
+        Reset the index with a full dump on a separate socket
+        """
+        routes = nl_route_table()
+        s = nl_socket(RTNLGRP_NONE)
+        try:
+            [ routes.add(x) for x in nl_route_dump(s,self.pool) ]
+        finally:
+            libc.close(s)
+        self.routes = routes
+
+    def apply(self,x):
+        if x['type'] == 'route':
+            self.routes.apply(x)
+
+    def lookup(self,address,table=RT_TABLE_MAIN,update=True):
+        """
+        Longest prefix match, see nl_route_table.lookup()
+        """
+        if update:
+            self.update()
+        return self.routes.lookup(address,table)
+
+
+if __name__ == "__main__":
+    import sys
+    cache = NLRouteCache()
+    for address in sys.argv[1:] or [ "0.0.0.0" ]:
+        print address, cache.lookup(address)
+    cache.close()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+#
+#     Copyright (c) 2011 Red Hat, Inc; ALT Linux Team; Peter V. Saveliev
+#
+#     This file was written for VDSM project and uses code from Connexion
+#     library.
+#
+#     Connexion is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Connexion is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Connexion; if not, write to the Free Software
+#     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+nlconfig() snapshots in shared memory. One process runs the
+publisher, that keeps an NLConfigCache and writes the nlconfig()
+dictionary into a file in /dev/shm on every change:
+
+    $ python nlshm.py /dev/shm/nlconfig
+
+Any number of processes read it without netlink sockets:
+
+    ifaces = nlconfig_snapshot("/dev/shm/nlconfig")
+
+The segment is a header and the marshalled dictionary. The header
+holds a sequence counter, used as a seqlock: the writer makes it odd
+before the update and even after it, and a reader retries, if the
+counter was odd or has changed while the data was copied. So readers
+never lock and never block the writer; a read is a few memory
+accesses of the mapping, no syscalls. If the counter is the same, as
+on the previous read, the reader returns the dictionary, decoded the
+last time; as with NLConfigCache.get(), it must not be modified.
+
+If the publisher dies in the middle of an update, the counter stays
+odd until the next publisher rewrites the data. A reader waits for
+it up to the timeout (NL_SNAPSHOT_TIMEOUT seconds by default) and
+then returns the last object it has read, or raises IOError, if it
+has read none; reader.stale counts such reads. The next reads of the
+same odd counter do not wait again.
+
+The segment grows, if a snapshot does not fit; readers map it again
+then, and only then make syscalls. The counter is updated with
+aligned 8 byte copies, that are single stores, atomic and not
+reordered with the other stores on x86, the platform the module is
+written for.
+"""
+
+import os
+import time
+import marshal
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+
+from nlcache import NLConfigCache
+
+__all__ = [ "NLConfigPublisher", "nl_snapshot_writer", "nl_snapshot_reader",
+            "nlconfig_snapshot" ]
+
+NL_SNAPSHOT_PATH = "/dev/shm/nlconfig"
+NL_SNAPSHOT_MAGIC = "NLSM"
+NL_SNAPSHOT_VERSION = 1
+
+# magic, format version, sequence counter, data length
+s_header = Struct("=4sIQI")
+s_seq = Struct("=Q")
+s_length = Struct("=I")
+SEQ_OFFSET = 8
+LENGTH_OFFSET = 16
+DATA_OFFSET = 64        # the data starts on a separate cache line
+
+# spins on an odd counter before yielding the CPU
+NL_SNAPSHOT_SPINS = 1000
+# seconds to wait for an update to finish, see nl_snapshot_reader
+NL_SNAPSHOT_TIMEOUT = 1.0
+
+
+class nl_snapshot_writer (object):
+    """
+    Seqlock writer of a shared memory segment
+    """
+    def __init__(self,path=NL_SNAPSHOT_PATH,size=1 << 20):
+        self.path = path
+        self.seq = 0
+        # an existing segment is reused, not truncated: readers of
+        # the previous publisher keep their mappings, and the counter
+        # continues, so they can not take new data for the old one
+        self.fd = os.open(path,os.O_RDWR | os.O_CREAT,0644)
+        size = max(os.fstat(self.fd).st_size,DATA_OFFSET + size)
+        os.ftruncate(self.fd,size)
+        self.map = mmap(self.fd,size)
+        (magic,version,seq,length) = s_header.unpack_from(self.map,0)
+        if magic == NL_SNAPSHOT_MAGIC:
+            # an even counter: the old data stays valid until the
+            # first write(); an odd one: the previous writer died
+            # in the middle of an update, so the counter stays odd,
+            # until write() rewrites the data
+            self.seq = seq & ~1
+        else:
+            s_header.pack_into(self.map,0,NL_SNAPSHOT_MAGIC,NL_SNAPSHOT_VERSION,
+                               self.seq,0)
+
+    def write(self,obj):
+        """
+        Publish an object; it must be marshallable
+        """
+        data = marshal.dumps(obj)
+        if DATA_OFFSET + len(data) > len(self.map):
+            self.grow(DATA_OFFSET + len(data) * 2)
+        # not pack_into(): it zeroes the fields before packing, so
+        # a reader could see the counter 0
+        self.map[SEQ_OFFSET:SEQ_OFFSET + 8] = s_seq.pack(self.seq + 1)
+        self.map[DATA_OFFSET:DATA_OFFSET + len(data)] = data
+        self.map[LENGTH_OFFSET:LENGTH_OFFSET + 4] = s_length.pack(len(data))
+        self.map[SEQ_OFFSET:SEQ_OFFSET + 8] = s_seq.pack(self.seq + 2)
+        self.seq += 2
+
+    def grow(self,size):
+        # the file only grows, so the old mappings of the readers
+        # stay valid
+        os.ftruncate(self.fd,size)
+        self.map.resize(size)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+class nl_snapshot_reader (object):
+    """
+    Seqlock reader of a shared memory segment
+    """
+    def __init__(self,path=NL_SNAPSHOT_PATH,timeout=NL_SNAPSHOT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.seq = -1
+        self.obj = None
+        self.retries = 0        # reads, that raced with the writer
+        self.stale = 0          # reads, that timed out on an update
+        self.stuck = None       # the odd counter of the timeout
+        self.map = None
+        self.open()
+
+    def open(self):
+        f = open(self.path,"rb")
+        try:
+            self.map = mmap(f.fileno(),0,access=ACCESS_READ)
+        finally:
+            f.close()
+        if self.map[:4] != NL_SNAPSHOT_MAGIC:
+            raise IOError("%s is not an nlconfig snapshot" % (self.path))
+
+    def read(self):
+        """
+        Get the last published object. If an update does not finish
+        in self.timeout seconds, the last object read is returned
+        again, see the module description
+        """
+        spins = 0
+        deadline = None
+        while True:
+            seq = s_seq.unpack_from(self.map,SEQ_OFFSET)[0]
+            if seq == self.seq:
+                return self.obj
+            if seq & 1:
+                # the writer is in the middle of an update
+                if seq == self.stuck:
+                    return self.timed_out(seq)
+                spins += 1
+                if spins % NL_SNAPSHOT_SPINS == 0:
+                    now = time.time()
+                    if deadline is None:
+                        deadline = now + self.timeout
+                    elif now > deadline:
+                        return self.timed_out(seq)
+                    time.sleep(0)
+                continue
+            length = s_header.unpack_from(self.map,0)[3]
+            if DATA_OFFSET + length > len(self.map):
+                if s_seq.unpack_from(self.map,SEQ_OFFSET)[0] == seq:
+                    # the segment has grown
+                    self.map.close()
+                    self.open()
+                continue
+            data = self.map[DATA_OFFSET:DATA_OFFSET + length]
+            if s_seq.unpack_from(self.map,SEQ_OFFSET)[0] != seq:
+                self.retries += 1
+                continue
+            if seq == 0:
+                return None     # nothing published yet
+            (self.obj,self.seq) = (marshal.loads(data),seq)
+            return self.obj
+
+    def timed_out(self,seq):
+        """
+        Get the last object read, when the writer does not finish
+        the update
+        """
+        self.stuck = seq
+        self.stale += 1
+        if self.seq == -1:
+            raise IOError("%s: the update is not finished in %s s" % (self.path,self.timeout))
+        return self.obj
+
+    def version(self):
+        return self.seq // 2
+
+    def close(self):
+        self.map.close()
+
+
+class NLConfigPublisher(object):
+    """
+    Publish nlconfig() data on every change
+    """
+    def __init__(self,path=NL_SNAPSHOT_PATH,size=1 << 20,cache=None):
+        self.cache = cache or NLConfigCache()
+        self.writer = nl_snapshot_writer(path,size)
+        self.published = 0
+        self.publish()
+
+    def publish(self):
+        self.writer.write(self.cache.get(update=False))
+        self.published += 1
+
+    def update(self,block=False):
+        """
+        Apply pending notifications and publish, if anything changed
+        """
+        resyncs = self.cache.resyncs
+        if self.cache.update(block) or self.cache.resyncs != resyncs:
+            self.publish()
+
+    def run(self):
+        while self.cache.fd != -1:
+            self.update(block=True)
+
+    def close(self):
+        self.cache.close()
+        self.writer.close()
+
+
+# readers by path, created on the first use
+readers = {}
+
+def nlconfig_snapshot(path=NL_SNAPSHOT_PATH):
+    """
+    Get nlconfig() data from a publisher's snapshot. Returns None,
+    if nothing is published yet.
+    """
+    reader = readers.get(path)
+    if reader is None:
+        reader = readers[path] = nl_snapshot_reader(path)
+    return reader.read()
+
+
+if __name__ == "__main__":
+    import sys
+    publisher = NLConfigPublisher(len(sys.argv) > 1 and sys.argv[1] or NL_SNAPSHOT_PATH)
+    publisher.run()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+#
+#     Copyright (c) 2011 Red Hat, Inc; ALT Linux Team; Peter V. Saveliev
+#
+#     This file was written for VDSM project and uses code from Connexion
+#     library.
+#
+#     Connexion is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Connexion is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Connexion; if not, write to the Free Software
+#     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+Interface counters sampler:
+
+    sampler = NLStatsSampler(rate=100,depth=1000)
+    Thread(target=sampler.run).start()
+    ...
+    (indexes,rates) = sampler.ring.rates()
+
+Each sample is one RTM_GETSTATS dump of IFLA_STATS_LINK_64 for all
+the links; kernels without RTM_GETSTATS (the dump fails with
+EOPNOTSUPP or EINVAL) get RTM_GETLINK dumps, and IFLA_STATS64 is taken
+from them. Other dump errors are raised by sample(). The request is encoded once, the
+replies are received into the pool buffers and only the index and
+the counters are unpacked, no records are built.
+
+The samples are kept in an nl_stats_ring: for every interface a ring
+of the last depth samples of the first fields counters of t_stats64
+(rx_packets, tx_packets, rx_bytes, tx_bytes, ...), and one ring of
+timestamps, shared by all the interfaces. The storage is a NumPy
+array (interfaces x depth x fields), if NumPy is available, or a
+flat array("L") (64 bit on Linux) of the same layout otherwise; then
+deltas() and rates() return lists instead of NumPy arrays.
+"""
+
+import time
+from os import strerror
+from errno import EOPNOTSUPP, EINVAL
+from array import array
+from struct import Struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from nlconfig import nl_socket, nl_pool, nl_iter, nl_send_raw, nl_request, libc
+from nlconfig import s_nlmsghdr, s_nlattr, s_i32, t_stats64
+from nlconfig import RTNLGRP_NONE, NLM_F_DUMP, NLM_F_REQUEST, NLMSG_ERROR
+from nlconfig import RTM_GETSTATS, RTM_NEWSTATS, RTM_GETLINK, RTM_NEWLINK
+from nlconfig import IFLA_STATS64, NLA_TYPE_MASK
+
+__all__ = [ "NLStatsSampler", "nl_stats_ring" ]
+
+IFLA_STATS_LINK_64 = 1
+
+# offsets of the attributes in RTM_NEWSTATS and RTM_NEWLINK messages
+STATS_ATTR_OFFSET = 16 + 12
+LINK_ATTR_OFFSET = 16 + 16
+
+
+class nl_stats_ring (object):
+    """
+    Per-interface ring buffers of counters
+    """
+    def __init__(self,depth=1024,fields=8):
+        self.depth = depth
+        self.fields = fields
+        self.slots = {}             # ifindex -> slot
+        self.indexes = []           # slot -> ifindex
+        self.times = array("d",[0.0]) * depth
+        self.count = 0              # samples stored
+        if numpy is not None:
+            self.data = numpy.zeros((0,depth,fields),numpy.uint64)
+            self.seen = numpy.zeros((0,depth),numpy.int64)
+        else:
+            self.data = array("L")
+            self.seen = array("l")
+
+    def slot(self,index):
+        """
+        Get the slot of an interface, allocate it for a new one
+        """
+        slot = self.slots.get(index)
+        if slot is not None:
+            return slot
+        slot = self.slots[index] = len(self.indexes)
+        self.indexes.append(index)
+        if numpy is not None:
+            if slot == len(self.data):
+                # grow by doubling, it happens only for new interfaces
+                size = max(slot * 2,16)
+                data = numpy.zeros((size,self.depth,self.fields),numpy.uint64)
+                data[:slot] = self.data
+                seen = numpy.zeros((size,self.depth),numpy.int64) - 1
+                seen[:slot] = self.seen
+                (self.data,self.seen) = (data,seen)
+        else:
+            self.data.extend(array("L",[0]) * (self.depth * self.fields))
+            self.seen.extend(array("l",[-1]) * self.depth)
+        return slot
+
+    def store(self,timestamp,samples):
+        """
+        Store one sample: [ (ifindex, counters), ... ]
+        """
+        head = self.count % self.depth
+        self.times[head] = timestamp
+        if numpy is not None:
+            if samples:
+                slots = [ self.slot(x[0]) for x in samples ]
+                self.data[slots,head] = [ x[1] for x in samples ]
+                self.seen[slots,head] = self.count
+        else:
+            (depth,fields) = (self.depth,self.fields)
+            for (index,counters) in samples:
+                slot = self.slot(index)
+                base = (slot * depth + head) * fields
+                self.data[base:base + fields] = array("L",counters)
+                self.seen[slot * depth + head] = self.count
+        self.count += 1
+
+    def deltas(self,window=1):
+        """
+        Get counter deltas between the last sample and the sample
+        window samples before, for all the interfaces present in
+        both: (indexes, deltas, seconds). A counter, that went back
+        (the interface was reset), gives 0.
+        """
+        last = self.count - 1
+        prev = last - window
+        if window < 1 or window >= self.depth or prev < 0:
+            return ([],[],0.0)
+        (h,p) = (last % self.depth,prev % self.depth)
+        dt = self.times[h] - self.times[p]
+        count = len(self.indexes)
+        if numpy is not None:
+            valid = (self.seen[:count,h] == last) & (self.seen[:count,p] == prev)
+            cur = self.data[:count,h][valid]
+            old = self.data[:count,p][valid]
+            delta = numpy.where(cur >= old,cur - old,0)
+            indexes = numpy.array(self.indexes,numpy.int64)[valid]
+            return (indexes.tolist(),delta,dt)
+
+        (depth,fields) = (self.depth,self.fields)
+        (data,seen) = (self.data,self.seen)
+        indexes = []
+        delta = []
+        for slot in xrange(count):
+            if seen[slot * depth + h] != last or seen[slot * depth + p] != prev:
+                continue
+            hb = (slot * depth + h) * fields
+            pb = (slot * depth + p) * fields
+            delta.append([ max(x - y,0) for (x,y) in
+                            zip(data[hb:hb + fields],data[pb:pb + fields]) ])
+            indexes.append(self.indexes[slot])
+        return (indexes,delta,dt)
+
+    def rates(self,window=1):
+        """
+        Get counter rates per second, see deltas(): (indexes, rates)
+        """
+        (indexes,delta,dt) = self.deltas(window)
+        if not dt:
+            return ([],[])
+        if numpy is not None:
+            return (indexes,delta / dt)
+        return (indexes,[ [ x / dt for x in y ] for y in delta ])
+
+    def history(self,index):
+        """
+        Get [ (timestamp, counters), ... ] of one interface, the
+        oldest first
+        """
+        slot = self.slots.get(index)
+        if slot is None:
+            return []
+        ret = []
+        for n in xrange(max(self.count - self.depth,0),self.count):
+            h = n % self.depth
+            if numpy is not None:
+                if self.seen[slot,h] == n:
+                    ret.append((self.times[h],tuple(self.data[slot,h].tolist())))
+            elif self.seen[slot * self.depth + h] == n:
+                base = (slot * self.depth + h) * self.fields
+                ret.append((self.times[h],tuple(self.data[base:base + self.fields])))
+        return ret
+
+
+class NLStatsSampler(object):
+    """
+    Periodic IFLA_STATS64 dumps into an nl_stats_ring
+    """
+    fallback = False    # RTM_GETLINK dumps are used, see sample()
+
+    def __init__(self,rate=10,depth=1024,fields=8,pool=None):
+        assert fields <= len(t_stats64)
+        self.period = 1.0 / rate
+        self.ring = nl_stats_ring(depth,fields)
+        self.pool = pool or nl_pool()
+        self.fd = nl_socket(RTNLGRP_NONE)
+        self.counters = Struct("=%iQ" % fields).unpack_from
+        self.size = fields * 8
+        self.error = 0
+        self.missed = 0             # samples skipped, see run()
+        req = nl_request(RTM_GETSTATS,NLM_F_DUMP | NLM_F_REQUEST)
+        req.if_stats_msg(filter_mask=1 << (IFLA_STATS_LINK_64 - 1))
+        self.request = req.encode()
+
+    def decode(self,buf,offset=0,inet6=False):
+        """
+        Get (ifindex, counters) from a message, see nl_get_datagram()
+        """
+        (length,t) = s_nlmsghdr.unpack_from(buf,offset)[:2]
+        if t == RTM_NEWSTATS:
+            (ptr,attr) = (offset + STATS_ATTR_OFFSET,IFLA_STATS_LINK_64)
+        elif t == RTM_NEWLINK:
+            (ptr,attr) = (offset + LINK_ATTR_OFFSET,IFLA_STATS64)
+        else:
+            if t == NLMSG_ERROR:
+                self.error = s_i32.unpack_from(buf,offset + 16)[0]
+            return None
+        end = offset + length
+        unpack_attr = s_nlattr.unpack_from
+        while ptr + 4 <= end:
+            (l,a) = unpack_attr(buf,ptr)
+            if l < 4:
+                break
+            if a & NLA_TYPE_MASK == attr and l - 4 >= self.size:
+                # the index is at the same offset in both headers
+                return (s_i32.unpack_from(buf,offset + 20)[0],
+                        self.counters(buf,ptr + 4))
+            ptr += (l + 3) & ~3
+        return None
+
+    def dump(self):
+        """
+        Send the request and get the samples; the error of the dump,
+        if any, is left in self.error
+        """
+        self.error = 0
+        nl_send_raw(self.fd,self.request)
+        return list(nl_iter(self.fd,self.pool,decode=self.decode))
+
+    def sample(self):
+        """
+        Take one sample. Returns the number of interfaces sampled.
+        """
+        timestamp = time.time()
+        samples = self.dump()
+        if self.error in (-EOPNOTSUPP,-EINVAL) and not self.fallback:
+            # no RTM_GETSTATS: fall back to RTM_GETLINK dumps
+            self.fallback = True
+            req = nl_request(RTM_GETLINK,NLM_F_DUMP | NLM_F_REQUEST)
+            self.request = req.ifinfmsg().encode()
+            samples = self.dump()
+        if self.error:
+            raise OSError(-self.error,strerror(-self.error))
+        self.ring.store(timestamp,samples)
+        return len(samples)
+
+    def run(self,count=None):
+        """
+        Take samples at the rate, forever or count times. If a
+        sample takes longer, than the period, the next ones are not
+        hurried, but skipped and counted in self.missed.
+        """
+        deadline = time.time()
+        while self.fd != -1 and (count is None or count > 0):
+            self.sample()
+            if count is not None:
+                count -= 1
+            deadline += self.period
+            delay = deadline - time.time()
+            if delay <= 0:
+                skip = int(-delay / self.period) + 1
+                self.missed += skip
+                deadline += skip * self.period
+                delay = deadline - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+    def close(self):
+        libc.close(self.fd)
+        self.fd = -1
+
+
+if __name__ == "__main__":
+    import sys
+    rate = len(sys.argv) > 1 and float(sys.argv[1]) or 10
+    sampler = NLStatsSampler(rate)
+    sampler.run(int(rate) + 1)
+    (indexes,rates) = sampler.ring.rates(int(rate))
+    for (index,x) in zip(indexes,rates):
+        print index, " ".join([ "%s: %.1f" % y for y in zip(t_stats64,x) ])
+    sampler.close()
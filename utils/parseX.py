@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Microbenchmark: ctypes nl_parse() vs struct/memoryview nl_decode()
+
+Dumps links and addresses once, keeps the raw datagrams and then
+parses them again and again with both decoders.
+"""
+
+from nlconfig import nl_socket, nl_send, nl_recv, nl_parse, nl_decode
+from nlconfig import nl_buffer, rtnl_msg, s_nlmsghdr
+from nlconfig import RTM_GETLINK, RTM_GETADDR, NLM_F_DUMP, NLM_F_REQUEST
+from nlconfig import NLMSG_DONE, libc
+from ctypes import addressof
+from sys import argv
+import timeit
+
+
+if len(argv) < 2:
+    tc = 100
+else:
+    tc = int(argv[1])
+
+# collect raw datagrams: [ (msg, [ offset, ... ]), ... ]
+datagrams = []
+s = nl_socket()
+req = rtnl_msg()
+req.hdr.flags = NLM_F_DUMP | NLM_F_REQUEST
+for t in (RTM_GETLINK,RTM_GETADDR):
+    req.hdr.type = t
+    nl_send(s,req)
+    end = False
+    while not end:
+        (l,msg) = nl_recv(s)
+        offsets = []
+        bias = 0
+        while bias < l:
+            (length,mtype) = s_nlmsghdr.unpack_from(nl_buffer(msg),bias)[:2]
+            offsets.append(bias)
+            end = mtype == NLMSG_DONE
+            bias += length
+        datagrams.append((msg,offsets))
+libc.close(s)
+
+def ctypes_path():
+    for (msg,offsets) in datagrams:
+        base = addressof(msg)
+        for x in offsets:
+            nl_parse(rtnl_msg.from_address(base + x))
+
+def struct_path():
+    for (msg,offsets) in datagrams:
+        buf = nl_buffer(msg)
+        for x in offsets:
+            nl_decode(buf,x)
+
+# check compatibility
+count = 0
+for (msg,offsets) in datagrams:
+    for x in offsets:
+        a = nl_parse(rtnl_msg.from_address(addressof(msg) + x))
+        b = nl_decode(nl_buffer(msg),x)
+        if a is None or b is None:
+            assert a is b
+            continue
+        count += 1
+        for (k,v) in a.items():
+            assert b[k] == v, (k,v,b[k])
+
+c = timeit.Timer("ctypes_path()","from __main__ import ctypes_path")
+d = timeit.Timer("struct_path()","from __main__ import struct_path")
+
+print "messages: %s in %s datagrams" % (count,len(datagrams))
+print "nl_parse  timeit per %s cycles: %s" % (tc,c.timeit(tc))
+print "nl_decode timeit per %s cycles: %s" % (tc,d.timeit(tc))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+"""
+Throughput of concurrent nlconfig() calls over a socket pool,
+by the number of threads
+"""
+
+from nlconfig import nlconfig, nl_socket_pool
+from threading import Thread
+from sys import argv
+import time
+
+
+if len(argv) < 2:
+    tc = 100
+else:
+    tc = int(argv[1])
+
+def worker(sockets,count):
+    for i in range(count):
+        nlconfig(sockets=sockets)
+
+for threads in (1,2,4,8,16):
+    sockets = nl_socket_pool(threads)
+    pool = [ Thread(target=worker,args=(sockets,tc)) for x in range(threads) ]
+    t = time.time()
+    [ x.start() for x in pool ]
+    [ x.join() for x in pool ]
+    t = time.time() - t
+    sockets.close()
+    print "threads: %-4s calls/s: %.1f" % (threads,threads * tc / t)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+nlasync tests; they use the netlink sockets of the running system
+and trollius (or asyncio):
+
+    $ python test_nlasync.py
+"""
+
+import unittest
+
+from nlconfig import nlconfig, nl_routes, nl_neighs
+from nlconfig import RTM_GETLINK, RTM_GETROUTE, RTM_GETNEIGH, RTM_GETSTATS
+from nlasync import NLAsync, asyncio
+
+
+class AsyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.client = NLAsync(self.loop)
+
+    def tearDown(self):
+        self.client.close()
+        self.loop.close()
+
+    def run_until_complete(self,future):
+        return self.loop.run_until_complete(future)
+
+    def test_nlconfig(self):
+        self.assertEqual(self.run_until_complete(self.client.nlconfig()),nlconfig())
+
+    def test_requests(self):
+        # queued and sent one by one
+        futures = [ self.client.request(x) for x in (RTM_GETLINK,RTM_GETROUTE,RTM_GETNEIGH) ]
+        (links,routes,neighs) = [ self.run_until_complete(x) for x in futures ]
+        self.assertTrue([ x for x in links if x.get('index') == 1 ])
+        self.assertEqual([ x for x in routes if x['type'] == 'route' ],nl_routes())
+        self.assertEqual(len([ x for x in neighs if x['type'] == 'neigh' ]),len(nl_neighs()))
+
+    def test_type(self):
+        self.assertRaises(ValueError,self.client.request,RTM_GETSTATS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Event cache tests; the caches dump the netlink data of the running
+system, the notifications are fed through a socket pair instead of
+the netlink socket:
+
+    $ python test_nlcache.py
+"""
+
+import os
+import random
+import socket
+import unittest
+
+from nlconfig import nl_request, nl_decode, nlconfig, libc
+from nlconfig import RTM_NEWNEIGH, RTM_DELNEIGH, RTM_NEWLINK, NLMSG_OVERRUN
+from nlconfig import NDA_DST, NDA_LLADDR, NDA_MASTER, IFLA_ADDRESS, IFLA_IFNAME
+from nlcache import NLEventCache, NLConfigCache
+from nlneigh import NLNeighCache, nl_neigh_table
+from nlroute import nl_trie, nl_route_table, ip4_int
+
+AF_BRIDGE = 7
+
+def neigh(t,family,index,dest=None,lladdr=None,master=None):
+    """
+    Encode a neighbour notification
+    """
+    req = nl_request(t,0).ndmsg(family=family,index=index,state=2)
+    if dest is not None:
+        req.attr(NDA_DST,socket.inet_pton(family,dest))
+    if lladdr is not None:
+        req.attr(NDA_LLADDR,"".join([ chr(int(x,16)) for x in lladdr.split(":") ]))
+    if master is not None:
+        req.attr(NDA_MASTER,chr(master) + "\0\0\0")
+    return req.encode()
+
+def feed(cache):
+    """
+    Replace the notification socket of a cache with a socket pair,
+    return the other end
+    """
+    (a,b) = socket.socketpair(socket.AF_UNIX,socket.SOCK_DGRAM)
+    libc.close(cache.fd)
+    cache.fd = os.dup(a.fileno())
+    a.close()
+    return b
+
+
+class EventCacheTest(unittest.TestCase):
+
+    def test_abstract(self):
+        class NoApply(NLEventCache):
+            def load(self):
+                pass
+        self.assertRaises(TypeError,NLEventCache)
+        self.assertRaises(TypeError,NoApply)
+
+
+class ConfigCacheTest(unittest.TestCase):
+
+    def test_overrun(self):
+        cache = NLConfigCache()
+        try:
+            s = feed(cache)
+            ret = cache.get()
+            self.assertEqual(ret,nlconfig())
+            # lost events: a stale entry and a changed one
+            ret['gone0'] = { 'hwaddr': '', 'addr': '', 'netmask': '' }
+            lo = ret['lo']
+            lo['addr'] = '10.255.255.1'
+            s.send(nl_request(NLMSG_OVERRUN,0).encode())
+            # queued after the overrun: dropped, the dump has it all
+            link = nl_request(RTM_NEWLINK,0).ifinfmsg(index=0x7ffffff0)
+            link.attr(IFLA_ADDRESS,"\2\0\0\0\0\1").attr(IFLA_IFNAME,"new0\0")
+            s.send(link.encode())
+            self.assertEqual(cache.update(),0)
+            self.assertEqual((cache.overruns,cache.resyncs,cache.resynced),(1,1,2))
+            # the same dictionary and entries, updated in place
+            self.assertTrue(cache.get() is ret)
+            self.assertTrue(ret['lo'] is lo)
+            self.assertEqual(ret,nlconfig())
+        finally:
+            cache.close()
+
+
+class RouteTest(unittest.TestCase):
+
+    prefixes = [ ("0.0.0.0",0),("10.0.0.0",8),("10.1.0.0",16),
+                 ("10.1.2.0",24),("10.1.2.3",32),("192.168.0.0",16) ]
+
+    def match(self,prefixes,address):
+        # the longest prefix, that covers the address
+        best = None
+        for (key,plen) in prefixes:
+            mask = (0xffffffff << (32 - plen)) & 0xffffffff
+            if (address ^ key) & mask == 0 and (best is None or plen > best[1]):
+                best = (key,plen)
+        return best
+
+    def lookup(self,trie,address):
+        n = trie.lookup(address)
+        if n == -1:
+            return None
+        return trie.prefix(n)
+
+    def test_trie(self):
+        trie = nl_trie()
+        for (i,(key,plen)) in enumerate(self.prefixes):
+            self.assertEqual(trie.insert(ip4_int(key),plen,i),-1)
+        self.assertEqual(len(trie),len(self.prefixes))
+        for (address,i) in (("10.1.2.3",4),("10.1.2.4",3),("10.1.3.1",2),
+                            ("10.2.0.1",1),("11.0.0.1",0),("192.168.1.1",5),
+                            ("255.255.255.255",0)):
+            self.assertEqual(trie.value[trie.lookup(ip4_int(address))],i)
+        self.assertEqual(trie.get(ip4_int("10.1.0.0"),16),2)
+        self.assertEqual(trie.get(ip4_int("10.1.0.0"),15),-1)
+        # replace
+        self.assertEqual(trie.insert(ip4_int("10.1.0.0"),16,9),2)
+        self.assertEqual(len(trie),len(self.prefixes))
+        # remove the default route and the inner prefixes
+        for (key,plen,i) in (("0.0.0.0",0,0),("10.1.0.0",16,9),("10.1.2.0",24,3)):
+            self.assertEqual(trie.remove(ip4_int(key),plen),i)
+            self.assertEqual(trie.remove(ip4_int(key),plen),-1)
+        self.assertEqual(trie.lookup(ip4_int("11.0.0.1")),-1)
+        self.assertEqual(trie.value[trie.lookup(ip4_int("10.1.2.4"))],1)
+        self.assertEqual(sorted([ x[2] for x in trie ]),[ 1,4,5 ])
+
+    def test_random(self):
+        # compared with a linear search
+        rnd = random.Random(1)
+        trie = nl_trie()
+        prefixes = set()
+        for i in range(2000):
+            plen = rnd.randint(0,32)
+            key = rnd.getrandbits(32) & ((0xffffffff << (32 - plen)) & 0xffffffff)
+            trie.insert(key,plen,0)
+            prefixes.add((key,plen))
+        for x in rnd.sample(sorted(prefixes),1000):
+            trie.remove(*x)
+            prefixes.remove(x)
+        self.assertEqual(len(trie),len(prefixes))
+        self.assertEqual(set([ x[:2] for x in trie ]),prefixes)
+        for (key,plen) in prefixes:
+            self.assertEqual(self.lookup(trie,key),self.match(prefixes,key))
+        for i in range(2000):
+            address = rnd.getrandbits(32)
+            self.assertEqual(self.lookup(trie,address),self.match(prefixes,address))
+        # the released nodes are reused
+        size = len(trie.key)
+        [ trie.remove(*x) for x in list(prefixes) ]
+        self.assertEqual((len(trie),trie.root),(0,-1))
+        [ trie.insert(key,plen,0) for (key,plen) in prefixes ]
+        self.assertEqual(len(trie.key),size)
+
+    def test_table(self):
+        routes = nl_route_table()
+        def route(action,prefix,plen,gateway,priority=None,table=254):
+            return { "type": "route", "action": action, "table": table,
+                     "dst_prefix": prefix, "dst_len": plen,
+                     "gateway": gateway, "output_link": 2,
+                     "priority": priority }
+        routes.apply(route("add","0.0.0.0",0,"10.0.0.1"))
+        routes.apply(route("add","10.1.0.0",16,"10.0.0.2",100))
+        routes.apply(route("add","10.1.0.0",16,"10.0.0.3",50))
+        routes.apply(route("add","10.1.0.0",16,"10.0.0.4",50,table=100))
+        # IPv6 routes are skipped
+        routes.apply(route("add","fe80::",64,"fe80::1"))
+        self.assertEqual(len(routes),3)
+        # the preferred route: the lowest priority
+        self.assertEqual(routes.lookup("10.1.2.3")['gateway'],"10.0.0.3")
+        self.assertEqual(routes.lookup("10.1.2.3",100)['gateway'],"10.0.0.4")
+        self.assertEqual(routes.lookup("10.2.0.1")['gateway'],"10.0.0.1")
+        routes.apply(route("remove","10.1.0.0",16,"10.0.0.3",50))
+        self.assertEqual(routes.lookup("10.1.2.3")['gateway'],"10.0.0.2")
+        routes.apply(route("remove","10.1.0.0",16,"10.0.0.2",100))
+        self.assertEqual(routes.lookup("10.1.2.3")['dst_len'],0)
+        routes.apply(route("remove","10.1.0.0",16,"10.0.0.4",50,table=100))
+        self.assertEqual(routes.lookup("10.1.2.3",100),None)
+        self.assertEqual([ x['gateway'] for x in routes.routes() ],[ "10.0.0.1" ])
+
+
+class NeighTest(unittest.TestCase):
+
+    def test_table(self):
+        t = nl_neigh_table()
+        for (index,dest) in ((2,"10.0.0.1"),(3,"10.0.0.1")):
+            t.add({ "index": index, "dest": dest,
+                    "lladdr": "00:02:b3:39:2e:4c", "state": 2 })
+        self.assertEqual(t.lookup(2,"10.0.0.1"),"00:02:b3:39:2e:4c")
+        self.assertEqual(sorted(t.find("00:02:b3:39:2e:4c")),[ (2,"10.0.0.1"),(3,"10.0.0.1") ])
+        t.apply({ "action": "remove", "index": 2, "dest": "10.0.0.1" })
+        self.assertEqual(t.find("00:02:b3:39:2e:4c"),[ (3,"10.0.0.1") ])
+        self.assertEqual(t.lookup(2,"10.0.0.1"),None)
+        self.assertEqual(len(t),1)
+
+    def test_bridge(self):
+        # bridge FDB entries have no NDA_DST, they are not neighbours
+        fdb = neigh(RTM_NEWNEIGH,AF_BRIDGE,0x7ffffff0,
+                    lladdr="02:00:00:00:00:01",master=3)
+        self.assertEqual(nl_decode(memoryview(fdb),0,True),None)
+
+        cache = NLNeighCache()
+        try:
+            s = feed(cache)
+            s.send(fdb)
+            s.send(neigh(RTM_NEWNEIGH,socket.AF_INET,0x7ffffff0,
+                         "10.255.0.1","02:00:00:00:00:02"))
+            s.send(neigh(RTM_NEWNEIGH,socket.AF_INET6,0x7ffffff0,
+                         "fe80::1","02:00:00:00:00:03"))
+            self.assertEqual(cache.update(),2)
+            self.assertEqual(cache.lookup(0x7ffffff0,"10.255.0.1"),"02:00:00:00:00:02")
+            self.assertEqual(cache.find("02:00:00:00:00:03"),[ (0x7ffffff0,"fe80::1") ])
+            self.assertEqual(cache.find("02:00:00:00:00:01"),[])
+            s.send(neigh(RTM_DELNEIGH,socket.AF_INET,0x7ffffff0,"10.255.0.1"))
+            self.assertEqual(cache.update(),1)
+            self.assertEqual(cache.lookup(0x7ffffff0,"10.255.0.1"),None)
+        finally:
+            cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
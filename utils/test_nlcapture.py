@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+nlcapture tests; the captures are temporary files:
+
+    $ python test_nlcapture.py
+"""
+
+import os
+import tempfile
+import unittest
+from socket import AF_INET
+from struct import pack
+
+from nlconfig import nl_request, nl_decode, s_u32
+from nlconfig import RTM_NEWLINK, RTM_NEWADDR, NLM_F_MULTI
+from nlconfig import IFLA_IFNAME, IFLA_MTU, IFA_ADDRESS, IFA_LOCAL, IFA_LABEL
+from nlcapture import nl_recorder, nl_reader
+
+def datagrams():
+    link = nl_request(RTM_NEWLINK,NLM_F_MULTI).ifinfmsg(type=1,index=2,flags=0x1043)
+    link.attr(IFLA_IFNAME,"eth0\0").attr(IFLA_MTU,s_u32.pack(1500))
+    addr = nl_request(RTM_NEWADDR,NLM_F_MULTI).ifaddrmsg(family=AF_INET,prefixlen=24,index=2)
+    ip = pack(">I",0x0a000001)
+    addr.attr(IFA_ADDRESS,ip).attr(IFA_LOCAL,ip).attr(IFA_LABEL,"eth0\0")
+    # two messages in the first datagram, one in the second
+    return [ link.encode() + addr.encode(),addr.encode() ]
+
+
+class CaptureTest(unittest.TestCase):
+
+    def setUp(self):
+        (fd,self.path) = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def record(self):
+        recorder = nl_recorder(self.path)
+        for (i,x) in enumerate(datagrams()):
+            recorder.write(memoryview(x),len(x),1000.0 + i)
+        recorder.close()
+
+    def expected(self):
+        ret = []
+        for (i,x) in enumerate(datagrams()):
+            buf = memoryview(x)
+            offset = 0
+            while offset < len(x):
+                ret.append((1000.0 + i,nl_decode(buf,offset)))
+                offset += s_u32.unpack_from(x,offset)[0]
+        return ret
+
+    def read(self):
+        reader = nl_reader(self.path)
+        try:
+            return (list(reader.records()),reader.truncated)
+        finally:
+            reader.close()
+
+    def test_round_trip(self):
+        self.record()
+        (records,truncated) = self.read()
+        self.assertEqual(records,self.expected())
+        self.assertEqual([ x[1]['type'] for x in records ],[ "link","address","address" ])
+        self.assertFalse(truncated)
+
+    def test_truncated(self):
+        self.record()
+        size = os.path.getsize(self.path)
+        # a part of the last datagram, of the last frame header
+        for cut in (size - 1,size - len(datagrams()[1]) - 3):
+            f = open(self.path,"r+b")
+            f.truncate(cut)
+            f.close()
+            (records,truncated) = self.read()
+            self.assertEqual(records,self.expected()[:2])
+            self.assertTrue(truncated)
+
+    def test_garbage_length(self):
+        self.record()
+        # the length of the second message of the first datagram
+        # points beyond the datagram
+        f = open(self.path,"r+b")
+        f.seek(8 + 12 + s_u32.unpack_from(datagrams()[0])[0])
+        f.write(s_u32.pack(0xffff))
+        f.close()
+        (records,truncated) = self.read()
+        self.assertEqual(records,[ self.expected()[0],self.expected()[2] ])
+
+    def test_empty(self):
+        (records,truncated) = self.read()
+        self.assertEqual(records,[])
+        f = open(self.path,"wb")
+        f.write("NLC")
+        f.close()
+        self.assertEqual(self.read()[0],[])
+        f = open(self.path,"wb")
+        f.write("XY")
+        f.close()
+        self.assertRaises(Exception,nl_reader,self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+"""
+nlconfig tests; they use the netlink sockets of the running system,
+so the loopback interface (index 1) must exist:
+
+    $ python test_nlconfig.py
+"""
+
+import unittest
+from ctypes import addressof, memmove
+from socket import AF_INET, AF_INET6, inet_pton
+
+import nlconfig
+from nlconfig import nl_channel, nl_socket_pool, nl_sequence, nl_links, nlconfig_iter
+from nlconfig import nl_request, nl_socket, nl_send_raw, nl_recv, nl_buffer, libc
+from nlconfig import nl_parse, nl_decode, nl_lazy, nl_record, rtnl_msg, s_u32, s_nlmsghdr
+from nlconfig import RTM_NEWLINK, RTM_NEWADDR, RTM_DELADDR, RTM_GETLINK, RTM_GETADDR
+from nlconfig import NLM_F_DUMP, NLM_F_REQUEST, NLM_F_MULTI, NLMSG_DONE, RTNLGRP_NONE
+from nlconfig import IFLA_ADDRESS, IFLA_IFNAME, IFLA_MTU
+from nlconfig import IFA_ADDRESS, IFA_LOCAL, IFA_LABEL
+
+def link(index=2,name="eth0",hwaddr="\x00\x02\xb3\x39\x2e\x4c"):
+    req = nl_request(RTM_NEWLINK,NLM_F_MULTI).ifinfmsg(type=1,index=index,flags=0x1043)
+    req.attr(IFLA_ADDRESS,hwaddr).attr(IFLA_IFNAME,name + "\0").attr(IFLA_MTU,s_u32.pack(1500))
+    return req.encode()
+
+def address(t=RTM_NEWADDR,family=AF_INET,local="10.0.0.1",prefixlen=24,label="eth0"):
+    req = nl_request(t,NLM_F_MULTI).ifaddrmsg(family=family,prefixlen=prefixlen,index=2)
+    ip = inet_pton(family,local)
+    req.attr(IFA_ADDRESS,ip).attr(IFA_LOCAL,ip)
+    if label is not None:
+        req.attr(IFA_LABEL,label + "\0")
+    return req.encode()
+
+def parse(data):
+    """
+    The old decoder: nl_parse() of a ctypes copy
+    """
+    msg = rtnl_msg()
+    memmove(addressof(msg),data,len(data))
+    return nl_parse(msg)
+
+
+class SequenceTest(unittest.TestCase):
+
+    def test_wrap(self):
+        self.assertEqual(nl_sequence(0),1)
+        self.assertEqual(nl_sequence(0xfffffffe),0xffffffff)
+        # 0 is skipped
+        self.assertEqual(nl_sequence(0xffffffff),1)
+        # a range does not cross the top
+        self.assertEqual(nl_sequence(0xfffffffe,2),1)
+        self.assertEqual(nl_sequence(0xfffffffd,2),0xfffffffe)
+
+    def test_channel(self):
+        channel = nl_channel()
+        try:
+            channel.seq = 0xfffffffe
+            self.assertEqual(channel.sequence(),0xffffffff)
+            self.assertEqual(channel.sequence(),1)
+            # the dump uses two numbers, seq and seq + 1
+            channel.seq = 0xfffffffe
+            self.assertTrue([ x for x in channel.dump() if x['index'] == 1 ])
+            self.assertEqual(channel.seq,2)
+        finally:
+            channel.close()
+
+
+class DumpTest(unittest.TestCase):
+
+    def abandon(self,channel):
+        # one datagram per recv(): the dump is not finished
+        channel.pool = nlconfig.nl_pool(1)
+        dump = channel.dump()
+        dump.next()
+        dump.close()
+
+    def test_busy(self):
+        channel = nl_channel()
+        try:
+            self.abandon(channel)
+            self.assertRaises(OSError,list,channel.dump())
+        finally:
+            channel.close()
+
+    def test_abandoned(self):
+        sockets = nl_socket_pool(1)
+        try:
+            expected = nlconfig.nlconfig(sockets=sockets)
+            channel = sockets.acquire()
+            sockets.release(channel)
+            dump = nlconfig_iter(sockets=sockets)
+            channel.pool = nlconfig.nl_pool(1)
+            dump.next()
+            dump.close()
+            # the channel is replaced
+            self.assertEqual(nlconfig.nlconfig(sockets=sockets),expected)
+            replaced = sockets.acquire()
+            sockets.release(replaced)
+            self.assertTrue(replaced is not channel)
+        finally:
+            sockets.close()
+
+
+class DecoderTest(unittest.TestCase):
+
+    def compare(self,data):
+        # every key of nl_parse() has the same value in nl_decode()
+        old = parse(data)
+        new = nl_decode(memoryview(data))
+        if old is None:
+            self.assertEqual(new,None)
+            return
+        self.assertEqual(dict([ (x,new.get(x)) for x in old.keys() ]),old)
+        return new
+
+    def test_link(self):
+        r = self.compare(link())
+        self.assertEqual((r['dev'],r['hwaddr'],r['index'],r['mtu']),
+                         ("eth0","00:02:b3:39:2e:4c",2,1500))
+        self.assertEqual(r['action'],"add")
+
+    def test_address(self):
+        for prefixlen in (0,8,24,31,32):
+            r = self.compare(address(prefixlen=prefixlen))
+            self.assertEqual(r['local'],"10.0.0.1")
+        r = self.compare(address(RTM_DELADDR,label=None))
+        self.assertEqual((r['mask'],r['action']),("255.255.255.0","remove"))
+        self.assertFalse(r.has_key('dev'))
+
+    def test_inet6(self):
+        data = address(family=AF_INET6,local="fe80::1",prefixlen=64)
+        self.compare(data)
+        r = nl_decode(memoryview(data),0,True)
+        self.assertEqual((r['local'],r['mask']),("fe80::1",64))
+
+    def test_dump(self):
+        # the messages of the running system
+        s = nl_socket(RTNLGRP_NONE)
+        try:
+            counts = []
+            for t in (RTM_GETLINK,RTM_GETADDR):
+                nl_send_raw(s,nl_request(t,NLM_F_DUMP | NLM_F_REQUEST).ifinfmsg().encode())
+                count = 0
+                end = False
+                while not end:
+                    (l,msg) = nl_recv(s)
+                    buf = nl_buffer(msg)
+                    bias = 0
+                    while bias < l:
+                        data = buf[bias:bias + s_u32.unpack_from(buf,bias)[0]].tobytes()
+                        bias += len(data)
+                        if s_nlmsghdr.unpack_from(data)[1] == NLMSG_DONE:
+                            end = True
+                            break
+                        self.compare(data)
+                        count += 1
+                counts.append(count)
+            # there can be no addresses, but lo is always there
+            self.assertTrue(counts[0] > 0)
+        finally:
+            libc.close(s)
+
+
+class RecordTest(unittest.TestCase):
+
+    def test_lazy(self):
+        for data in (link(),address()):
+            r = nl_lazy(memoryview(data))
+            self.assertTrue(isinstance(r,nl_record))
+            self.assertEqual(r,nl_decode(memoryview(data)))
+            self.assertEqual(sorted(r.keys()),sorted(nl_decode(memoryview(data)).keys()))
+
+    def test_access(self):
+        r = nl_lazy(memoryview(link()))
+        # nothing is decoded until accessed
+        self.assertEqual((r.cache,r.header),(None,None))
+        self.assertEqual(r['dev'],"eth0")
+        self.assertEqual(r.cache,{ "dev": "eth0" })
+        self.assertEqual(r.header,None)
+        self.assertEqual(r['index'],2)
+        self.assertTrue(r.header is not None)
+        self.assertTrue('hwaddr' in r)
+        self.assertRaises(KeyError,r.__getitem__,"local")
+        self.assertEqual(r.get("local","-"),"-")
+        # changes decode everything
+        r['dev'] = "eth1"
+        self.assertEqual(r.data,None)
+        self.assertEqual((r['dev'],r['mtu']),("eth1",1500))
+
+    def test_drop(self):
+        data = address(family=AF_INET6,local="fe80::1",prefixlen=64)
+        self.assertEqual(nl_lazy(memoryview(data)),None)
+        self.assertEqual(nl_lazy(memoryview(data),0,True),nl_decode(memoryview(data),0,True))
+
+
+class LinksTest(unittest.TestCase):
+
+    def check(self,ret,count):
+        self.assertEqual(len(ret),count + 3)
+        self.assertEqual(set([ x['dev'] for x in ret[:count] ]),set(["lo"]))
+        self.assertEqual(ret[count],None)
+        self.assertEqual(ret[count + 1]['index'],1)
+        self.assertEqual(ret[count + 2],None)
+
+    def test_batches(self):
+        # the replies do not fit into the receive buffer at once
+        for count in (300,1000):
+            self.check(nl_links([1] * count + [0x7fffffff],["lo","nosuch0"]),count)
+
+    def test_overrun(self):
+        # one batch, that overruns the socket: the links are dumped
+        dumps = []
+        (size,dump) = (nlconfig.NL_LINK_REPLY_SIZE,nlconfig.nl_links_dump)
+        def links_dump(*argv):
+            dumps.append(argv)
+            return dump(*argv)
+        nlconfig.NL_LINK_REPLY_SIZE = 1
+        nlconfig.nl_links_dump = links_dump
+        try:
+            self.check(nl_links([1] * 1000 + [0x7fffffff],["lo","nosuch0"]),1000)
+        finally:
+            nlconfig.NL_LINK_REPLY_SIZE = size
+            nlconfig.nl_links_dump = dump
+        self.assertEqual(len(dumps),1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+nlparallel tests; they use the netlink sockets of the running system:
+
+    $ python test_nlparallel.py
+"""
+
+import os
+import unittest
+
+import nlparallel
+from nlconfig import nl_request, nl_socket, nl_dump, libc
+from nlconfig import RTM_GETLINK, NLM_F_DUMP, NLM_F_REQUEST, RTNLGRP_NONE
+from nlparallel import nl_parser_pool, nl_fields
+
+def links():
+    s = nl_socket(RTNLGRP_NONE)
+    try:
+        return [ (x['index'],x['dev']) for x in nl_dump(s) if x['type'] == 'link' ]
+    finally:
+        libc.close(s)
+
+def crash(x):
+    os._exit(1)
+
+
+class ParserTest(unittest.TestCase):
+
+    def test_dump(self):
+        parser = nl_parser_pool(2,nl_fields("index","dev"))
+        try:
+            req = nl_request(RTM_GETLINK,NLM_F_DUMP | NLM_F_REQUEST).ifinfmsg()
+            self.assertEqual(list(parser.dump(req)),links())
+            # an error reply: no such link
+            req = nl_request(RTM_GETLINK).ifinfmsg(index=0x7fffffff)
+            self.assertRaises(OSError,list,parser.dump(req))
+            # the pool is still usable
+            req = nl_request(RTM_GETLINK,NLM_F_DUMP | NLM_F_REQUEST).ifinfmsg()
+            self.assertEqual(list(parser.dump(req)),links())
+        finally:
+            parser.close()
+
+    def test_crash(self):
+        poll = nlparallel.NL_PARSER_POLL
+        nlparallel.NL_PARSER_POLL = 0.1
+        parser = nl_parser_pool(1,crash)
+        try:
+            req = nl_request(RTM_GETLINK,NLM_F_DUMP | NLM_F_REQUEST).ifinfmsg()
+            self.assertRaises(RuntimeError,list,parser.dump(req))
+        finally:
+            nlparallel.NL_PARSER_POLL = poll
+            parser.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
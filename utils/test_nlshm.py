@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+nlshm tests; the segments are temporary files:
+
+    $ python test_nlshm.py
+"""
+
+import os
+import time
+import tempfile
+import unittest
+
+from nlshm import nl_snapshot_writer, nl_snapshot_reader
+from nlshm import s_seq, SEQ_OFFSET
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        (fd,self.path) = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def crash(self,writer):
+        # the writer dies in the middle of an update
+        writer.map[SEQ_OFFSET:SEQ_OFFSET + 8] = s_seq.pack(writer.seq + 1)
+
+    def test_read(self):
+        writer = nl_snapshot_writer(self.path,4096)
+        reader = nl_snapshot_reader(self.path)
+        self.assertEqual(reader.read(),None)
+        writer.write({ "eth0": { "hwaddr": "" } })
+        self.assertEqual(reader.read(),{ "eth0": { "hwaddr": "" } })
+        # grow the segment
+        writer.write(range(10000))
+        self.assertEqual(reader.read(),range(10000))
+        self.assertEqual(reader.version(),2)
+        reader.close()
+        writer.close()
+
+    def test_crashed_writer(self):
+        writer = nl_snapshot_writer(self.path,4096)
+        writer.write([ 1 ])
+        reader = nl_snapshot_reader(self.path,timeout=0.05)
+        self.assertEqual(reader.read(),[ 1 ])
+        self.crash(writer)
+        writer.close()
+
+        # the last object read, after the timeout
+        started = time.time()
+        self.assertEqual(reader.read(),[ 1 ])
+        self.assertTrue(time.time() - started >= 0.05)
+        # without waiting again
+        started = time.time()
+        self.assertEqual(reader.read(),[ 1 ])
+        self.assertTrue(time.time() - started < 0.05)
+        self.assertEqual(reader.stale,2)
+
+        # nothing read yet
+        fresh = nl_snapshot_reader(self.path,timeout=0.05)
+        self.assertRaises(IOError,fresh.read)
+        fresh.close()
+
+        # the next writer keeps the counter odd until it writes
+        writer = nl_snapshot_writer(self.path,4096)
+        self.assertEqual(reader.read(),[ 1 ])
+        writer.write([ 2 ])
+        self.assertEqual(reader.read(),[ 2 ])
+        reader.close()
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
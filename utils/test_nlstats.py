@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+nlstats tests; the sampler dumps the links of the running system,
+the dump errors are injected:
+
+    $ python test_nlstats.py
+"""
+
+import unittest
+from errno import EOPNOTSUPP, EPERM
+
+from nlconfig import RTM_GETLINK, s_nlmsghdr
+from nlstats import NLStatsSampler
+
+
+class SamplerTest(unittest.TestCase):
+
+    def sampler(self,errors):
+        """
+        A sampler, which dumps fail with the errors, one per dump
+        """
+        sampler = NLStatsSampler()
+        dump = sampler.dump
+        def failing():
+            samples = dump()
+            if errors:
+                sampler.error = -errors.pop(0)
+            return samples
+        sampler.dump = failing
+        return sampler
+
+    def test_fallback(self):
+        sampler = self.sampler([ EOPNOTSUPP ])
+        try:
+            self.assertTrue(sampler.sample() > 0)
+            self.assertTrue(sampler.fallback)
+            self.assertEqual(s_nlmsghdr.unpack_from(sampler.request)[1],RTM_GETLINK)
+            self.assertTrue(sampler.sample() > 0)
+            self.assertEqual(sampler.ring.count,2)
+        finally:
+            sampler.close()
+
+    def test_fallback_once(self):
+        sampler = self.sampler([ EOPNOTSUPP,EOPNOTSUPP ])
+        try:
+            self.assertRaises(OSError,sampler.sample)
+            self.assertTrue(sampler.fallback)
+        finally:
+            sampler.close()
+
+    def test_error(self):
+        sampler = self.sampler([ EPERM ] * 1000)
+        try:
+            try:
+                sampler.sample()
+            except OSError, e:
+                self.assertEqual(e.errno,EPERM)
+            else:
+                self.fail("no OSError")
+            self.assertFalse(sampler.fallback)
+            self.assertEqual(sampler.ring.count,0)
+        finally:
+            sampler.close()
+
+
+if __name__ == "__main__":
+    unittest.main()